@@ -3,3 +3,5 @@ from .weather_station_api import *
 from .thaw_tube_api import *
 from .cable_api import *
 from .air_gs_api import *
+from .four_channel_api import *
+from .job_api import *
@@ -6,20 +6,40 @@ Author: rparker
 Created: 2023-11-01
 """
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Query
 from sqlalchemy.orm import Session
+import datetime as dt
 import pandas as pd
 
 from app import schemas
 from app import crud
-from .api import app, get_db, check_tz_aware
+from .api import app, get_db, check_tz_aware, check_date_range, check_day_range, get_response_format, \
+    tabular_response, check_stream_format, streaming_response, get_batch_installation_uids, check_downsampling, \
+    downsample_rows
 from app.output_data_structures import data_structures as ods
 from app.output_data_structures import output_schemas as ods_schemas
 
+ag_installation_types = ["air", "ground surface"]
+temperature_pressure_frequencies = ["H", *crud.timeseries_frequencies]
 
-@app.post("/air_ground_logger_data/", response_model=schemas.AirGroundTemperatureData)
+
+def temperature_pressure_batch_to_dataframe(batch: schemas.TemperaturePressureDataBatch):
+    if not len(batch.date_times) == len(batch.temperatures) == len(batch.pressures):
+        raise HTTPException(status_code=400, detail=f"date_times, temperatures and pressures must be the same length")
+    for date_time in batch.date_times:
+        if not check_tz_aware(date_time):
+            raise HTTPException(status_code=400, detail=f"{date_time} is not time zone aware.")
+    data = pd.DataFrame({"date_time": pd.to_datetime(batch.date_times, utc=True), "temperature": batch.temperatures,
+                         "pressure": batch.pressures})
+    data["logger_uid"] = batch.logger_uid
+    data["logger_download_uid"] = batch.logger_download_uid
+    data["installation_uid"] = batch.installation_uid
+    return data
+
+
+@app.post("/air_ground_logger_data/", response_model=schemas.AirGroundTemperatureData | None)
 async def add_air_ground_logger_data(air_ground_logger_data: schemas.AirGroundTemperatureDataBase,
-                                     db: Session = Depends(get_db)):
+                                     on_conflict: str = "fail", db: Session = Depends(get_db)):
     if air_ground_logger_data.logger_uid is None:
         raise HTTPException(status_code=400, detail=f"Logger UID is not specified")
     if air_ground_logger_data.logger_download_uid is None:
@@ -34,32 +54,118 @@ async def add_air_ground_logger_data(air_ground_logger_data: schemas.AirGroundTe
         raise HTTPException(status_code=400, detail=f"{air_ground_logger_data.date_time} is not time zone aware.")
     if air_ground_logger_data.temperature is None:
         raise HTTPException(status_code=400, detail=f"Temperature measurement is not specified")
-
-    db_cable_logger_data = \
-        crud.get_ag_logger_data_by_logger_uid_channel_number_and_measurement_date(
-            logger_uid=air_ground_logger_data.logger_uid, channel_number=air_ground_logger_data.channel_number,
-            date_time=air_ground_logger_data.date_time, db=db)
-    if db_cable_logger_data is not None:
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    db_ag_logger_data = crud.add_ag_logger_data(ag_logger_data=air_ground_logger_data, db=db, on_conflict=on_conflict)
+    if db_ag_logger_data is None and on_conflict == "fail":
         raise HTTPException(status_code=400, detail=f"Data already exists for logger UID "
                                                     f"{air_ground_logger_data.logger_uid}, channel number "
                                                     f"{air_ground_logger_data.channel_number} for "
                                                     f"{air_ground_logger_data.date_time}")
-    db_installation_data = crud.get_ag_data_by_installation_and_measurement_date(
-        installation_uid=air_ground_logger_data.installation_uid, date_time=air_ground_logger_data.date_time, db=db)
-    if db_installation_data is not None:
-        raise HTTPException(status_code=400, detail=f"Data already exists for installation UID "
-                                                    f"{air_ground_logger_data.installation_uid} at "
-                                                    f"{air_ground_logger_data.date_time}")
-    return crud.add_ag_logger_data(ag_logger_data=air_ground_logger_data, db=db)
+    return db_ag_logger_data
+
+
+@app.post("/air_ground_logger_data/bulk/", response_model=ods_schemas.BulkUploadSummary)
+async def add_bulk_air_ground_logger_data(bulk_air_ground_logger_data: list[schemas.AirGroundTemperatureDataBase],
+                                          on_conflict: str = "skip", dry_run: bool = False,
+                                          db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    for air_ground_logger_data in bulk_air_ground_logger_data:
+        if not check_tz_aware(air_ground_logger_data.date_time):
+            raise HTTPException(status_code=400, detail=f"{air_ground_logger_data.date_time} is not time zone aware.")
+    data = pd.DataFrame([air_ground_logger_data.dict() for air_ground_logger_data in bulk_air_ground_logger_data],
+                        columns=list(schemas.AirGroundTemperatureDataBase.__fields__))
+    # Every logger download in the batch is checked against its logger and installation in one query
+    downloads = data[["logger_download_uid", "logger_uid", "installation_uid"]].drop_duplicates()
+    db_logger_downloads = crud.get_logger_downloads_by_uids(
+        logger_download_uids=downloads["logger_download_uid"].tolist(), db=db)
+    known_downloads = {tuple(row) for row in db_logger_downloads}
+    for download in downloads.itertuples(index=False):
+        if tuple(download) not in known_downloads:
+            raise HTTPException(status_code=400, detail=f"Logger download UID {download.logger_download_uid} does not "
+                                                        f"exist for logger UID {download.logger_uid} at installation "
+                                                        f"UID {download.installation_uid}")
+    try:
+        return crud.add_bulk_ag_logger_data(data=data, db=db, on_conflict=on_conflict, dry_run=dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/temperature_pressure_data/bulk/", response_model=ods_schemas.BulkUploadSummary)
+async def add_bulk_temperature_pressure_data(batch: schemas.TemperaturePressureDataBatch, on_conflict: str = "skip",
+                                             db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    data = temperature_pressure_batch_to_dataframe(batch)
+    db_logger_downloads = crud.get_logger_downloads_by_uids(logger_download_uids=[batch.logger_download_uid], db=db)
+    if (batch.logger_download_uid, batch.logger_uid, batch.installation_uid) not in \
+            [tuple(row) for row in db_logger_downloads]:
+        raise HTTPException(status_code=400, detail=f"Logger download UID {batch.logger_download_uid} does not "
+                                                    f"exist for logger UID {batch.logger_uid} at installation UID "
+                                                    f"{batch.installation_uid}")
+    try:
+        return crud.add_bulk_temperature_pressure_data(data=data, db=db, on_conflict=on_conflict)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/temperature_pressure_data/installation_uid{installation_uid}/all/",
+         response_model=list[ods_schemas.TemperaturePressureDataOutput])
+async def get_temperature_pressure_data_at_installation(installation_uid: int, start: dt.datetime | None = None,
+                                                        end: dt.datetime | None = None,
+                                                        response_format: str = Depends(get_response_format),
+                                                        db: Session = Depends(get_db)):
+    check_date_range(start=start, end=end)
+    db_temperature_pressure_data = crud.get_temperature_pressure_data_at_installation(
+        db=db, installation_uid=installation_uid, start=start, end=end)
+    if not db_temperature_pressure_data:
+        raise HTTPException(status_code=400, detail=f"No temperature/pressure data associated with installation UID "
+                                                    f"{installation_uid}")
+    if response_format != "json":
+        return tabular_response(pd.DataFrame(db_temperature_pressure_data), response_format)
+    return db_temperature_pressure_data
+
+
+@app.get("/temperature_pressure_data/installation_uid/timeseries_mean/",
+         response_model=list[ods_schemas.TemperaturePressureAverageData])
+async def get_temperature_pressure_timeseries_mean_at_installation(installation_uid: int, frequency: str = "D",
+                                                                   start: dt.datetime | None = None,
+                                                                   end: dt.datetime | None = None,
+                                                                   response_format: str = Depends(get_response_format),
+                                                                   db: Session = Depends(get_db)):
+    if frequency not in temperature_pressure_frequencies:
+        raise HTTPException(status_code=400, detail=f"Frequency {frequency} not in {temperature_pressure_frequencies}")
+    check_date_range(start=start, end=end)
+    db_means = crud.get_temperature_pressure_timeseries_mean_at_installation(
+        db=db, installation_uid=installation_uid, frequency=frequency, start=start, end=end)
+    if not db_means:
+        raise HTTPException(status_code=400, detail=f"No temperature/pressure data associated with installation UID "
+                                                    f"{installation_uid}")
+    if response_format != "json":
+        return tabular_response(pd.DataFrame(db_means), response_format)
+    return db_means
 
 
 @app.get("/air_ground_logger_data/installation_uid{installation_uid}/all/",
          response_model=list[ods_schemas.AGLoggerDataOutput])
-async def get_air_ground_logger_data_at_installation(installation_uid: int, db: Session = Depends(get_db)):
+async def get_air_ground_logger_data_at_installation(installation_uid: int, max_points: int | None = None,
+                                                     downsampling: str = "lttb",
+                                                     response_format: str = Depends(get_response_format),
+                                                     db: Session = Depends(get_db)):
+    check_downsampling(max_points=max_points, method=downsampling)
     db_ag_logger_data = crud.get_ag_logger_data_at_installation(db=db, installation_uid=installation_uid)
     if not db_ag_logger_data:
         raise HTTPException(status_code=400, detail=f"No air/ground logger data associated with installation UID"
                                                     f"{installation_uid}")
+    if max_points is not None:
+        db_ag_logger_data = downsample_rows(db_ag_logger_data, x_column="date_time", y_column="temperature",
+                                            max_points=max_points, method=downsampling, by="channel_number")
+    if response_format != "json":
+        return tabular_response(pd.DataFrame(db_ag_logger_data)
+                                .rename(columns={"logger_serial_number": "logger_sn",
+                                                 "channel_number": "sensor_number"})
+                                [list(ods_schemas.AGLoggerDataOutput.__fields__)], response_format)
     ag_logger_data = [ods.AGLoggerDataOutput(date_time=row.date_time,
                                              temperature=row.temperature,
                                              logger_sn=row.logger_serial_number,
@@ -68,55 +174,104 @@ async def get_air_ground_logger_data_at_installation(installation_uid: int, db:
     return ag_logger_data
 
 
+@app.get("/air_ground_logger_data/installation_uid{installation_uid}/all/stream/")
+async def stream_air_ground_logger_data_at_installation(installation_uid: int, format: str = "ndjson",
+                                                        db: Session = Depends(get_db)):
+    check_stream_format(format)
+    db_ag_logger_data = crud.get_ag_logger_data_at_installation(db=db, installation_uid=installation_uid, stream=True)
+    return streaming_response(db_ag_logger_data, columns=list(ods_schemas.AGLoggerDataOutput.__fields__),
+                              stream_format=format,
+                              renames={"logger_serial_number": "logger_sn", "channel_number": "sensor_number"})
+
+
 @app.get("/air_ground_logger_data/installation_uid/timeseries_mean/",
          response_model=list[ods_schemas.SingleSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
 async def get_air_ground_timeseries_mean_at_installation(installation_uid: int, frequency: str = "D",
+                                                         start: dt.datetime | None = None,
+                                                         end: dt.datetime | None = None,
+                                                         response_format: str = Depends(get_response_format),
                                                          db: Session = Depends(get_db)):
-    if frequency not in ["D", "W", "M", "Q", "Y"]:
-        raise HTTPException(status_code=400, detail=f"Frequency {frequency} not in [D, W, M, Q, Y]")
-    db_ag_logger_data = crud.get_ag_logger_data_at_installation(db=db, installation_uid=installation_uid)
-    if not db_ag_logger_data:
+    if frequency not in crud.timeseries_frequencies:
+        raise HTTPException(status_code=400, detail=f"Frequency {frequency} not in {crud.timeseries_frequencies}")
+    check_date_range(start=start, end=end)
+    db_means = crud.get_ag_timeseries_mean_at_installation(db=db, installation_uid=installation_uid,
+                                                           frequency=frequency, start=start, end=end)
+    if not db_means:
         raise HTTPException(status_code=400, detail=f"No air/ground logger data associated with installation UID "
                                                     f"{installation_uid}")
-    ag_logger_data = [ods.AGLoggerDataOutput(date_time=row.date_time,
-                                             temperature=row.temperature,
-                                             logger_sn=row.logger_serial_number,
-                                             sensor_number=row.channel_number).__dict__
-                      for row in db_ag_logger_data]
-    ag_logger_data = pd.DataFrame(ag_logger_data)
-    ag_logger_data["date_time"] = pd.to_datetime(ag_logger_data["date_time"], utc=True)
-    daily_means = ag_logger_data[["date_time", "temperature"]]\
-        .groupby(pd.Grouper(key="date_time", freq=frequency, origin="epoch")).mean()
-    daily_means.reset_index(inplace=True)
-    daily_means.rename(columns={"date_time": "date"}, inplace=True)
-    return daily_means.to_dict("records")
+    if response_format != "json":
+        return tabular_response(pd.DataFrame(db_means), response_format)
+    return db_means
+
+
+@app.get("/air_ground_logger_data/timeseries_mean/batch/",
+         response_model=dict[int, list[ods_schemas.SingleSensorTimeSeriesAverageData]])
+async def get_air_ground_timeseries_means_at_installations(installation_uids: list[int] | None = Query(None),
+                                                           site_uid: int | None = None, region: str | None = None,
+                                                           frequency: str = "D", start: dt.datetime | None = None,
+                                                           end: dt.datetime | None = None,
+                                                           db: Session = Depends(get_db)):
+    if frequency not in crud.timeseries_frequencies:
+        raise HTTPException(status_code=400, detail=f"Frequency {frequency} not in {crud.timeseries_frequencies}")
+    check_date_range(start=start, end=end)
+    installation_uids = get_batch_installation_uids(installation_uids=installation_uids, site_uid=site_uid,
+                                                    region=region, installation_types=ag_installation_types, db=db)
+    means = {installation_uid: [] for installation_uid in installation_uids}
+    for row in crud.get_ag_timeseries_means_at_installations(installation_uids=installation_uids, frequency=frequency,
+                                                             start=start, end=end, db=db):
+        means[row.installation_uid].append({"date": row.date, "temperature": row.temperature})
+    return means
+
+
+@app.post("/air_ground_logger_data/daily_rollup/refresh/", response_model=ods_schemas.DailyRollupRefreshSummary)
+async def refresh_air_ground_logger_daily_data(installation_uid: int | None = None, start: dt.datetime | None = None,
+                                               end: dt.datetime | None = None, db: Session = Depends(get_db)):
+    check_day_range(start=start, end=end)
+    rows_written = crud.refresh_ag_logger_daily_data(db=db, installation_uid=installation_uid, start=start, end=end)
+    db.commit()
+    return {"installation_uid": installation_uid, "start": start, "end": end, "rows_written": rows_written}
 
 
 @app.get("/air_ground_logger_data/installation_uid{installation_uid}/daily_mean/",
          response_model=list[ods_schemas.SingleSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
-async def get_air_ground_daily_mean_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    return await get_air_ground_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="D", db=db)
+async def get_air_ground_daily_mean_at_installation(installation_uid: int,
+                                                    response_format: str = Depends(get_response_format),
+                                                    db: Session = Depends(get_db)):
+    return await get_air_ground_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="D",
+                                                                response_format=response_format, db=db)
 
 
 @app.get("/air_ground_logger_data/installation_uid{installation_uid}/weekly_mean/",
          response_model=list[ods_schemas.SingleSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
-async def get_air_ground_weekly_mean_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    return await get_air_ground_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="W", db=db)
+async def get_air_ground_weekly_mean_at_installation(installation_uid: int,
+                                                     response_format: str = Depends(get_response_format),
+                                                     db: Session = Depends(get_db)):
+    return await get_air_ground_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="W",
+                                                                response_format=response_format, db=db)
 
 
 @app.get("/air_ground_logger_data/installation_uid{installation_uid}monthly_mean/",
          response_model=list[ods_schemas.SingleSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
-async def get_air_ground_monthly_mean_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    return await get_air_ground_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="M", db=db)
+async def get_air_ground_monthly_mean_at_installation(installation_uid: int,
+                                                      response_format: str = Depends(get_response_format),
+                                                      db: Session = Depends(get_db)):
+    return await get_air_ground_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="M",
+                                                                response_format=response_format, db=db)
 
 
 @app.get("/air_ground_logger_data/installation_uid{installation_uid}/quarterly_mean/",
          response_model=list[ods_schemas.SingleSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
-async def get_air_ground_quarterly_mean_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    return await get_air_ground_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="Q", db=db)
+async def get_air_ground_quarterly_mean_at_installation(installation_uid: int,
+                                                        response_format: str = Depends(get_response_format),
+                                                        db: Session = Depends(get_db)):
+    return await get_air_ground_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="Q",
+                                                                response_format=response_format, db=db)
 
 
 @app.get("/air_ground_logger_data/installation_uid{installation_uid}/yearly_mean/",
          response_model=list[ods_schemas.SingleSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
-async def get_air_ground_yearly_mean_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    return await get_air_ground_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="Y", db=db)
+async def get_air_ground_yearly_mean_at_installation(installation_uid: int,
+                                                     response_format: str = Depends(get_response_format),
+                                                     db: Session = Depends(get_db)):
+    return await get_air_ground_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="Y",
+                                                                response_format=response_format, db=db)
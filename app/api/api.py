@@ -1,8 +1,52 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import SQLAlchemyError
+import datetime as dt
+import pandas as pd
+import itertools
+import json
+import base64
+import io
+import logging
 from app.database import SessionLocal
+from app import crud
+from app import models
+from app import downsampling
 
 app = FastAPI()
 
+response_formats = {"json": "application/json", "csv": "text/csv", "arrow": "application/vnd.apache.arrow.stream",
+                    "parquet": "application/vnd.apache.parquet"}
+stream_formats = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# (model, name) of the columns, constraints and indexes added to existing tables, applied at startup when missing
+schema_changes = [(models.CableLoggerData, "cable_logger_data_sensor_date_time_key"),
+                  (models.AirGroundTemperatureData, "air_ground_temperature_data_logger_channel_date_time_key"),
+                  (models.WeatherStationHourlyData, "weather_station_hourly_data_station_date_time_key"),
+                  (models.WeatherStationDailyData, "weather_station_daily_data_station_date_time_key"),
+                  (models.FourChannelData, "four_channel_data_sensor_date_time_key"),
+                  (models.TemperaturePressureData, "temperature_pressure_data_logger_date_time_key"),
+                  (models.TemperaturePressureData, "temperature_pressure_data_installation_date_time_idx"),
+                  (models.CableManualRead, "resistance"),
+                  (models.CableLoggerData, "cable_logger_data_installation_date_time_sensor_idx"),
+                  (models.AirGroundTemperatureData, "air_ground_temperature_data_installation_date_time_idx"),
+                  (models.IngestionJob, "worker_id"),
+                  (models.IngestionJob, "heartbeat_at")]
+
+
+@app.on_event("startup")
+def apply_schema_changes():
+    db = SessionLocal()
+    try:
+        for name in crud.add_missing_schema_objects(db=db, schema_objects=schema_changes):
+            logging.getLogger("uvicorn.error").warning(f"{name} was not added because the table holds duplicate keys; "
+                                                       f"see the readme for removing them")
+    except SQLAlchemyError as error:
+        db.rollback()
+        logging.getLogger("uvicorn.error").warning(f"Could not apply the schema changes: {error}")
+    finally:
+        db.close()
+
 
 def get_db():
     db = SessionLocal()
@@ -17,3 +61,126 @@ def check_tz_aware(date_time):
         return True
     else:
         return False
+
+
+def check_date_range(start, end):
+    for date_time in [start, end]:
+        if date_time is not None and not check_tz_aware(date_time):
+            raise HTTPException(status_code=400, detail=f"{date_time} is not time zone aware.")
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=400, detail=f"Start {start} must be before end {end}")
+
+
+def check_day_range(start, end):
+    check_date_range(start=start, end=end)
+    for date_time in [start, end]:
+        if date_time is not None and date_time.astimezone(dt.timezone.utc).time() != dt.time(0):
+            raise HTTPException(status_code=400, detail=f"{date_time} is not midnight UTC")
+
+
+def get_response_format(format: str | None = None, accept: str | None = Header(None)):
+    """Format of a tabular response, from the format query parameter or else the first recognised Accept media type"""
+    if format is not None:
+        if format not in response_formats:
+            raise HTTPException(status_code=400, detail=f"Format {format} not in {list(response_formats)}")
+        return format
+    for media_type in (accept or "").split(","):
+        media_type = media_type.split(";")[0].strip()
+        for response_format, format_media_type in response_formats.items():
+            if media_type == format_media_type:
+                return response_format
+    return "json"
+
+
+def convert_timestamps_to_utc(data: pd.DataFrame):
+    for column in data.columns:
+        if pd.api.types.is_datetime64_any_dtype(data[column]) or pd.api.types.infer_dtype(data[column]) == "datetime":
+            data[column] = pd.to_datetime(data[column], utc=True)
+    return data
+
+
+def tabular_response(data: pd.DataFrame, response_format: str):
+    """Serializes a DataFrame column-wise as CSV, Arrow IPC stream or Parquet without going through pydantic"""
+    data = convert_timestamps_to_utc(data)
+    if response_format == "csv":
+        content = data.to_csv(index=False)
+    elif response_format == "arrow":
+        import pyarrow as pa
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        content = sink.getvalue().to_pybytes()
+    else:
+        buffer = io.BytesIO()
+        data.to_parquet(buffer, index=False)
+        content = buffer.getvalue()
+    return Response(content=content, media_type=response_formats[response_format])
+
+
+def get_batch_installation_uids(installation_uids: list[int] | None, site_uid: int | None, region: str | None,
+                                installation_types: list[str], db):
+    """Installations of a batch request: those listed, or else every installation of the types at a site or region"""
+    if installation_uids:
+        return installation_uids
+    if site_uid is None and region is None:
+        raise HTTPException(status_code=400, detail=f"Installation UIDs, a site UID or a region must be specified")
+    installation_uids = crud.get_installation_uids(installation_types=installation_types, site_uid=site_uid,
+                                                   region=region, db=db)
+    if not installation_uids:
+        raise HTTPException(status_code=400, detail=f"No {' or '.join(installation_types)} installations found")
+    return installation_uids
+
+
+def check_downsampling(max_points: int | None, method: str):
+    if max_points is not None and max_points < 3:
+        raise HTTPException(status_code=400, detail=f"Max points must be at least 3")
+    if method not in downsampling.downsampling_methods:
+        raise HTTPException(status_code=400, detail=f"Downsampling method {method} not in "
+                                                    f"{downsampling.downsampling_methods}")
+
+
+def downsample_rows(rows, x_column: str, y_column: str, max_points: int, method: str, by: str | None = None):
+    """Downsamples query rows per series, returning named tuples with the same fields"""
+    data = downsampling.downsample(pd.DataFrame(rows), x_column=x_column, y_column=y_column, max_points=max_points,
+                                   method=method, by=by)
+    return list(data.astype(object).where(data.notna(), None).itertuples(index=False))
+
+
+def check_stream_format(stream_format: str):
+    if stream_format not in stream_formats:
+        raise HTTPException(status_code=400, detail=f"Format {stream_format} not in {list(stream_formats)}")
+
+
+def streaming_response(rows, columns: list[str], stream_format: str, renames: dict | None = None,
+                       batch_size: int = 5000):
+    """Streams query rows as NDJSON or CSV a batch at a time, so memory stays flat however many rows there are.
+    Query columns are renamed with renames and then reduced to columns."""
+    def generate():
+        rows_iter = iter(rows)
+        if stream_format == "csv":
+            yield pd.DataFrame(columns=columns).to_csv(index=False)
+        while batch := list(itertools.islice(rows_iter, batch_size)):
+            fields = [(renames or {}).get(field, field) for field in batch[0]._fields]
+            if stream_format == "csv":
+                data = pd.DataFrame.from_records(batch, columns=fields)
+                yield convert_timestamps_to_utc(data[columns].copy()).to_csv(index=False, header=False)
+            else:
+                records = (dict(zip(fields, row)) for row in batch)
+                yield "".join(json.dumps({column: record[column] for column in columns},
+                                         default=dt.datetime.isoformat) + "\n" for record in records)
+
+    return StreamingResponse(generate(), media_type=stream_formats[stream_format])
+
+
+def encode_cursor(date_time: dt.datetime, uid: int):
+    """Opaque keyset cursor pointing just past the (date_time, uid) of the last row returned"""
+    return base64.urlsafe_b64encode(f"{date_time.isoformat()}|{uid}".encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        date_time, uid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return dt.datetime.fromisoformat(date_time), int(uid)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor}")
@@ -6,16 +6,18 @@ Author: rparker
 Created: 2023-07-12
 """
 
-from fastapi import Depends, HTTPException, Response
+from fastapi import Depends, HTTPException, Response, UploadFile, Form, Query
 from sqlalchemy.orm import Session
 import datetime as dt
 import numpy as np
 import pandas as pd
-import asyncio
 
 from app import schemas
 from app import crud
-from .api import app, get_db, check_tz_aware
+from app import file_parsers
+from .api import app, get_db, check_tz_aware, check_date_range, check_day_range, encode_cursor, decode_cursor, \
+    get_response_format, tabular_response, check_stream_format, streaming_response, get_batch_installation_uids, \
+    check_downsampling, downsample_rows
 from app.output_data_structures import data_structures as ods
 from app.output_data_structures import output_schemas as ods_schemas
 
@@ -23,6 +25,31 @@ connector_types = ["seacon", "impulse", "16 pin", "bendix", "24 pin", "unknown"]
 sensor_types = ["YSI44033", "YSI44032", "fenwall", "aitkins", "unknown"]
 
 
+def log_resistance_temperature(resistance, a, b, c):
+    return b / (np.log(resistance) - a) - c
+
+
+def steinhart_hart_temperature(resistance, a, b, c):
+    return 1 / (a + b * np.log(resistance) + c * np.log(resistance) ** 3) - 273.16
+
+
+# Formula and coefficients for converting thermistor resistance (ohms) to temperature (°C) by sensor type
+resistance_conversions = {"aitkins": (log_resistance_temperature, (-6.53968443, 5164.37176, 318)),
+                          "fenwal": (steinhart_hart_temperature, (0.001382913, 0.000240465, 0.0000000891485)),
+                          "fenwall": (steinhart_hart_temperature, (0.001382913, 0.000240465, 0.0000000891485)),
+                          "YSI44033": (log_resistance_temperature, (-7.46641674, 5248.119347, 320.6)),
+                          "YSI44032": (log_resistance_temperature, (-5.53848562, 5844.563551, 343.8))}
+
+
+def resistance_to_temperature(resistance: np.ndarray, sensor_type: np.ndarray):
+    temperature = np.full(len(resistance), np.nan)
+    for conversion_type, (formula, coefficients) in resistance_conversions.items():
+        mask = sensor_type == conversion_type
+        if mask.any():
+            temperature[mask] = formula(resistance[mask].astype(float), *coefficients)
+    return temperature
+
+
 @app.get("/cables/installation_uid{installation_uid}", response_model=schemas.Cable)
 async def get_cable_by_installation_uid(installation_uid: int, db: Session = Depends(get_db)):
     db_cable = crud.get_cable_by_installation_uid(db=db, installation_uid=installation_uid)
@@ -144,34 +171,53 @@ async def add_cable_manual_read(cable_manual_read: schemas.CableManualReadInput,
 
     if cable_manual_read.resistance is not None:
         db_cable_sensor = crud.get_cable_sensor_by_uid(cable_sensor_uid=cable_manual_read.cable_sensor_uid, db=db)
-        if db_cable_sensor.sensor_type == "aitkins":
-            a = -6.53968443
-            b = 5164.37176
-            c = 318
-            cable_manual_read.temperature = b / (np.log(cable_manual_read.resistance) - a) - c
-        elif db_cable_sensor.sensor_type == "fenwal":
-            a = 0.001382913
-            b = 0.000240465
-            c = 0.0000000891485
-            cable_manual_read.temperature = 1 / (a + (b * np.log(cable_manual_read.resistance))
-                                                 + (c * (np.log(cable_manual_read.resistance)) ^ 3)) - 273.16
-        elif db_cable_sensor.sensor_type == "YSI44033":
-            a = -7.46641674
-            b = 5248.119347
-            c = 320.6
-            cable_manual_read.temperature = b / (np.log(cable_manual_read.resistance) - a) - c
-        elif db_cable_sensor.sensor_type == "YSI44032":
-            a = -5.53848562
-            b = 5844.563551
-            c = 343.8
-            cable_manual_read.temperature = b / (np.log(cable_manual_read.resistance) - a) - c
-        else:
+        if db_cable_sensor.sensor_type not in resistance_conversions:
             raise HTTPException(status_code=400,
                                 detail=f"Sensor type {db_cable_sensor.sensor_type} does not have a formula for "
                                        f"converting resistance to temperature")
+        cable_manual_read.temperature = float(resistance_to_temperature(
+            np.array([cable_manual_read.resistance]), np.array([db_cable_sensor.sensor_type]))[0])
     return crud.add_cable_manual_read(cable_manual_read=cable_manual_read, db=db)
 
 
+@app.post("/cable_manual_reads/bulk/", response_model=list[schemas.CableManualRead])
+async def add_bulk_cable_manual_reads(cable_manual_reads: list[schemas.CableManualReadInput],
+                                      db: Session = Depends(get_db)):
+    data = pd.DataFrame([cable_manual_read.dict() for cable_manual_read in cable_manual_reads],
+                        columns=list(schemas.CableManualReadInput.__fields__))
+    if data.empty:
+        return []
+    if (data["resistance"].isna() == data["temperature"].isna()).any():
+        raise HTTPException(status_code=400, detail=f"Either temperature or resistance must be specified but not both")
+    if (data["resistance"] <= 0).any():
+        raise HTTPException(status_code=400, detail=f"Resistance must be positive")
+    if data.duplicated(subset=["cable_sensor_uid", "installation_visit_uid"]).any():
+        raise HTTPException(status_code=400, detail=f"Cable sensor UIDs must only appear once per installation visit")
+    db_cable_manual_reads = crud.get_cable_manual_reads_by_sensor_and_installation_visit_uids(
+        sensor_uids=data["cable_sensor_uid"].unique().tolist(),
+        installation_visit_uids=data["installation_visit_uid"].unique().tolist(), db=db)
+    existing = data.merge(pd.DataFrame(db_cable_manual_reads, columns=["cable_sensor_uid", "installation_visit_uid"]))
+    if not existing.empty:
+        raise HTTPException(status_code=400, detail=f"Cable manual reads from installation visit UIDs "
+                                                    f"{existing['installation_visit_uid'].unique().tolist()} already "
+                                                    f"exist for cable sensor UIDs "
+                                                    f"{existing['cable_sensor_uid'].unique().tolist()}")
+    db_sensor_types = crud.get_cable_sensor_types_by_uids(cable_sensor_uids=data["cable_sensor_uid"].unique().tolist(),
+                                                         db=db)
+    data["sensor_type"] = data["cable_sensor_uid"].map(dict(db_sensor_types))
+    missing = data.loc[data["sensor_type"].isna(), "cable_sensor_uid"]
+    if not missing.empty:
+        raise HTTPException(status_code=400, detail=f"Cable sensor UIDs {missing.unique().tolist()} do not exist")
+    to_convert = data["resistance"].notna()
+    unconvertible = data.loc[to_convert & ~data["sensor_type"].isin(list(resistance_conversions)), "sensor_type"]
+    if not unconvertible.empty:
+        raise HTTPException(status_code=400, detail=f"Sensor types {unconvertible.unique().tolist()} do not have a "
+                                                    f"formula for converting resistance to temperature")
+    data.loc[to_convert, "temperature"] = resistance_to_temperature(data.loc[to_convert, "resistance"].to_numpy(),
+                                                                    data.loc[to_convert, "sensor_type"].to_numpy())
+    return crud.add_bulk_cable_manual_reads(cable_manual_reads=data.drop(columns="sensor_type"), db=db)
+
+
 @app.get("/cable_manual_reads/sensor_and_installation_visit_uids/", response_model=schemas.CableManualRead)
 async def get_cable_manual_read_by_sensor_and_installation_visit_uids(sensor_uid: int, installation_visit_uid: int,
                                                                       db: Session = Depends(get_db)):
@@ -216,7 +262,8 @@ async def get_all_cable_sensor_records_for_cable_uid_and_sensor_number(cable_uid
 
 @app.post("/cable_logger_data/", response_model=schemas.CableLoggerData | None)
 async def add_cable_logger_data(cable_logger_data: schemas.CableLoggerDataBase, db: Session = Depends(get_db),
-                                silence_duplicate_warnings: bool = False, return_data: bool = True):
+                                silence_duplicate_warnings: bool = False, return_data: bool = True,
+                                on_conflict: str = "fail"):
     if cable_logger_data.logger_uid is None:
         raise HTTPException(status_code=400, detail=f"Logger UID is not specified")
     if cable_logger_data.logger_download_uid is None:
@@ -231,55 +278,105 @@ async def add_cable_logger_data(cable_logger_data: schemas.CableLoggerDataBase,
         raise HTTPException(status_code=400, detail=f"{cable_logger_data.date_time} is not time zone aware.")
     if cable_logger_data.temperature is None:
         raise HTTPException(status_code=400, detail=f"Temperature measurement is not specified")
-    db_cable_logger_data = \
-        crud.get_cable_logger_data_by_logger_uid_sensor_uid_and_measurement_date(
-            logger_uid=cable_logger_data.logger_uid, sensor_uid=cable_logger_data.cable_sensor_uid,
-            date_time=cable_logger_data.date_time, db=db)
-    if db_cable_logger_data is not None:
-        if silence_duplicate_warnings:
-            return
-        else:
-            raise HTTPException(status_code=400, detail=f"Data already exists for logger UID "
-                                                        f"{cable_logger_data.logger_uid} and cable sensor UID "
-                                                        f"{cable_logger_data.cable_sensor_uid} for "
-                                                        f"{cable_logger_data.date_time}")
-
-    db_cable_data = crud.get_cable_data_by_sensor_uid_and_measurement_date(
-        sensor_uid=cable_logger_data.cable_sensor_uid, date_time=cable_logger_data.date_time, db=db)
-    if db_cable_data is not None:
-        if silence_duplicate_warnings:
-            return
-        else:
-            raise HTTPException(status_code=400, detail=f"Data already exists for installation UID "
-                                                        f"{cable_logger_data.installation_uid} at "
-                                                        f"{cable_logger_data.date_time}")
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    if silence_duplicate_warnings:
+        on_conflict = "skip"
+    db_cable_logger_data = crud.add_cable_logger_data(cable_logger_data=cable_logger_data, db=db,
+                                                      on_conflict=on_conflict)
+    if db_cable_logger_data is None and on_conflict == "fail":
+        raise HTTPException(status_code=400, detail=f"Data already exists for cable sensor UID "
+                                                    f"{cable_logger_data.cable_sensor_uid} at "
+                                                    f"{cable_logger_data.date_time}")
     if return_data:
-        return crud.add_cable_logger_data(cable_logger_data=cable_logger_data, db=db)
+        return db_cable_logger_data
     else:
         return None
 
 
-@app.post("/cable_logger_data/bulk/", response_model=list[schemas.CableLoggerData | None] | None)
+@app.post("/cable_logger_data/bulk/", response_model=ods_schemas.BulkUploadSummary)
 async def add_bulk_cable_logger_data(bulk_cable_logger_data: list[schemas.CableLoggerDataBase],
-                                     db: Session = Depends(get_db), return_data: bool = True):
-    output = await asyncio.gather(*[add_cable_logger_data(cable_logger_data=cable_logger_data,
-                                                          db=db,
-                                                          silence_duplicate_warnings=True,
-                                                          return_data=return_data)
-                                    for cable_logger_data in bulk_cable_logger_data])
-    if return_data:
-        return output
-    else:
-        return None
+                                     on_conflict: str = "skip", dry_run: bool = False,
+                                     db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    for cable_logger_data in bulk_cable_logger_data:
+        if not check_tz_aware(cable_logger_data.date_time):
+            raise HTTPException(status_code=400, detail=f"{cable_logger_data.date_time} is not time zone aware.")
+    data = pd.DataFrame([cable_logger_data.dict() for cable_logger_data in bulk_cable_logger_data],
+                        columns=list(schemas.CableLoggerDataBase.__fields__))
+    try:
+        return crud.add_bulk_cable_logger_data(data=data, db=db, on_conflict=on_conflict, dry_run=dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/cable_logger_data/file/", response_model=ods_schemas.BulkUploadSummary)
+async def add_cable_logger_data_file(logger_file: UploadFile, logger_download_uid: int = Form(),
+                                     installation_uid: int = Form(), file_format: str = Form(),
+                                     utc_offset: float = Form(0.0), on_conflict: str = Form("skip"),
+                                     dry_run: bool = Form(False), db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    if file_format not in file_parsers.logger_file_formats:
+        raise HTTPException(status_code=400, detail=f"File format must be in {file_parsers.logger_file_formats}")
+    db_logger_download = crud.get_logger_download_by_uid(logger_download_uid=logger_download_uid, db=db)
+    if db_logger_download is None:
+        raise HTTPException(status_code=400, detail=f"Logger download UID {logger_download_uid} does not exist")
+    db_logger_deployment = crud.get_logger_deployment_by_uid(uid=db_logger_download.logger_deployment_uid, db=db)
+    if db_logger_deployment.installation_uid != installation_uid:
+        raise HTTPException(status_code=400, detail=f"Logger download UID {logger_download_uid} is not from "
+                                                    f"installation UID {installation_uid}")
+    db_cable = crud.get_cable_by_installation_uid(installation_uid=installation_uid, db=db)
+    if db_cable is None:
+        raise HTTPException(status_code=400, detail=f"No cable associated with installation UID {installation_uid}")
+    chunks = file_parsers.read_logger_file(logger_file.file, file_format=file_format, utc_offset=utc_offset)
+    try:
+        return crud.add_cable_logger_file_data(chunks=chunks, logger_uid=db_logger_download.logger_uid,
+                                               logger_download_uid=logger_download_uid,
+                                               installation_uid=installation_uid, cable_uid=db_cable.cable_uid,
+                                               db=db, on_conflict=on_conflict, dry_run=dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/cable_logger_data/installation_uid{installation_uid}/all/",
          response_model=list[ods_schemas.CableLoggerDataOutput])
-async def get_cable_logger_data_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    db_cable_logger_data = crud.get_cable_logger_data_at_installation(db=db, installation_uid=installation_uid)
+async def get_cable_logger_data_at_installation(response: Response, installation_uid: int,
+                                                start: dt.datetime | None = None, end: dt.datetime | None = None,
+                                                sensor_numbers: list[int] | None = Query(None),
+                                                limit: int | None = None, cursor: str | None = None,
+                                                max_points: int | None = None, downsampling: str = "lttb",
+                                                response_format: str = Depends(get_response_format),
+                                                db: Session = Depends(get_db)):
+    check_date_range(start=start, end=end)
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail=f"Limit must be positive")
+    check_downsampling(max_points=max_points, method=downsampling)
+    if max_points is not None and (limit is not None or cursor is not None):
+        raise HTTPException(status_code=400, detail=f"Max points cannot be combined with limit or cursor")
+    after = decode_cursor(cursor) if cursor is not None else None
+    db_cable_logger_data = crud.get_cable_logger_data_at_installation(db=db, installation_uid=installation_uid,
+                                                                      start=start, end=end,
+                                                                      sensor_numbers=sensor_numbers, after=after,
+                                                                      limit=limit)
     if not db_cable_logger_data:
         raise HTTPException(status_code=400, detail=f"No cable logger data associated with installation UID"
                                                     f"{installation_uid}")
+    if max_points is not None:
+        db_cable_logger_data = downsample_rows(db_cable_logger_data, x_column="date_time", y_column="temperature",
+                                               max_points=max_points, method=downsampling, by="number_in_chain")
+    if response_format != "json":
+        response = tabular_response(pd.DataFrame(db_cable_logger_data)
+                                    .rename(columns={"logger_serial_number": "logger_sn",
+                                                     "number_in_chain": "sensor_number", "depth": "sensor_depth"})
+                                    [list(ods_schemas.CableLoggerDataOutput.__fields__)], response_format)
+    if limit is not None and len(db_cable_logger_data) == limit:
+        # A full page may have more rows behind it; the client passes this back as the cursor for the next page
+        last = db_cable_logger_data[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.date_time, last.cable_sensor_uid)
+    if response_format != "json":
+        return response
     cable_logger_data = [ods.CableLoggerDataOutput(date_time=row.date_time,
                                                    temperature=row.temperature,
                                                    logger_sn=row.logger_serial_number,
@@ -289,68 +386,147 @@ async def get_cable_logger_data_at_installation(installation_uid: int, db: Sessi
     return cable_logger_data
 
 
+@app.get("/cable_logger_data/installation_uid{installation_uid}/all/stream/")
+async def stream_cable_logger_data_at_installation(installation_uid: int, start: dt.datetime | None = None,
+                                                   end: dt.datetime | None = None,
+                                                   sensor_numbers: list[int] | None = Query(None),
+                                                   format: str = "ndjson", db: Session = Depends(get_db)):
+    check_date_range(start=start, end=end)
+    check_stream_format(format)
+    db_cable_logger_data = crud.get_cable_logger_data_at_installation(db=db, installation_uid=installation_uid,
+                                                                      start=start, end=end,
+                                                                      sensor_numbers=sensor_numbers, stream=True)
+    return streaming_response(db_cable_logger_data, columns=list(ods_schemas.CableLoggerDataOutput.__fields__),
+                              stream_format=format,
+                              renames={"logger_serial_number": "logger_sn", "number_in_chain": "sensor_number",
+                                       "depth": "sensor_depth"})
+
+
 @app.get("/cable_logger_data/installation_uid/timeseries_mean/",
          response_model=list[ods_schemas.MultiSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
 async def get_cable_timeseries_mean_at_installation(installation_uid: int, frequency: str = "D",
+                                                    start: dt.datetime | None = None, end: dt.datetime | None = None,
+                                                    response_format: str = Depends(get_response_format),
                                                     db: Session = Depends(get_db)):
-    if frequency not in ["D", "W", "M", "Q", "Y"]:
-        raise HTTPException(status_code=400, detail=f"Frequency {frequency} not in [D, W, M, Q, Y]")
-    db_cable_logger_data = crud.get_cable_logger_data_at_installation(db=db, installation_uid=installation_uid)
-    if not db_cable_logger_data:
+    if frequency not in crud.timeseries_frequencies:
+        raise HTTPException(status_code=400, detail=f"Frequency {frequency} not in {crud.timeseries_frequencies}")
+    check_date_range(start=start, end=end)
+    db_means = crud.get_cable_timeseries_mean_at_installation(db=db, installation_uid=installation_uid,
+                                                              frequency=frequency, start=start, end=end)
+    if not db_means:
         raise HTTPException(status_code=400, detail=f"No cable logger data associated with installation UID"
                                                     f"{installation_uid}")
-    cable_logger_data = [ods.CableLoggerDataOutput(date_time=row.date_time,
-                                                   temperature=row.temperature,
-                                                   logger_sn=row.logger_serial_number,
-                                                   sensor_number=row.number_in_chain,
-                                                   sensor_depth=row.depth).__dict__
-                         for row in db_cable_logger_data]
-    cable_logger_data = pd.DataFrame(cable_logger_data)
-    cable_logger_data["date_time"] = pd.to_datetime(cable_logger_data["date_time"], utc=True)
-    daily_means = None
-    for sensor in cable_logger_data["sensor_number"].unique():
-        subset = cable_logger_data.loc[cable_logger_data["sensor_number"] == sensor]
-        subset_daily_means = subset[["date_time", "temperature", "sensor_depth"]] \
-            .groupby(pd.Grouper(key="date_time", freq=frequency, origin="epoch")).mean()
-        subset_daily_means.rename(columns={"temperature": f"sensor_{sensor}_temp",
-                                           "sensor_depth": f"sensor_{sensor}_depth"}, inplace=True)
-        if daily_means is None:
-            daily_means = subset_daily_means
-        else:
-            daily_means = daily_means.join(subset_daily_means, how="outer")
-    daily_means.reset_index(inplace=True)
-    daily_means.rename(columns={"date_time": "date"}, inplace=True)
-    return daily_means.to_dict("records")
+    if response_format != "json":
+        return tabular_response(pd.DataFrame(crud.pivot_sensor_means(db_means)), response_format)
+    return crud.pivot_sensor_means(db_means)
+
+
+@app.get("/cable_logger_data/timeseries_mean/batch/",
+         response_model=dict[int, list[ods_schemas.MultiSensorTimeSeriesAverageData]],
+         response_model_exclude_none=True)
+async def get_cable_timeseries_means_at_installations(installation_uids: list[int] | None = Query(None),
+                                                      site_uid: int | None = None, region: str | None = None,
+                                                      frequency: str = "D", start: dt.datetime | None = None,
+                                                      end: dt.datetime | None = None, db: Session = Depends(get_db)):
+    if frequency not in crud.timeseries_frequencies:
+        raise HTTPException(status_code=400, detail=f"Frequency {frequency} not in {crud.timeseries_frequencies}")
+    check_date_range(start=start, end=end)
+    installation_uids = get_batch_installation_uids(installation_uids=installation_uids, site_uid=site_uid,
+                                                    region=region, installation_types=["cable"], db=db)
+    db_means = pd.DataFrame(crud.get_cable_timeseries_means_at_installations(
+        installation_uids=installation_uids, frequency=frequency, start=start, end=end, db=db),
+        columns=["installation_uid", "date", "sensor_number", "temperature", "depth"])
+    means = {installation_uid: [] for installation_uid in installation_uids}
+    for installation_uid, installation_means in db_means.groupby("installation_uid"):
+        means[installation_uid] = crud.pivot_sensor_means(installation_means.drop(columns="installation_uid")
+                                                          .itertuples(index=False, name=None))
+    return means
+
+
+@app.get("/cable_logger_data/installation_uid/timeseries_matrix/", response_model=ods_schemas.SensorTimeSeriesMatrix)
+async def get_cable_timeseries_matrix_at_installation(installation_uid: int, frequency: str = "D",
+                                                      start: dt.datetime | None = None, end: dt.datetime | None = None,
+                                                      db: Session = Depends(get_db)):
+    if frequency not in crud.timeseries_frequencies:
+        raise HTTPException(status_code=400, detail=f"Frequency {frequency} not in {crud.timeseries_frequencies}")
+    check_date_range(start=start, end=end)
+    db_means = crud.get_cable_timeseries_mean_at_installation(db=db, installation_uid=installation_uid,
+                                                              frequency=frequency, start=start, end=end)
+    if not db_means:
+        raise HTTPException(status_code=400, detail=f"No cable logger data associated with installation UID"
+                                                    f"{installation_uid}")
+    return crud.pivot_sensor_matrix(db_means)
+
+
+@app.post("/cable_logger_data/daily_rollup/refresh/", response_model=ods_schemas.DailyRollupRefreshSummary)
+async def refresh_cable_logger_daily_data(installation_uid: int | None = None, start: dt.datetime | None = None,
+                                          end: dt.datetime | None = None, db: Session = Depends(get_db)):
+    check_day_range(start=start, end=end)
+    rows_written = crud.refresh_cable_logger_daily_data(db=db, installation_uid=installation_uid, start=start, end=end)
+    annual_rows_written = crud.refresh_cable_logger_annual_data(db=db, installation_uid=installation_uid,
+                                                                years=crud.rollup_years(start, end))
+    db.commit()
+    return {"installation_uid": installation_uid, "start": start, "end": end, "rows_written": rows_written,
+            "annual_rows_written": annual_rows_written}
+
+
+@app.get("/cable_logger_data/installation_uid/trumpet_curve/", response_model=list[ods_schemas.TrumpetCurveData])
+async def get_cable_trumpet_curve_at_installation(installation_uid: int, years: list[int] | None = Query(None),
+                                                  response_format: str = Depends(get_response_format),
+                                                  db: Session = Depends(get_db)):
+    db_trumpet_curve = crud.get_cable_annual_statistics_at_installation(db=db, installation_uid=installation_uid,
+                                                                        years=years)
+    if not db_trumpet_curve:
+        raise HTTPException(status_code=400, detail=f"No annual cable logger statistics associated with installation "
+                                                    f"UID {installation_uid}")
+    if response_format != "json":
+        return tabular_response(pd.DataFrame(db_trumpet_curve), response_format)
+    return db_trumpet_curve
 
 
 @app.get("/cable_logger_data/installation_uid{installation_uid}/daily_mean/",
          response_model=list[ods_schemas.MultiSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
-async def get_cable_daily_mean_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    return await get_cable_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="D", db=db)
+async def get_cable_daily_mean_at_installation(installation_uid: int,
+                                               response_format: str = Depends(get_response_format),
+                                               db: Session = Depends(get_db)):
+    return await get_cable_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="D",
+                                                           response_format=response_format, db=db)
 
 
 @app.get("/cable_logger_data/installation_uid{installation_uid}/weekly_mean/",
          response_model=list[ods_schemas.MultiSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
-async def get_cable_weekly_mean_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    return await get_cable_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="W", db=db)
+async def get_cable_weekly_mean_at_installation(installation_uid: int,
+                                                response_format: str = Depends(get_response_format),
+                                                db: Session = Depends(get_db)):
+    return await get_cable_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="W",
+                                                           response_format=response_format, db=db)
 
 
 @app.get("/cable_logger_data/installation_uid{installation_uid}monthly_mean/",
          response_model=list[ods_schemas.MultiSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
-async def get_cable_monthly_mean_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    return await get_cable_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="M", db=db)
+async def get_cable_monthly_mean_at_installation(installation_uid: int,
+                                                 response_format: str = Depends(get_response_format),
+                                                 db: Session = Depends(get_db)):
+    return await get_cable_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="M",
+                                                           response_format=response_format, db=db)
 
 
 @app.get("/cable_logger_data/installation_uid{installation_uid}/quarterly_mean/",
          response_model=list[ods_schemas.MultiSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
-async def get_cable_quarterly_mean_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    return await get_cable_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="Q", db=db)
+async def get_cable_quarterly_mean_at_installation(installation_uid: int,
+                                                   response_format: str = Depends(get_response_format),
+                                                   db: Session = Depends(get_db)):
+    return await get_cable_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="Q",
+                                                           response_format=response_format, db=db)
 
 
 @app.get("/cable_logger_data/installation_uid{installation_uid}/yearly_mean/",
          response_model=list[ods_schemas.MultiSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
-async def get_cable_yearly_mean_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    return await get_cable_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="Y", db=db)
+async def get_cable_yearly_mean_at_installation(installation_uid: int,
+                                                response_format: str = Depends(get_response_format),
+                                                db: Session = Depends(get_db)):
+    return await get_cable_timeseries_mean_at_installation(installation_uid=installation_uid, frequency="Y",
+                                                           response_format=response_format, db=db)
 
 
 @app.get("/cable_manual_reads/installation_uid{installation_uid}/all/",
@@ -372,6 +548,17 @@ async def get_cable_manual_read_data_at_installation(installation_uid: int, db:
     return cable_manual_reads
 
 
+@app.get("/cable_manual_reads/installation_uid{installation_uid}/all/stream/")
+async def stream_cable_manual_read_data_at_installation(installation_uid: int, format: str = "ndjson",
+                                                        db: Session = Depends(get_db)):
+    check_stream_format(format)
+    db_cable_manual_reads = crud.get_cable_manual_read_data_at_installation(db=db, installation_uid=installation_uid,
+                                                                            stream=True)
+    return streaming_response(db_cable_manual_reads, columns=list(ods_schemas.CableManualReadOutput.__fields__),
+                              stream_format=format,
+                              renames={"visit_date": "date_time", "number_in_chain": "sensor_number"})
+
+
 @app.get("/stick_ups/installation_visit_uid{installation_visit_uid}/", response_model=schemas.StickUp)
 async def get_stick_up_by_installation_visit_uid(installation_visit_uid: int, db: Session = Depends(get_db)):
     db_stick_up = crud.get_stick_up_by_installation_visit_uid(installation_visit_uid=installation_visit_uid, db=db)
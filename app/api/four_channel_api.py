@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+from fastapi import Depends, HTTPException
+from sqlalchemy.orm import Session
+import datetime as dt
+import pandas as pd
+
+from app import schemas
+from app import crud
+from .api import app, get_db, check_tz_aware, check_date_range, get_response_format, tabular_response
+from app.output_data_structures import output_schemas as ods_schemas
+
+channel_numbers = [1, 2, 3, 4]
+
+
+@app.post("/four_channel_sensors/", response_model=schemas.FourChannelSensor)
+async def add_four_channel_sensor(four_channel_sensor: schemas.FourChannelSensorBase, db: Session = Depends(get_db)):
+    if four_channel_sensor.channel_number not in channel_numbers:
+        raise HTTPException(status_code=400, detail=f"Channel number must be in {channel_numbers}")
+    if not check_tz_aware(four_channel_sensor.date_installed):
+        raise HTTPException(status_code=400, detail=f"{four_channel_sensor.date_installed} is not time zone aware.")
+    db_installation = crud.get_installation_by_uid(db=db, installation_uid=four_channel_sensor.installation_uid)
+    if db_installation is None or db_installation.installation_type != "four channel":
+        raise HTTPException(status_code=400, detail=f"Installation UID {four_channel_sensor.installation_uid} is not a "
+                                                    f"four channel installation")
+    db_four_channel_sensor = crud.get_four_channel_sensor_by_installation_channel_and_date_installed(
+        db=db, installation_uid=four_channel_sensor.installation_uid,
+        channel_number=four_channel_sensor.channel_number, date_installed=four_channel_sensor.date_installed)
+    if db_four_channel_sensor is not None:
+        raise HTTPException(status_code=400, detail=f"Four channel sensor already exists for channel "
+                                                    f"{four_channel_sensor.channel_number} at installation UID "
+                                                    f"{four_channel_sensor.installation_uid} installed on "
+                                                    f"{four_channel_sensor.date_installed}")
+    return crud.add_four_channel_sensor(db=db, four_channel_sensor=four_channel_sensor)
+
+
+@app.get("/four_channel_sensors/four_channel_sensor_uid{four_channel_sensor_uid}/",
+         response_model=schemas.FourChannelSensor)
+async def get_four_channel_sensor_by_uid(four_channel_sensor_uid: int, db: Session = Depends(get_db)):
+    db_four_channel_sensor = crud.get_four_channel_sensor_by_uid(db=db, four_channel_sensor_uid=four_channel_sensor_uid)
+    if db_four_channel_sensor is None:
+        raise HTTPException(status_code=400, detail=f"Four channel sensor UID {four_channel_sensor_uid} does not exist")
+    return db_four_channel_sensor
+
+
+@app.get("/four_channel_sensors/installation_uid{installation_uid}/", response_model=list[schemas.FourChannelSensor])
+async def get_all_four_channel_sensors_at_installation(installation_uid: int, db: Session = Depends(get_db)):
+    db_four_channel_sensors = crud.get_all_four_channel_sensors_at_installation(db=db,
+                                                                                installation_uid=installation_uid)
+    if not db_four_channel_sensors:
+        raise HTTPException(status_code=400, detail=f"No four channel sensor records exist for installation UID "
+                                                    f"{installation_uid}.")
+    return db_four_channel_sensors
+
+
+@app.post("/four_channel_data/bulk/", response_model=ods_schemas.BulkUploadSummary)
+async def add_bulk_four_channel_data(bulk_four_channel_data: list[schemas.FourChannelDataInput],
+                                     on_conflict: str = "skip", db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    for four_channel_data in bulk_four_channel_data:
+        if not check_tz_aware(four_channel_data.date_time):
+            raise HTTPException(status_code=400, detail=f"{four_channel_data.date_time} is not time zone aware.")
+        if four_channel_data.channel_number not in channel_numbers:
+            raise HTTPException(status_code=400, detail=f"Channel number must be in {channel_numbers}")
+    data = pd.DataFrame([four_channel_data.dict() for four_channel_data in bulk_four_channel_data],
+                        columns=list(schemas.FourChannelDataInput.__fields__))
+    try:
+        return crud.add_bulk_four_channel_data(data=data, db=db, on_conflict=on_conflict)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/four_channel_data/installation_uid{installation_uid}/all/",
+         response_model=list[ods_schemas.FourChannelDataOutput])
+async def get_four_channel_data_at_installation(installation_uid: int, start: dt.datetime | None = None,
+                                                end: dt.datetime | None = None,
+                                                response_format: str = Depends(get_response_format),
+                                                db: Session = Depends(get_db)):
+    check_date_range(start=start, end=end)
+    db_four_channel_data = crud.get_four_channel_data_at_installation(db=db, installation_uid=installation_uid,
+                                                                      start=start, end=end)
+    if not db_four_channel_data:
+        raise HTTPException(status_code=400, detail=f"No four channel data associated with installation UID "
+                                                    f"{installation_uid}")
+    if response_format != "json":
+        return tabular_response(pd.DataFrame(db_four_channel_data), response_format)
+    return db_four_channel_data
+
+
+@app.get("/four_channel_data/installation_uid/timeseries_mean/",
+         response_model=list[ods_schemas.MultiSensorTimeSeriesAverageData], response_model_exclude_defaults=True)
+async def get_four_channel_timeseries_mean_at_installation(installation_uid: int, frequency: str = "D",
+                                                           start: dt.datetime | None = None,
+                                                           end: dt.datetime | None = None,
+                                                           response_format: str = Depends(get_response_format),
+                                                           db: Session = Depends(get_db)):
+    if frequency not in crud.timeseries_frequencies:
+        raise HTTPException(status_code=400, detail=f"Frequency {frequency} not in {crud.timeseries_frequencies}")
+    check_date_range(start=start, end=end)
+    db_means = crud.get_four_channel_timeseries_mean_at_installation(db=db, installation_uid=installation_uid,
+                                                                     frequency=frequency, start=start, end=end)
+    if not db_means:
+        raise HTTPException(status_code=400, detail=f"No four channel data associated with installation UID "
+                                                    f"{installation_uid}")
+    if response_format != "json":
+        return tabular_response(pd.DataFrame(crud.pivot_sensor_means(db_means)), response_format)
+    return crud.pivot_sensor_means(db_means)
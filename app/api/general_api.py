@@ -6,7 +6,7 @@ Author: rparker
 Created: 2023-06-20
 """
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import Union
 import numpy as np
@@ -15,7 +15,7 @@ import pandas as pd
 
 from app import schemas
 from app import crud
-from .api import app, get_db, check_tz_aware
+from .api import app, get_db, check_tz_aware, check_stream_format, streaming_response
 from app.output_data_structures import output_schemas as ods_schemas
 
 logger_type_list = ["RBR - seacon", "RBR - impulse", "RBR - bendix", "HOBO U22", "HOBO U23", "Vemco",
@@ -373,20 +373,27 @@ async def get_logger_history_at_installation(installation_uid: int, db: Session
     logger_history = pd.DataFrame(crud.get_logger_history_at_installation(db=db, installation_uid=installation_uid),
                                   columns=["installation_visit_uid", "date_time", "recorded_by", "activity", "notes",
                                            "logger_in_uid", "logger_in", "logger_in_type", "logger_out_uid",
-                                           "logger_out", "logger_out_type"])
+                                           "logger_out", "logger_out_type", "stick_up", "download_quality",
+                                           "download_count", "al_probe_count", "al_probe_mean_depth",
+                                           "al_probe_max_depth", "al_probes_maxed"])
     logger_history.drop(columns=["logger_in_uid", "logger_out_uid"], inplace=True)
-    installation_type = crud.get_installation_by_uid(installation_uid=installation_uid, db=db).installation_type
-    if installation_type == "cable":
-        for i, r in logger_history.iterrows():
-            db_stick_up = crud.get_stick_up_by_installation_visit_uid(
-                installation_visit_uid=r["installation_visit_uid"], db=db)
-            if db_stick_up is not None:
-                logger_history.loc[i, "stick_up"] = db_stick_up.measurement
-    logger_history.sort_values(by="date_time", inplace=True)
     logger_history.replace(np.nan, None, inplace=True)
     return logger_history.to_dict("records")
 
 
+@app.get("/installation_visits/logger_history/installation_uid{installation_uid}/stream/")
+async def stream_logger_history_at_installation(installation_uid: int, format: str = "ndjson",
+                                                db: Session = Depends(get_db)):
+    check_stream_format(format)
+    logger_history = crud.get_logger_history_at_installation(db=db, installation_uid=installation_uid, stream=True)
+    return streaming_response(logger_history, columns=list(ods_schemas.InstallationLoggerHistory.__fields__),
+                              stream_format=format,
+                              renames={"visit_date": "date_time", "field_party": "recorded_by",
+                                       "record_of_activities": "activity", "logger_deployed": "logger_in",
+                                       "logger_deployed_type": "logger_in_type", "logger_extracted": "logger_out",
+                                       "logger_extracted_type": "logger_out_type"})
+
+
 @app.get("/al_probe_measurements/al_probe_history/installation_uid{installation_uid}",
          response_model=list[ods_schemas.ALProbeHistory])
 async def get_al_probe_history_at_installation(installation_uid: int, db: Session = Depends(get_db)):
@@ -407,42 +414,40 @@ async def get_info_for_survey(installation_type, db: Session = Depends(get_db)):
     if installation_type not in ["cable", "air", "ground surface", "thaw tube", "weather station", "four channel"]:
         raise HTTPException(status_code=400, detail=f"{installation_type} is not in ['cable', 'air', 'ground surface', "
                                                     f"'thaw tube', 'weather station', 'four channel']")
-    data = pd.DataFrame([obj.__dict__ for obj in
-                         crud.get_all_installations_of_type(installation_type=installation_type, db=db)])
-    for i, r in data.iterrows():
-        installation_visit = crud.get_most_recent_installation_visit_at_installation(
-            installation_uid=r["installation_uid"], db=db)
-        if installation_visit is not None:
-            if r["notes"] is not None and installation_visit.notes is not None:
-                data.loc[i, "notes"] = "\n\n".join([r["notes"], installation_visit.notes])
-            elif installation_visit.notes is not None:
-                data.loc[i, "notes"] = installation_visit.notes
-        data["label"] = data["installation_code"] + " - " + data["installation_name"]
-
-        if installation_type not in ["thaw tube", "weather station"]:
-            deployed_logger = crud.get_logger_currently_deployed(installation_uid=r["installation_uid"], db=db)
-            if deployed_logger is not None:
-                data.loc[i, "logger_sn"] = deployed_logger.logger_serial_number
-                if installation_type != "cable":
-                    data.loc[i, "logger_type"] = deployed_logger.logger_type
+    data = pd.DataFrame([(installation.installation_uid, installation.installation_code,
+                          installation.installation_name, installation.notes)
+                         for installation in crud.get_all_installations_of_type(installation_type=installation_type,
+                                                                                 db=db)],
+                        columns=["installation_uid", "installation_code", "installation_name", "notes"])
+    visits = pd.DataFrame(crud.get_most_recent_installation_visits_of_type(installation_type=installation_type, db=db),
+                          columns=["installation_uid", "visit_notes"])
+    loggers = pd.DataFrame(crud.get_loggers_currently_deployed_of_type(installation_type=installation_type, db=db),
+                           columns=["installation_uid", "logger_sn", "logger_type"])
+    data = data.merge(visits, on="installation_uid", how="left").merge(loggers, on="installation_uid", how="left")
+    # Installation notes are followed by the notes of the latest visit
+    data["notes"] = (data["notes"] + "\n\n" + data["visit_notes"]).fillna(data["notes"]).fillna(data["visit_notes"])
+    data["label"] = data["installation_code"] + " - " + data["installation_name"]
 
-        if installation_type == "cable":
-            cable = crud.get_cable_by_installation_uid(installation_uid=r["installation_uid"], db=db)
-            if cable is not None:
-                data.loc[i, "connector"] = cable.connector_type
-                mappings = pd.DataFrame(crud.get_cable_sensor_mappings_of_cable(cable_uid=cable.cable_uid, db=db),
-                                        columns=["cable_sensor_uid", "mapping_1", "mapping_2", "number_in_chain"])
-                if not mappings.empty:
-                    if len(mappings.index) <= len(wire_mapping_cols):
-                        for i2, r2 in mappings.iterrows():
-                            data.loc[i, f"sensor{r2['number_in_chain']}"] = f"{r2['mapping_1']} - {r2['mapping_2']}"
-                    else:
-                        print(mappings.to_markdown())
-                        raise HTTPException(status_code=400,
-                                            detail=f"complex case where sensors have moved and more than 8 mappings")
-            else:
-                data.loc[i, "connector"] = "unknown"
-    data.replace(np.nan, None, inplace=True)
+    if installation_type == "cable":
+        # Installations with more than one cable are described by their first cable
+        mappings = pd.DataFrame(crud.get_cable_sensor_mappings_of_all_cables(db=db),
+                                columns=["installation_uid", "cable_uid", "connector", "number_in_chain", "mapping_1",
+                                         "mapping_2"])
+        cables = mappings[["installation_uid", "cable_uid", "connector"]].drop_duplicates("installation_uid")
+        mappings = mappings.loc[mappings["cable_uid"].isin(cables["cable_uid"]) & mappings["mapping_1"].notna()]
+        if mappings["cable_uid"].value_counts().gt(len(wire_mapping_cols)).any():
+            raise HTTPException(status_code=400,
+                                detail=f"complex case where sensors have moved and more than 8 mappings")
+        # A sensor number mapped more than once keeps its latest mapping
+        mappings = mappings.assign(sensor="sensor" + mappings["number_in_chain"].astype(int).astype(str),
+                                   mapping=mappings["mapping_1"] + " - " + mappings["mapping_2"].astype(str)) \
+            .drop_duplicates(["installation_uid", "sensor"], keep="last") \
+            .pivot(index="installation_uid", columns="sensor", values="mapping") \
+            .reindex(columns=wire_mapping_cols)
+        data = data.merge(cables[["installation_uid", "connector"]], on="installation_uid", how="left") \
+            .merge(mappings, left_on="installation_uid", right_index=True, how="left")
+        data["connector"] = data["connector"].fillna("unknown")
+    data = data.astype(object).where(data.notna(), None)
     if installation_type not in ["thaw tube", "weather station", "four channel"]:
         if installation_type == "cable":
             return data[["installation_code", "installation_name", "label", "notes", "logger_sn", "connector",
@@ -485,6 +490,17 @@ async def get_dump(data: schemas.DumpInputSchema, db: Session = Depends(get_db))
         return full_dump.to_dict("records")
 
 
+@app.get("/installation_visits/dump/stream/")
+async def stream_dump(year: int | None = None, region: list[str] | None = Query(None), format: str = "ndjson",
+                      db: Session = Depends(get_db)):
+    if year is None and region is None:
+        raise HTTPException(status_code=400, detail=f"Year or region must be specified")
+    check_stream_format(format)
+    dump = crud.get_installation_visit_dump(db=db, year=year, regions=region, stream=True)
+    return streaming_response(dump, columns=list(ods_schemas.Dump.__fields__), stream_format=format,
+                              renames={"field_party": "recorded_by"})
+
+
 @app.get("/logger_deployments/readable/", response_model=list[ods_schemas.ReadableLoggerDeployments])
 async def get_readable_logger_deployments(logger_deployment_uid_list: list[int], db: Session = Depends(get_db)):
     data = pd.DataFrame(
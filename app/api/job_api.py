@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+from fastapi import Depends, HTTPException, UploadFile, Form
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+import datetime as dt
+import pandas as pd
+import tempfile
+import shutil
+import os
+import logging
+
+from app import schemas
+from app import crud
+from app import file_parsers
+from app import job_queue
+from app import models
+from app.database import SessionLocal
+from .api import app, get_db, check_tz_aware
+from .air_gs_api import temperature_pressure_batch_to_dataframe, ag_installation_types
+from app.output_data_structures import output_schemas as ods_schemas
+
+job_statuses = ["queued", "running", "succeeded", "failed", "cancelled"]
+
+
+@app.on_event("startup")
+def fail_interrupted_ingestion_jobs():
+    db = SessionLocal()
+    try:
+        crud.create_missing_tables(db=db, tables=[models.IngestionJob])
+        crud.fail_interrupted_ingestion_jobs(db=db, lease=job_queue.ingestion_job_lease)
+        job_queue.start_lease_renewal()
+    except SQLAlchemyError as error:
+        # Without the ingestion_job table only the job endpoints are unavailable, the rest of the API still starts
+        db.rollback()
+        logging.getLogger("uvicorn.error").warning(f"Could not check the ingestion_job table: {error}")
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+def backfill_incomplete_rollups():
+    # Missing rollup tables are created, and the installations whose rollups are not complete (new tables, tables
+    # created by hand, an interrupted backfill) are backfilled in the background. Until an installation is marked
+    # complete its means come from the raw data.
+    db = SessionLocal()
+    try:
+        crud.create_missing_tables(db=db, tables=[models.DailyRollupStatus])
+        # A recreated table starts empty, so no installation is complete in it whatever the status table says
+        created = crud.create_missing_tables(db=db, tables=[models.CableLoggerDataDaily, models.CableLoggerDataAnnual,
+                                                            models.AirGroundTemperatureDataDaily])
+        if models.CableLoggerDataDaily in created or models.CableLoggerDataAnnual in created:
+            crud.clear_daily_rollup_status(db=db, rollup=models.CableLoggerDataDaily)
+        if models.AirGroundTemperatureDataDaily in created:
+            crud.clear_daily_rollup_status(db=db, rollup=models.AirGroundTemperatureDataDaily)
+        if crud.get_active_ingestion_jobs(db=db, job_type="rollup_backfill"):
+            return
+        for rollup, installation_types, description, refreshes in [
+                (models.CableLoggerDataDaily, ["cable"], "cable logger daily and annual rollups",
+                 [crud.refresh_cable_logger_daily_data, crud.refresh_cable_logger_annual_data]),
+                (models.AirGroundTemperatureDataDaily, ag_installation_types, "air/ground logger daily rollups",
+                 [crud.refresh_ag_logger_daily_data])]:
+            installation_uids = crud.get_installation_uids(installation_types=installation_types, db=db)
+            complete = crud.get_complete_daily_rollup_installation_uids(db=db, rollup=rollup,
+                                                                        installation_uids=installation_uids)
+            incomplete = [uid for uid in installation_uids if uid not in complete]
+            if incomplete:
+                submit_ingestion_job(job_type="rollup_backfill",
+                                     description=f"{description} of {len(incomplete)} installations",
+                                     handler=job_queue.rollup_backfill_handler(installation_uids=incomplete,
+                                                                               refreshes=refreshes),
+                                     db=db)
+    except SQLAlchemyError as error:
+        db.rollback()
+        logging.getLogger("uvicorn.error").warning(f"Could not create and backfill the rollup tables: {error}")
+    finally:
+        db.close()
+
+
+def ingestion_job_status(db_ingestion_job):
+    status = schemas.IngestionJob.from_orm(db_ingestion_job).dict()
+    status["rows_per_second"] = None
+    if db_ingestion_job.started_at is not None:
+        end = db_ingestion_job.finished_at or dt.datetime.now(dt.timezone.utc)
+        elapsed = (end - db_ingestion_job.started_at).total_seconds()
+        if elapsed > 0:
+            status["rows_per_second"] = db_ingestion_job.rows_received / elapsed
+    return status
+
+
+def submit_ingestion_job(job_type: str, description: str, handler, db: Session, cleanup=None):
+    try:
+        db_ingestion_job = crud.add_ingestion_job(
+            db=db, ingestion_job=schemas.IngestionJobBase(job_type=job_type, description=description),
+            worker_id=job_queue.worker_id)
+    except Exception:
+        if cleanup is not None:
+            cleanup()
+        raise
+    job_queue.submit_ingestion_job(ingestion_job_uid=db_ingestion_job.ingestion_job_uid, handler=handler,
+                                   cleanup=cleanup)
+    return ingestion_job_status(db_ingestion_job)
+
+
+def check_bulk_date_times(bulk_data: list):
+    for row in bulk_data:
+        if not check_tz_aware(row.date_time):
+            raise HTTPException(status_code=400, detail=f"{row.date_time} is not time zone aware.")
+
+
+@app.post("/ingestion_jobs/cable_logger_data/", response_model=ods_schemas.IngestionJobStatus)
+async def submit_cable_logger_data_job(bulk_cable_logger_data: list[schemas.CableLoggerDataBase],
+                                       on_conflict: str = "skip", db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    check_bulk_date_times(bulk_cable_logger_data)
+    data = pd.DataFrame([row.dict() for row in bulk_cable_logger_data],
+                        columns=list(schemas.CableLoggerDataBase.__fields__))
+    return submit_ingestion_job(job_type="cable_logger_data", description=f"{len(data.index)} cable logger rows",
+                                handler=job_queue.dataframe_ingestion_handler(
+                                    data, crud.add_bulk_cable_logger_data, on_conflict),
+                                db=db)
+
+
+@app.post("/ingestion_jobs/cable_logger_data/file/", response_model=ods_schemas.IngestionJobStatus)
+async def submit_cable_logger_data_file_job(logger_file: UploadFile, logger_download_uid: int = Form(),
+                                            installation_uid: int = Form(), file_format: str = Form(),
+                                            utc_offset: float = Form(0.0), on_conflict: str = Form("skip"),
+                                            db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    if file_format not in file_parsers.logger_file_formats:
+        raise HTTPException(status_code=400, detail=f"File format must be in {file_parsers.logger_file_formats}")
+    db_logger_download = crud.get_logger_download_by_uid(logger_download_uid=logger_download_uid, db=db)
+    if db_logger_download is None:
+        raise HTTPException(status_code=400, detail=f"Logger download UID {logger_download_uid} does not exist")
+    db_logger_deployment = crud.get_logger_deployment_by_uid(uid=db_logger_download.logger_deployment_uid, db=db)
+    if db_logger_deployment.installation_uid != installation_uid:
+        raise HTTPException(status_code=400, detail=f"Logger download UID {logger_download_uid} is not from "
+                                                    f"installation UID {installation_uid}")
+    db_cable = crud.get_cable_by_installation_uid(installation_uid=installation_uid, db=db)
+    if db_cable is None:
+        raise HTTPException(status_code=400, detail=f"No cable associated with installation UID {installation_uid}")
+    # The upload is gone once the request returns, so the worker reads from a copy on disk
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".ingest") as spool:
+        shutil.copyfileobj(logger_file.file, spool)
+    logger_uid = db_logger_download.logger_uid
+    cable_uid = db_cable.cable_uid
+
+    def handler(db, report):
+        with open(spool.name, "rb") as file:
+            size = os.path.getsize(spool.name) or 1
+            return crud.add_cable_logger_file_data(
+                chunks=file_parsers.read_logger_file(file, file_format=file_format, utc_offset=utc_offset),
+                logger_uid=logger_uid, logger_download_uid=logger_download_uid,
+                installation_uid=installation_uid, cable_uid=cable_uid, db=db, on_conflict=on_conflict,
+                progress=lambda summary: report(summary, 100 * file.tell() / size))
+
+    return submit_ingestion_job(job_type="cable_logger_data_file",
+                                description=f"{logger_file.filename} for logger download UID {logger_download_uid}",
+                                handler=handler, db=db, cleanup=lambda: os.remove(spool.name))
+
+
+@app.post("/ingestion_jobs/air_ground_logger_data/", response_model=ods_schemas.IngestionJobStatus)
+async def submit_air_ground_logger_data_job(bulk_air_ground_logger_data: list[schemas.AirGroundTemperatureDataBase],
+                                            on_conflict: str = "skip", db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    check_bulk_date_times(bulk_air_ground_logger_data)
+    data = pd.DataFrame([row.dict() for row in bulk_air_ground_logger_data],
+                        columns=list(schemas.AirGroundTemperatureDataBase.__fields__))
+    return submit_ingestion_job(job_type="air_ground_logger_data",
+                                description=f"{len(data.index)} air/ground logger rows",
+                                handler=job_queue.dataframe_ingestion_handler(
+                                    data, crud.add_bulk_ag_logger_data, on_conflict),
+                                db=db)
+
+
+@app.post("/ingestion_jobs/four_channel_data/", response_model=ods_schemas.IngestionJobStatus)
+async def submit_four_channel_data_job(bulk_four_channel_data: list[schemas.FourChannelDataInput],
+                                       on_conflict: str = "skip", db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    check_bulk_date_times(bulk_four_channel_data)
+    data = pd.DataFrame([row.dict() for row in bulk_four_channel_data],
+                        columns=list(schemas.FourChannelDataInput.__fields__))
+    return submit_ingestion_job(job_type="four_channel_data", description=f"{len(data.index)} four channel rows",
+                                handler=job_queue.dataframe_ingestion_handler(
+                                    data, crud.add_bulk_four_channel_data, on_conflict),
+                                db=db)
+
+
+@app.post("/ingestion_jobs/temperature_pressure_data/", response_model=ods_schemas.IngestionJobStatus)
+async def submit_temperature_pressure_data_job(batch: schemas.TemperaturePressureDataBatch, on_conflict: str = "skip",
+                                               db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    data = temperature_pressure_batch_to_dataframe(batch)
+    return submit_ingestion_job(job_type="temperature_pressure_data",
+                                description=f"{len(data.index)} temperature/pressure rows for logger download UID "
+                                            f"{batch.logger_download_uid}",
+                                handler=job_queue.dataframe_ingestion_handler(
+                                    data, crud.add_bulk_temperature_pressure_data, on_conflict),
+                                db=db)
+
+
+@app.post("/ingestion_jobs/weather_station_hourly_data/", response_model=ods_schemas.IngestionJobStatus)
+async def submit_weather_station_hourly_data_job(bulk_hourly_data: list[schemas.WeatherStationHourlyDataBase],
+                                                 on_conflict: str = "skip", db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    check_bulk_date_times(bulk_hourly_data)
+    data = pd.DataFrame([row.dict() for row in bulk_hourly_data],
+                        columns=list(schemas.WeatherStationHourlyDataBase.__fields__))
+    return submit_ingestion_job(job_type="weather_station_hourly_data",
+                                description=f"{len(data.index)} weather station hourly rows",
+                                handler=job_queue.dataframe_ingestion_handler(
+                                    data, crud.add_bulk_hourly_weather_station_data, on_conflict),
+                                db=db)
+
+
+@app.post("/ingestion_jobs/weather_station_daily_data/", response_model=ods_schemas.IngestionJobStatus)
+async def submit_weather_station_daily_data_job(bulk_daily_data: list[schemas.WeatherStationDailyDataBase],
+                                                on_conflict: str = "skip", db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    check_bulk_date_times(bulk_daily_data)
+    data = pd.DataFrame([row.dict() for row in bulk_daily_data],
+                        columns=list(schemas.WeatherStationDailyDataBase.__fields__))
+    return submit_ingestion_job(job_type="weather_station_daily_data",
+                                description=f"{len(data.index)} weather station daily rows",
+                                handler=job_queue.dataframe_ingestion_handler(
+                                    data, crud.add_bulk_daily_weather_station_data, on_conflict),
+                                db=db)
+
+
+@app.get("/ingestion_jobs/ingestion_job_uid{ingestion_job_uid}", response_model=ods_schemas.IngestionJobStatus)
+async def get_ingestion_job_by_uid(ingestion_job_uid: int, db: Session = Depends(get_db)):
+    db_ingestion_job = crud.get_ingestion_job_by_uid(db=db, ingestion_job_uid=ingestion_job_uid)
+    if db_ingestion_job is None:
+        raise HTTPException(status_code=400, detail=f"Ingestion job UID {ingestion_job_uid} does not exist")
+    return ingestion_job_status(db_ingestion_job)
+
+
+@app.get("/ingestion_jobs/", response_model=list[ods_schemas.IngestionJobStatus])
+async def get_ingestion_jobs(status: str | None = None, limit: int = 100, db: Session = Depends(get_db)):
+    if status is not None and status not in job_statuses:
+        raise HTTPException(status_code=400, detail=f"Status must be in {job_statuses}")
+    return [ingestion_job_status(db_ingestion_job)
+            for db_ingestion_job in crud.get_ingestion_jobs(db=db, status=status, limit=limit)]
+
+
+@app.post("/ingestion_jobs/cancel/", response_model=ods_schemas.IngestionJobStatus)
+async def cancel_ingestion_job(ingestion_job_uid: int, db: Session = Depends(get_db)):
+    db_ingestion_job = crud.get_ingestion_job_by_uid(db=db, ingestion_job_uid=ingestion_job_uid)
+    if db_ingestion_job is None:
+        raise HTTPException(status_code=400, detail=f"Ingestion job UID {ingestion_job_uid} does not exist")
+    if db_ingestion_job.status not in ["queued", "running"]:
+        raise HTTPException(status_code=400, detail=f"Ingestion job UID {ingestion_job_uid} is already "
+                                                    f"{db_ingestion_job.status}")
+    return ingestion_job_status(crud.request_ingestion_job_cancel(db=db, ingestion_job_uid=ingestion_job_uid))
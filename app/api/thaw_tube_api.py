@@ -7,13 +7,13 @@ Created: 2023-06-28
 """
 import numpy as np
 import pandas as pd
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 import datetime as dt
 
 from app import schemas
 from app import crud
-from .api import app, get_db, check_tz_aware
+from .api import app, get_db, check_tz_aware, get_response_format, tabular_response
 from app.output_data_structures import output_schemas as ods_schemas
 
 
@@ -206,41 +206,43 @@ async def get_thaw_tube_reference_by_thaw_tube_uid_and_date(thaw_tube_uid: int,
 @app.get("/installation_visits/thaw_tube_history/installation_uid{installation_uid}",
          response_model=list[ods_schemas.ThawTubeHistory])
 def get_thaw_tube_history_at_installation(installation_uid: int, db: Session = Depends(get_db)):
-    thaw_tube_uid = crud.get_thaw_tube_by_installation_uid(db=db, installation_uid=installation_uid).thaw_tube_uid
-    thaw_tube_references = pd.DataFrame(
-        [ele.__dict__ for ele in crud.get_all_thaw_tube_references_for_thaw_tube_uid(
-            db=db, thaw_tube_uid=thaw_tube_uid)])
-    thaw_tube_references.drop(columns="_sa_instance_state", inplace=True)
-    table = pd.DataFrame(crud.get_thaw_tube_readings_at_installation(db=db, installation_uid=installation_uid),
-                         columns=["date_time", "recorded_by", "activity", "notes", "tt_read_uid", "tube_height",
-                                  "ice_depth", "scribe_min", "scribe_curr", "scribe_max"])
-    for i, r in table.iterrows():
-        prev_year = r["date_time"].year - 1
-
-        db_prev_year_bead = \
-            crud.get_thaw_tube_bead_measurement_by_reading_uid_and_bead_year(thaw_tube_reading_uid=r["tt_read_uid"],
-                                                                             bead_year=prev_year, db=db)
-        time_diff = [(r["date_time"] - ref_date).total_seconds() for ref_date in thaw_tube_references["date"]]
-        ref_index = time_diff.index(min([ele for ele in time_diff if ele > 0]))
-        ref_measurement = thaw_tube_references.loc[ref_index, "reference_measurement"]
-        if db_prev_year_bead is not None:
-            table.loc[i, "previous_year_bead_depth"] = db_prev_year_bead.depth
-            table.loc[i, "thaw_penetration"] = db_prev_year_bead.depth - ref_measurement
-            table.loc[i, "max_active_layer"] = db_prev_year_bead.depth - (
-                        r["tube_height"] - (r["scribe_min"] - r["scribe_curr"]))
-            table.loc[i, "surface_change"] = table.loc[i, "thaw_penetration"] - table.loc[i, "max_active_layer"]
+    db_thaw_tube = crud.get_thaw_tube_by_installation_uid(db=db, installation_uid=installation_uid)
+    if db_thaw_tube is None:
+        raise HTTPException(status_code=400, detail=f"No thaw tube associated with installation UID "
+                                                    f"{installation_uid}")
+    table = crud.get_thaw_tube_history(db=db, thaw_tube_uids=[db_thaw_tube.thaw_tube_uid])
     table = table.replace({np.nan: None})
-    return table.drop(columns=["tt_read_uid"]).to_dict("records")
+    return table.drop(columns=["thaw_tube_uid"]).to_dict("records")
+
+
+@app.get("/thaw_tube_readings/report/year{year}", response_model=list[ods_schemas.ThawTubeReport])
+def get_thaw_tube_network_report(year: int, regions: list[str] | None = Query(None),
+                                 response_format: str = Depends(get_response_format), db: Session = Depends(get_db)):
+    table = crud.get_thaw_tube_network_report(db=db, year=year, regions=regions)
+    if table.empty:
+        raise HTTPException(status_code=400, detail=f"No thaw tube readings in {year}")
+    if response_format != "json":
+        return tabular_response(table, response_format)
+    return table.replace({np.nan: None}).to_dict("records")
 
 
 @app.get("/thaw_tube_bead_measurements/bead_history/thaw_tube_uid{thaw_tube_uid}",
          response_model=list[ods_schemas.ThawTubeBeadHistory])
 def get_thaw_tube_bead_history(thaw_tube_uid: int, db: Session = Depends(get_db)):
     table = pd.DataFrame(crud.get_thaw_tube_bead_history(thaw_tube_uid=thaw_tube_uid, db=db),
-                         columns=["bead_year", "bead_colour", "depth", "depth_max", "depth_min",
-                                  "installation_visit_uid"])
-    for i, r in table.iterrows():
-        table.loc[i, "date_time"] = crud.get_installation_visit_by_uid(
-            uid=r["installation_visit_uid"], db=db).visit_date
+                         columns=["bead_year", "bead_colour", "depth", "depth_max", "depth_min", "date_time"])
+    table = table.replace({np.nan: None})
+    return table.to_dict("records")
+
+
+@app.get("/thaw_tube_bead_measurements/bead_history/batch/",
+         response_model=dict[int, list[ods_schemas.ThawTubeBeadHistory]])
+def get_thaw_tube_bead_histories(thaw_tube_uids: list[int] = Query(), db: Session = Depends(get_db)):
+    table = pd.DataFrame(crud.get_thaw_tube_bead_histories(thaw_tube_uids=thaw_tube_uids, db=db),
+                         columns=["thaw_tube_uid", "bead_year", "bead_colour", "depth", "depth_max", "depth_min",
+                                  "date_time"])
     table = table.replace({np.nan: None})
-    return table.drop(columns=["installation_visit_uid"]).to_dict("records")
+    histories = {thaw_tube_uid: [] for thaw_tube_uid in thaw_tube_uids}
+    for thaw_tube_uid, history in table.groupby("thaw_tube_uid"):
+        histories[thaw_tube_uid] = history.drop(columns=["thaw_tube_uid"]).to_dict("records")
+    return histories
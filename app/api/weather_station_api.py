@@ -1,10 +1,14 @@
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, UploadFile, Form, Query
 from sqlalchemy.orm import Session
 import datetime as dt
+import pandas as pd
 
 from app import schemas
 from app import crud
-from .api import app, get_db, check_tz_aware
+from app import file_parsers
+from .api import app, get_db, check_tz_aware, check_date_range, check_downsampling, downsample_rows, \
+    get_response_format, tabular_response
+from app.output_data_structures import output_schemas as ods_schemas
 
 
 @app.post("/weather_stations/", response_model=schemas.WeatherStation)
@@ -65,9 +69,44 @@ async def add_weather_station_download(weather_station_download: schemas.Weather
     return crud.add_weather_station_download(db=db, weather_station_download=weather_station_download)
 
 
-@app.post("/weather_station_hourly_data/", response_model=schemas.WeatherStationHourlyData)
+@app.post("/weather_station_downloads/files/", response_model=ods_schemas.WeatherStationFileUploadSummary)
+async def add_weather_station_download_files(weather_station_download_uid: int = Form(),
+                                             hourly_file: UploadFile | None = None,
+                                             daily_file: UploadFile | None = None, utc_offset: float = Form(0.0),
+                                             on_conflict: str = Form("skip"), dry_run: bool = Form(False),
+                                             db: Session = Depends(get_db)):
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    if hourly_file is None and daily_file is None:
+        raise HTTPException(status_code=400, detail=f"An hourly or daily table file must be provided")
+    db_weather_station_download = crud.get_weather_station_download_by_uid(
+        db=db, weather_station_download_uid=weather_station_download_uid)
+    if db_weather_station_download is None:
+        raise HTTPException(status_code=400, detail=f"Weather station download UID {weather_station_download_uid} "
+                                                    f"does not exist")
+    weather_station_uid = db_weather_station_download.weather_station_uid
+    upload_summary = {}
+    for table, table_file in [("hourly", hourly_file), ("daily", daily_file)]:
+        if table_file is None:
+            continue
+        try:
+            upload_summary[table], upload_summary[f"{table}_tbl_good"] = crud.add_weather_station_file_data(
+                chunks=file_parsers.read_campbell_file(table_file.file, utc_offset=utc_offset), table=table,
+                weather_station_uid=weather_station_uid, weather_station_download_uid=weather_station_download_uid,
+                db=db, on_conflict=on_conflict, dry_run=dry_run)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"{table_file.filename}: {e}")
+    if dry_run:
+        return upload_summary
+    crud.update_weather_station_download_table_status(
+        db=db, weather_station_download_uid=weather_station_download_uid,
+        hourly_tbl_good=upload_summary.get("hourly_tbl_good"), daily_tbl_good=upload_summary.get("daily_tbl_good"))
+    return upload_summary
+
+
+@app.post("/weather_station_hourly_data/", response_model=schemas.WeatherStationHourlyData | None)
 async def add_hourly_weather_station_data(hourly_data: schemas.WeatherStationHourlyDataBase,
-                                          db: Session = Depends(get_db)):
+                                          on_conflict: str = "fail", db: Session = Depends(get_db)):
     if hourly_data.weather_station_uid is None:
         raise HTTPException(status_code=400, detail=f"Weather station UID must be specified")
     if hourly_data.weather_station_download_uid is None:
@@ -76,11 +115,12 @@ async def add_hourly_weather_station_data(hourly_data: schemas.WeatherStationHou
         raise HTTPException(status_code=400, detail=f"Date/time must be specified")
     if not check_tz_aware(hourly_data.date_time):
         raise HTTPException(status_code=400, detail=f"{hourly_data.date_time} is not time zone aware.")
-    db_hourly_data = crud.get_weather_station_hourly_data_by_station_uid_and_time(
-        db=db, timestamp=hourly_data.date_time, weather_station_uid=hourly_data.weather_station_uid)
-    if db_hourly_data:
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    db_hourly_data = crud.add_hourly_weather_station_data(db=db, hourly_data=hourly_data, on_conflict=on_conflict)
+    if db_hourly_data is None and on_conflict == "fail":
         raise HTTPException(status_code=400, detail=f"This data is already in the database")
-    return crud.add_hourly_weather_station_data(db=db, hourly_data=hourly_data)
+    return db_hourly_data
 
 
 @app.get("/weather_station_hourly_data/station_uid_and_time/", response_model=schemas.WeatherStationHourlyData)
@@ -97,9 +137,9 @@ async def get_weather_station_hourly_data_by_station_uid_and_time(weather_statio
     return db_hourly_data
 
 
-@app.post("/weather_station_daily_data/", response_model=schemas.WeatherStationDailyData)
+@app.post("/weather_station_daily_data/", response_model=schemas.WeatherStationDailyData | None)
 async def add_daily_weather_station_data(daily_data: schemas.WeatherStationDailyDataBase,
-                                         db: Session = Depends(get_db)):
+                                         on_conflict: str = "fail", db: Session = Depends(get_db)):
     if daily_data.weather_station_uid is None:
         raise HTTPException(status_code=400, detail=f"Weather station UID must be specified")
     if daily_data.weather_station_download_uid is None:
@@ -108,16 +148,17 @@ async def add_daily_weather_station_data(daily_data: schemas.WeatherStationDaily
         raise HTTPException(status_code=400, detail=f"Date/time must be specified")
     if not check_tz_aware(daily_data.date_time):
         raise HTTPException(status_code=400, detail=f"{daily_data.date_time} is not time zone aware.")
-    db_daily_data = crud.get_weather_station_daily_data_by_station_uid_and_time(
-        db=db, timestamp=daily_data.date_time, weather_station_uid=daily_data.weather_station_uid)
-    if db_daily_data:
+    if on_conflict not in crud.conflict_policies:
+        raise HTTPException(status_code=400, detail=f"Conflict policy must be in {crud.conflict_policies}")
+    db_daily_data = crud.add_daily_weather_station_data(db=db, daily_data=daily_data, on_conflict=on_conflict)
+    if db_daily_data is None and on_conflict == "fail":
         raise HTTPException(status_code=400, detail=f"This data is already in the database")
-    return crud.add_daily_weather_station_data(db=db, daily_data=daily_data)
+    return db_daily_data
 
 
 @app.get("/weather_station_daily_data/station_uid_and_time/", response_model=schemas.WeatherStationDailyData)
-async def get_weather_station_hourly_data_by_station_uid_and_time(weather_station_uid: int, timestamp: dt.datetime,
-                                                                  db: Session = Depends(get_db)):
+async def get_weather_station_daily_data_by_station_uid_and_time(weather_station_uid: int, timestamp: dt.datetime,
+                                                                 db: Session = Depends(get_db)):
     if not check_tz_aware(timestamp):
         raise HTTPException(status_code=400, detail=f"{timestamp} is not time zone aware.")
     db_daily_data =\
@@ -129,6 +170,119 @@ async def get_weather_station_hourly_data_by_station_uid_and_time(weather_statio
     return db_daily_data
 
 
+def check_weather_station_columns(table: str, columns: list[str] | None, numeric_only: bool = False):
+    """Requested data columns of the hourly or daily table, defaulting to all of them"""
+    _, table_columns = crud.get_weather_station_table(table)
+    if numeric_only:
+        table_columns = [column for column in table_columns if column not in crud.daily_time_columns]
+    if not columns:
+        return table_columns
+    invalid_columns = [column for column in columns if column not in table_columns]
+    if invalid_columns:
+        raise HTTPException(status_code=400, detail=f"Columns {invalid_columns} not in {table_columns}")
+    return columns
+
+
+def get_weather_station_data_in_range(table: str, weather_station_uid: int, columns: list[str] | None,
+                                      start: dt.datetime | None, end: dt.datetime | None, max_points: int | None,
+                                      downsampling: str, response_format: str, db: Session):
+    columns = check_weather_station_columns(table=table, columns=columns)
+    check_date_range(start=start, end=end)
+    check_downsampling(max_points=max_points, method=downsampling)
+    # Downsampling preserves the shape of the first numeric column requested
+    numeric_columns = [column for column in columns if column not in crud.daily_time_columns]
+    if max_points is not None and not numeric_columns:
+        raise HTTPException(status_code=400, detail=f"Downsampling requires a numeric column")
+    db_weather_station_data = crud.get_weather_station_data_in_range(
+        db=db, table=table, weather_station_uid=weather_station_uid, columns=columns, start=start, end=end)
+    if not db_weather_station_data:
+        raise HTTPException(status_code=400, detail=f"No {table} data associated with weather station UID "
+                                                    f"{weather_station_uid}")
+    if max_points is not None:
+        db_weather_station_data = downsample_rows(db_weather_station_data, x_column="date_time",
+                                                  y_column=numeric_columns[0], max_points=max_points,
+                                                  method=downsampling)
+    if response_format != "json":
+        return tabular_response(pd.DataFrame(db_weather_station_data), response_format)
+    return [row._asdict() for row in db_weather_station_data]
+
+
+def get_weather_station_timeseries_aggregate(table: str, weather_station_uid: int, frequency: str,
+                                             columns: list[str] | None, statistics: list[str],
+                                             start: dt.datetime | None, end: dt.datetime | None,
+                                             response_format: str, db: Session):
+    if frequency not in crud.timeseries_frequencies:
+        raise HTTPException(status_code=400, detail=f"Frequency {frequency} not in {crud.timeseries_frequencies}")
+    invalid_statistics = [statistic for statistic in statistics if statistic not in crud.weather_station_statistics]
+    if invalid_statistics:
+        raise HTTPException(status_code=400, detail=f"Statistics {invalid_statistics} not in "
+                                                    f"{list(crud.weather_station_statistics)}")
+    columns = check_weather_station_columns(table=table, columns=columns, numeric_only=True)
+    check_date_range(start=start, end=end)
+    db_aggregates = crud.get_weather_station_timeseries_aggregate(
+        db=db, table=table, weather_station_uid=weather_station_uid, frequency=frequency, columns=columns,
+        statistics=statistics, start=start, end=end)
+    if not db_aggregates:
+        raise HTTPException(status_code=400, detail=f"No {table} data associated with weather station UID "
+                                                    f"{weather_station_uid}")
+    if response_format != "json":
+        return tabular_response(pd.DataFrame(db_aggregates), response_format)
+    return [row._asdict() for row in db_aggregates]
+
+
+@app.get("/weather_station_hourly_data/weather_station_uid{weather_station_uid}/all/",
+         response_model=list[ods_schemas.WeatherStationDataOutput], response_model_exclude_unset=True)
+async def get_weather_station_hourly_data_in_range(weather_station_uid: int,
+                                                   columns: list[str] | None = Query(None),
+                                                   start: dt.datetime | None = None, end: dt.datetime | None = None,
+                                                   max_points: int | None = None, downsampling: str = "lttb",
+                                                   response_format: str = Depends(get_response_format),
+                                                   db: Session = Depends(get_db)):
+    return get_weather_station_data_in_range(table="hourly", weather_station_uid=weather_station_uid, columns=columns,
+                                             start=start, end=end, max_points=max_points, downsampling=downsampling,
+                                             response_format=response_format, db=db)
+
+
+@app.get("/weather_station_daily_data/weather_station_uid{weather_station_uid}/all/",
+         response_model=list[ods_schemas.WeatherStationDataOutput], response_model_exclude_unset=True)
+async def get_weather_station_daily_data_in_range(weather_station_uid: int, columns: list[str] | None = Query(None),
+                                                  start: dt.datetime | None = None, end: dt.datetime | None = None,
+                                                  max_points: int | None = None, downsampling: str = "lttb",
+                                                  response_format: str = Depends(get_response_format),
+                                                  db: Session = Depends(get_db)):
+    return get_weather_station_data_in_range(table="daily", weather_station_uid=weather_station_uid, columns=columns,
+                                             start=start, end=end, max_points=max_points, downsampling=downsampling,
+                                             response_format=response_format, db=db)
+
+
+@app.get("/weather_station_hourly_data/weather_station_uid/timeseries_aggregate/",
+         response_model=list[ods_schemas.WeatherStationAggregateData])
+async def get_weather_station_hourly_timeseries_aggregate(weather_station_uid: int, frequency: str = "D",
+                                                          columns: list[str] | None = Query(None),
+                                                          statistics: list[str] = Query(["mean"]),
+                                                          start: dt.datetime | None = None,
+                                                          end: dt.datetime | None = None,
+                                                          response_format: str = Depends(get_response_format),
+                                                          db: Session = Depends(get_db)):
+    return get_weather_station_timeseries_aggregate(table="hourly", weather_station_uid=weather_station_uid,
+                                                    frequency=frequency, columns=columns, statistics=statistics,
+                                                    start=start, end=end, response_format=response_format, db=db)
+
+
+@app.get("/weather_station_daily_data/weather_station_uid/timeseries_aggregate/",
+         response_model=list[ods_schemas.WeatherStationAggregateData])
+async def get_weather_station_daily_timeseries_aggregate(weather_station_uid: int, frequency: str = "M",
+                                                         columns: list[str] | None = Query(None),
+                                                         statistics: list[str] = Query(["mean"]),
+                                                         start: dt.datetime | None = None,
+                                                         end: dt.datetime | None = None,
+                                                         response_format: str = Depends(get_response_format),
+                                                         db: Session = Depends(get_db)):
+    return get_weather_station_timeseries_aggregate(table="daily", weather_station_uid=weather_station_uid,
+                                                    frequency=frequency, columns=columns, statistics=statistics,
+                                                    start=start, end=end, response_format=response_format, db=db)
+
+
 @app.post("/weather_stations/update_status", response_model=schemas.WeatherStation)
 async def update_ws_sensor_status(uid: int, air_temp_stat: str, snow_stat: str, anemo_stat: str,
                                   db: Session = Depends(get_db)):
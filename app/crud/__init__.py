@@ -3,3 +3,7 @@ from .weather_station_crud import *
 from .thaw_tube_crud import *
 from .cable_crud import *
 from .air_gs_crud import *
+from .four_channel_crud import *
+from .bulk_crud import *
+from .job_crud import *
+from .timeseries_crud import *
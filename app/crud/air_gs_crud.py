@@ -7,8 +7,11 @@ Created: 2023-11-01
 """
 
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 import datetime as dt
+import pandas as pd
 
+from app import crud
 from app import schemas
 from app import models
 
@@ -21,26 +24,149 @@ def get_ag_logger_data_by_logger_uid_channel_number_and_measurement_date(logger_
         & (models.AirGroundTemperatureData.date_time == date_time)).first()
 
 
-def add_ag_logger_data(ag_logger_data: schemas.AirGroundTemperatureDataBase, db: Session):
-    new_ag_logger_data = models.AirGroundTemperatureData(logger_uid=ag_logger_data.logger_uid,
-                                                         logger_download_uid=ag_logger_data.logger_download_uid,
-                                                         channel_number=ag_logger_data.channel_number,
-                                                         installation_uid=ag_logger_data.installation_uid,
-                                                         date_time=ag_logger_data.date_time.replace(microsecond=0),
-                                                         temperature=ag_logger_data.temperature)
-    db.add(new_ag_logger_data)
+def add_ag_logger_data(ag_logger_data: schemas.AirGroundTemperatureDataBase, db: Session, on_conflict: str = "fail"):
+    values = ag_logger_data.dict()
+    values["date_time"] = ag_logger_data.date_time.replace(microsecond=0)
+    db_ag_logger_data = crud.upsert_row(db=db, model=models.AirGroundTemperatureData, values=values,
+                                        key_columns=["logger_uid", "channel_number", "date_time"],
+                                        on_conflict=on_conflict, commit=False)
+    if db_ag_logger_data is not None:
+        start, end = crud.rollup_window(pd.Series([values["date_time"]]))
+        refresh_ag_logger_daily_data(db=db, installation_uid=ag_logger_data.installation_uid,
+                                     sensors=[(ag_logger_data.logger_uid, ag_logger_data.channel_number)],
+                                     start=start, end=end)
     db.commit()
-    db.refresh(new_ag_logger_data)
-    return new_ag_logger_data
+    if db_ag_logger_data is not None:
+        db.refresh(db_ag_logger_data)
+    return db_ag_logger_data
 
 
-def get_ag_logger_data_at_installation(installation_uid: int, db: Session):
-    return db.query(models.AirGroundTemperatureData.date_time,
-                    models.AirGroundTemperatureData.temperature,
-                    models.AirGroundTemperatureData.channel_number,
-                    models.Logger.logger_serial_number) \
+def add_bulk_ag_logger_data(data: pd.DataFrame, db: Session, commit: bool = True, on_conflict: str = "skip",
+                            dry_run: bool = False):
+    data = data[["logger_uid", "logger_download_uid", "installation_uid", "date_time", "channel_number",
+                 "temperature"]].copy()
+    data["date_time"] = pd.to_datetime(data["date_time"], utc=True).dt.floor("s")
+    summary = crud.bulk_insert_dataframe(db=db, model=models.AirGroundTemperatureData, data=data,
+                                         key_columns=["logger_uid", "channel_number", "date_time"],
+                                         value_columns=["temperature"], on_conflict=on_conflict, dry_run=dry_run)
+    if not dry_run and summary["inserted"] + summary["overwritten"] > 0:
+        start, end = crud.rollup_window(data["date_time"])
+        sensors = data[["logger_uid", "channel_number"]].drop_duplicates().astype(int)
+        installation_uids = data["installation_uid"].unique()
+        installation_uid = int(installation_uids[0]) if len(installation_uids) == 1 else None
+        refresh_ag_logger_daily_data(db=db, installation_uid=installation_uid,
+                                     sensors=list(sensors.itertuples(index=False, name=None)), start=start, end=end)
+    if commit:
+        db.commit()
+    return summary
+
+
+def refresh_ag_logger_daily_data(db: Session, installation_uid: int | None = None, sensors: list[tuple] | None = None,
+                                 start: dt.datetime | None = None, end: dt.datetime | None = None):
+    # Sensors are (logger_uid, channel_number) pairs
+    return crud.refresh_daily_rollups(db=db, rollup=models.AirGroundTemperatureDataDaily,
+                                      model=models.AirGroundTemperatureData,
+                                      sensor_columns=["logger_uid", "channel_number"],
+                                      installation_uid=installation_uid, sensors=sensors, start=start, end=end)
+
+
+def add_bulk_temperature_pressure_data(data: pd.DataFrame, db: Session, commit: bool = True,
+                                       on_conflict: str = "skip"):
+    data = data[["logger_uid", "logger_download_uid", "installation_uid", "date_time", "temperature",
+                 "pressure"]].copy()
+    data["date_time"] = pd.to_datetime(data["date_time"], utc=True).dt.floor("s")
+    summary = crud.bulk_insert_dataframe_in_chunks(db=db, model=models.TemperaturePressureData, data=data,
+                                                   key_columns=["logger_uid", "date_time"],
+                                                   value_columns=["temperature", "pressure"], on_conflict=on_conflict)
+    if commit:
+        db.commit()
+    return summary
+
+
+def get_temperature_pressure_data_at_installation(installation_uid: int, db: Session,
+                                                  start: dt.datetime | None = None, end: dt.datetime | None = None):
+    query = db.query(models.TemperaturePressureData.date_time,
+                     models.TemperaturePressureData.temperature,
+                     models.TemperaturePressureData.pressure,
+                     models.Logger.logger_serial_number.label("logger_sn")) \
         .join(models.Logger) \
-        .filter(models.AirGroundTemperatureData.installation_uid == installation_uid).all()
+        .filter(models.TemperaturePressureData.installation_uid == installation_uid)
+    if start is not None:
+        query = query.filter(models.TemperaturePressureData.date_time >= start)
+    if end is not None:
+        query = query.filter(models.TemperaturePressureData.date_time < end)
+    return query.order_by(models.TemperaturePressureData.date_time).all()
+
+
+def get_temperature_pressure_timeseries_mean_at_installation(installation_uid: int, frequency: str, db: Session,
+                                                             start: dt.datetime | None = None,
+                                                             end: dt.datetime | None = None):
+    bucket = crud.time_bucket(models.TemperaturePressureData.date_time, frequency).label("date")
+    query = db.query(bucket,
+                     func.avg(models.TemperaturePressureData.temperature).label("temperature"),
+                     func.avg(models.TemperaturePressureData.pressure).label("pressure"),
+                     func.min(models.TemperaturePressureData.pressure).label("pressure_min"),
+                     func.max(models.TemperaturePressureData.pressure).label("pressure_max"),
+                     func.count().label("count")) \
+        .filter(models.TemperaturePressureData.installation_uid == installation_uid)
+    if start is not None:
+        query = query.filter(models.TemperaturePressureData.date_time >= start)
+    if end is not None:
+        query = query.filter(models.TemperaturePressureData.date_time < end)
+    return query.group_by(bucket).order_by(bucket).all()
+
+
+def get_ag_logger_data_at_installation(installation_uid: int, db: Session, stream: bool = False):
+    query = db.query(models.AirGroundTemperatureData.date_time,
+                     models.AirGroundTemperatureData.temperature,
+                     models.AirGroundTemperatureData.channel_number,
+                     models.Logger.logger_serial_number) \
+        .join(models.Logger) \
+        .filter(models.AirGroundTemperatureData.installation_uid == installation_uid) \
+        .order_by(models.AirGroundTemperatureData.date_time, models.AirGroundTemperatureData.channel_number)
+    return query.yield_per(crud.stream_batch_size) if stream else query.all()
+
+
+def get_ag_timeseries_means_at_installations(installation_uids: list[int], frequency: str, db: Session,
+                                             start: dt.datetime | None = None, end: dt.datetime | None = None):
+    rollup_means = []
+    rollup = models.AirGroundTemperatureDataDaily
+    rollup_installation_uids = crud.get_complete_daily_rollup_installation_uids(db=db, rollup=rollup,
+                                                                                installation_uids=installation_uids)
+    if crud.is_utc_midnight(start) and crud.is_utc_midnight(end) and rollup_installation_uids:
+        # Whole-day ranges are answered from the daily rollups of the installations whose rollups are complete;
+        # partial days and the other installations have to go back to the raw data
+        bucket = crud.time_bucket(rollup.date, frequency).label("date")
+        query = db.query(rollup.installation_uid,
+                         bucket,
+                         (func.sum(rollup.temperature_sum) / func.sum(rollup.count)).label("temperature")) \
+            .filter(rollup.installation_uid.in_(rollup_installation_uids))
+        if start is not None:
+            query = query.filter(rollup.date >= start)
+        if end is not None:
+            query = query.filter(rollup.date < end)
+        rollup_means = query.group_by(rollup.installation_uid, bucket).order_by(rollup.installation_uid, bucket).all()
+        installation_uids = [uid for uid in installation_uids if uid not in rollup_installation_uids]
+        if not installation_uids:
+            return rollup_means
+    bucket = crud.time_bucket(models.AirGroundTemperatureData.date_time, frequency).label("date")
+    query = db.query(models.AirGroundTemperatureData.installation_uid,
+                     bucket,
+                     func.avg(models.AirGroundTemperatureData.temperature).label("temperature")) \
+        .filter(models.AirGroundTemperatureData.installation_uid.in_(installation_uids))
+    if start is not None:
+        query = query.filter(models.AirGroundTemperatureData.date_time >= start)
+    if end is not None:
+        query = query.filter(models.AirGroundTemperatureData.date_time < end)
+    raw_means = query.group_by(models.AirGroundTemperatureData.installation_uid, bucket) \
+        .order_by(models.AirGroundTemperatureData.installation_uid, bucket).all()
+    return sorted(rollup_means + raw_means, key=lambda row: (row.installation_uid, row.date))
+
+
+def get_ag_timeseries_mean_at_installation(installation_uid: int, frequency: str, db: Session,
+                                           start: dt.datetime | None = None, end: dt.datetime | None = None):
+    return [{"date": row.date, "temperature": row.temperature} for row in get_ag_timeseries_means_at_installations(
+        installation_uids=[installation_uid], frequency=frequency, db=db, start=start, end=end)]
 
 
 def get_ag_data_by_installation_and_measurement_date(installation_uid: int, date_time: dt.datetime, db: Session):
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import Column, MetaData, Table, and_, case, func, or_, select
+from sqlalchemy.dialects import postgresql
+import pandas as pd
+import uuid
+import io
+
+conflict_policies = ["skip", "overwrite", "fail"]
+bulk_chunk_size = 50000
+conflict_sample_size = 20
+# Rows fetched per round trip from a server-side cursor when a query result is streamed
+stream_batch_size = 10000
+
+
+def copy_dataframe_to_staging_table(db: Session, model, data: pd.DataFrame):
+    # The staging table lives in the session's transaction and is dropped on commit/rollback
+    target = model.__table__
+    staging = Table(f"staging_{target.name}_{uuid.uuid4().hex[:8]}", MetaData(),
+                    *[Column(name, target.c[name].type) for name in data.columns],
+                    prefixes=["TEMPORARY"], postgresql_on_commit="DROP")
+    connection = db.connection()
+    staging.create(connection)
+    buffer = io.StringIO()
+    data.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {staging.name} ({', '.join(data.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    return staging
+
+
+def get_dry_run_table(db: Session, model, key_columns: list[str], value_columns: list[str]):
+    # Rows a dry run would have written are kept until the transaction ends, so later chunks of the same upload are
+    # classified against them just as a real upload's later chunks see the rows its earlier chunks inserted
+    target = model.__table__
+    connection = db.connection()
+    transaction = db.get_transaction()
+    dry_run_tables = db.info.setdefault("dry_run_tables", {})
+    if target.name in dry_run_tables and dry_run_tables[target.name][0] is transaction:
+        return dry_run_tables[target.name][1]
+    dry_run_table = Table(f"dry_run_{target.name}_{uuid.uuid4().hex[:8]}", MetaData(),
+                          *[Column(name, target.c[name].type, primary_key=name in key_columns)
+                            for name in key_columns + value_columns],
+                          prefixes=["TEMPORARY"], postgresql_on_commit="DROP")
+    dry_run_table.create(connection)
+    dry_run_tables[target.name] = (transaction, dry_run_table)
+    return dry_run_table
+
+
+def join_existing_rows(model, staging: Table, key_columns: list[str], value_columns: list[str],
+                       dry_run_table: Table | None = None):
+    # Returns the staged rows joined to what is already stored for their keys, whether each row matched a stored
+    # key, and the stored values. Rows written earlier in a dry run take precedence over the table
+    target = model.__table__
+    joined = staging.outerjoin(target, and_(*[staging.c[col] == target.c[col] for col in key_columns]))
+    matched = target.c[key_columns[0]].isnot(None)
+    existing = {col: target.c[col] for col in value_columns}
+    if dry_run_table is not None:
+        joined = joined.outerjoin(dry_run_table,
+                                  and_(*[staging.c[col] == dry_run_table.c[col] for col in key_columns]))
+        pending = dry_run_table.c[key_columns[0]].isnot(None)
+        matched = matched | pending
+        existing = {col: case((pending, dry_run_table.c[col]), else_=target.c[col]) for col in value_columns}
+    return joined, matched, existing
+
+
+def classify_staged_rows(db: Session, model, staging: Table, key_columns: list[str], value_columns: list[str],
+                         dry_run_table: Table | None = None):
+    joined, matched, existing = join_existing_rows(model=model, staging=staging, key_columns=key_columns,
+                                                   value_columns=value_columns, dry_run_table=dry_run_table)
+    identical = and_(*[staging.c[col].isnot_distinct_from(existing[col]) for col in value_columns])
+    counts = db.execute(
+        select(func.count().filter(~matched).label("new"),
+               func.count().filter(matched & identical).label("duplicate"),
+               func.count().filter(matched & ~identical).label("conflicting"))
+        .select_from(joined)
+    ).one()
+    return counts._asdict()
+
+
+def record_dry_run_rows(db: Session, model, staging: Table, dry_run_table: Table, key_columns: list[str],
+                        value_columns: list[str], on_conflict: str = "skip"):
+    # Stands in for insert_staged_rows: new rows, and conflicting rows when overwriting, are what would be written
+    joined, matched, existing = join_existing_rows(model=model, staging=staging, key_columns=key_columns,
+                                                   value_columns=value_columns, dry_run_table=dry_run_table)
+    written = ~matched
+    if on_conflict == "overwrite":
+        written = written | or_(*[staging.c[col].is_distinct_from(existing[col]) for col in value_columns])
+    columns = key_columns + value_columns
+    statement = postgresql.insert(dry_run_table).from_select(
+        columns, select(*[staging.c[col] for col in columns]).select_from(joined).where(written))
+    db.execute(statement.on_conflict_do_update(index_elements=key_columns,
+                                               set_={col: statement.excluded[col] for col in value_columns}))
+
+
+def insert_staged_rows(db: Session, model, staging: Table, key_columns: list[str], value_columns: list[str],
+                       on_conflict: str = "skip"):
+    # Only rows which are new, or which conflict and are to be overwritten, are sent to the database. The ON CONFLICT
+    # clause covers rows that another transaction inserted after the staged rows were classified
+    target = model.__table__
+    columns = [col.name for col in staging.c]
+    if on_conflict == "overwrite":
+        statement = postgresql.insert(target).from_select(columns, select(*staging.c))
+        return db.execute(statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={col: statement.excluded[col] for col in columns if col not in key_columns},
+            where=or_(*[target.c[col].is_distinct_from(statement.excluded[col]) for col in value_columns])
+        )).rowcount
+    new_rows = select(*staging.c) \
+        .select_from(staging.outerjoin(target, and_(*[staging.c[col] == target.c[col] for col in key_columns]))) \
+        .where(target.c[key_columns[0]].is_(None))
+    statement = postgresql.insert(target).from_select(columns, new_rows)
+    return db.execute(statement.on_conflict_do_nothing(index_elements=key_columns)).rowcount
+
+
+def new_bulk_summary(dry_run: bool = False):
+    summary = {"received": 0, "inserted": 0, "skipped": 0, "conflicting": 0, "overwritten": 0}
+    if dry_run:
+        summary.update(dry_run=True, conflict_sample=[])
+    return summary
+
+
+def merge_bulk_summaries(summary: dict, chunk_summary: dict):
+    for key in ["received", "inserted", "skipped", "conflicting", "overwritten"]:
+        summary[key] += chunk_summary[key]
+    if "conflict_sample" in summary:
+        room = conflict_sample_size - len(summary["conflict_sample"])
+        summary["conflict_sample"].extend(chunk_summary["conflict_sample"][:room])
+    return summary
+
+
+def sample_conflicting_rows(db: Session, model, staging: Table, key_columns: list[str], value_columns: list[str],
+                            limit: int = conflict_sample_size, dry_run_table: Table | None = None):
+    joined, matched, existing = join_existing_rows(model=model, staging=staging, key_columns=key_columns,
+                                                   value_columns=value_columns, dry_run_table=dry_run_table)
+    rows = db.execute(
+        select(*[staging.c[col] for col in key_columns + value_columns],
+               *[existing[col].label(f"existing_{col}") for col in value_columns])
+        .select_from(joined)
+        .where(matched & or_(*[staging.c[col].is_distinct_from(existing[col]) for col in value_columns]))
+        .limit(limit)
+    ).all()
+    return [row._asdict() for row in rows]
+
+
+def bulk_insert_dataframe(db: Session, model, data: pd.DataFrame, key_columns: list[str], value_columns: list[str],
+                          on_conflict: str = "skip", dry_run: bool = False):
+    """With dry_run the rows are classified against the table as they would be on insert, but nothing is written.
+    Within one transaction, later dry-run calls also see the rows earlier calls would have written"""
+    summary = new_bulk_summary(dry_run=dry_run)
+    summary["received"] = len(data.index)
+    unique_rows = data.drop_duplicates(subset=key_columns + value_columns)
+    summary["skipped"] += len(data.index) - len(unique_rows.index)
+    # Rows that share a key but disagree on values within the same payload can't be resolved, so none are inserted
+    payload_conflicts = unique_rows.duplicated(subset=key_columns, keep=False)
+    summary["conflicting"] += int(payload_conflicts.sum())
+    if dry_run:
+        summary["conflict_sample"] = unique_rows.loc[payload_conflicts, key_columns + value_columns] \
+            .head(conflict_sample_size).assign(**{f"existing_{col}": None for col in value_columns}).to_dict("records")
+    unique_rows = unique_rows.loc[~payload_conflicts]
+    if on_conflict == "fail" and summary["conflicting"] > 0 and not dry_run:
+        raise ValueError(f"{summary['conflicting']} rows share a date time but have different values")
+    if unique_rows.empty:
+        return summary
+
+    staging = copy_dataframe_to_staging_table(db=db, model=model, data=unique_rows)
+    dry_run_table = get_dry_run_table(db=db, model=model, key_columns=key_columns,
+                                      value_columns=value_columns) if dry_run else None
+    counts = classify_staged_rows(db=db, model=model, staging=staging, key_columns=key_columns,
+                                  value_columns=value_columns, dry_run_table=dry_run_table)
+    summary["skipped"] += counts["duplicate"]
+    summary["conflicting"] += counts["conflicting"]
+    if dry_run:
+        summary["inserted"] = counts["new"]
+        if on_conflict == "overwrite":
+            summary["overwritten"] = counts["conflicting"]
+        if counts["conflicting"] > 0 and len(summary["conflict_sample"]) < conflict_sample_size:
+            summary["conflict_sample"] += sample_conflicting_rows(
+                db=db, model=model, staging=staging, key_columns=key_columns, value_columns=value_columns,
+                limit=conflict_sample_size - len(summary["conflict_sample"]), dry_run_table=dry_run_table)
+        record_dry_run_rows(db=db, model=model, staging=staging, dry_run_table=dry_run_table,
+                            key_columns=key_columns, value_columns=value_columns, on_conflict=on_conflict)
+        staging.drop(db.connection())
+        return summary
+    if on_conflict == "fail" and counts["duplicate"] + counts["conflicting"] > 0:
+        raise ValueError(f"{counts['duplicate'] + counts['conflicting']} rows already exist in the database")
+    written = insert_staged_rows(db=db, model=model, staging=staging, key_columns=key_columns,
+                                 value_columns=value_columns, on_conflict=on_conflict)
+    if on_conflict == "overwrite":
+        summary["overwritten"] = counts["conflicting"]
+        summary["inserted"] = written - counts["conflicting"]
+    else:
+        summary["inserted"] = written
+        if on_conflict == "fail" and written < counts["new"]:
+            raise ValueError(f"{counts['new'] - written} rows were added to the database by another upload")
+        summary["skipped"] += counts["new"] - written
+    staging.drop(db.connection())
+    return summary
+
+
+def bulk_insert_dataframe_in_chunks(db: Session, model, data: pd.DataFrame, key_columns: list[str],
+                                    value_columns: list[str], on_conflict: str = "skip", dry_run: bool = False,
+                                    chunk_size: int = bulk_chunk_size):
+    # Keeps each COPY and staging join bounded for long high-frequency series; all chunks share one transaction
+    summary = new_bulk_summary(dry_run=dry_run)
+    for start in range(0, len(data.index), chunk_size):
+        merge_bulk_summaries(summary, bulk_insert_dataframe(
+            db=db, model=model, data=data.iloc[start:start + chunk_size], key_columns=key_columns,
+            value_columns=value_columns, on_conflict=on_conflict, dry_run=dry_run))
+    return summary
+
+
+def upsert_row(db: Session, model, values: dict, key_columns: list[str], on_conflict: str = "fail",
+               commit: bool = True):
+    # Returns the stored row, or None when a row with the same key already existed and was left in place
+    statement = postgresql.insert(model).values(**values)
+    if on_conflict == "overwrite":
+        statement = statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={col: statement.excluded[col] for col in values if col not in key_columns})
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=key_columns)
+    row = db.scalars(statement.returning(model)).first()
+    if commit:
+        db.commit()
+        if row is not None:
+            db.refresh(row)
+    return row
@@ -7,9 +7,13 @@ Created: 2023-07-12
 """
 
 from sqlalchemy.orm import Session
+from sqlalchemy import cast, delete, distinct, func, insert, select, tuple_
+from sqlalchemy.sql import sqltypes
 import datetime as dt
+import pandas as pd
 import pytz
 
+from app import crud
 from app import schemas
 from app import models
 
@@ -97,6 +101,7 @@ def add_cable_manual_read(cable_manual_read: schemas.CableManualReadInput, db: S
                                                    installation_uid=cable_manual_read.installation_uid,
                                                    installation_visit_uid=cable_manual_read.installation_visit_uid,
                                                    temperature=cable_manual_read.temperature,
+                                                   resistance=cable_manual_read.resistance,
                                                    ol=cable_manual_read.ol,
                                                    drift_down=cable_manual_read.drift_down,
                                                    drift_up=cable_manual_read.drift_up)
@@ -106,6 +111,26 @@ def add_cable_manual_read(cable_manual_read: schemas.CableManualReadInput, db: S
     return new_cable_manual_read
 
 
+def get_cable_sensor_types_by_uids(cable_sensor_uids: list[int], db: Session):
+    return db.query(models.CableSensor.cable_sensor_uid, models.CableSensor.sensor_type) \
+        .filter(models.CableSensor.cable_sensor_uid.in_(cable_sensor_uids)).all()
+
+
+def get_cable_manual_reads_by_sensor_and_installation_visit_uids(sensor_uids: list[int],
+                                                                 installation_visit_uids: list[int], db: Session):
+    return db.query(models.CableManualRead.cable_sensor_uid, models.CableManualRead.installation_visit_uid) \
+        .filter(models.CableManualRead.cable_sensor_uid.in_(sensor_uids)
+                & models.CableManualRead.installation_visit_uid.in_(installation_visit_uids)).all()
+
+
+def add_bulk_cable_manual_reads(cable_manual_reads: pd.DataFrame, db: Session):
+    db_cable_manual_reads = db.scalars(insert(models.CableManualRead).returning(models.CableManualRead),
+                                       cable_manual_reads.astype(object).where(cable_manual_reads.notna(), None)
+                                       .to_dict("records")).all()
+    db.commit()
+    return db_cable_manual_reads
+
+
 def get_cable_sensor_by_cable_uid_sensor_number_and_date_visited(cable_uid: int, sensor_number: int,
                                                                  date_visited: dt.datetime, db: Session):
     sensor_records = db.query(models.CableSensor).filter((models.CableSensor.cable_uid == cable_uid)
@@ -140,42 +165,252 @@ def get_cable_logger_data_by_logger_uid_sensor_uid_and_measurement_date(logger_u
                                                    & (models.CableLoggerData.date_time == date_time)).first()
 
 
-def add_cable_logger_data(cable_logger_data: schemas.CableLoggerDataBase, db: Session):
-    new_cable_logger_data = models.CableLoggerData(logger_uid=cable_logger_data.logger_uid,
-                                                   logger_download_uid=cable_logger_data.logger_download_uid,
-                                                   cable_sensor_uid=cable_logger_data.cable_sensor_uid,
-                                                   installation_uid=cable_logger_data.installation_uid,
-                                                   date_time=cable_logger_data.date_time.replace(microsecond=0),
-                                                   temperature=cable_logger_data.temperature)
-    db.add(new_cable_logger_data)
+def add_cable_logger_data(cable_logger_data: schemas.CableLoggerDataBase, db: Session, on_conflict: str = "fail"):
+    values = cable_logger_data.dict()
+    values["date_time"] = cable_logger_data.date_time.replace(microsecond=0)
+    db_cable_logger_data = crud.upsert_row(db=db, model=models.CableLoggerData, values=values,
+                                           key_columns=["cable_sensor_uid", "date_time"], on_conflict=on_conflict,
+                                           commit=False)
+    if db_cable_logger_data is not None:
+        # Only the one day and year of the one sensor are rebuilt, both through the rollup primary keys
+        start, end = crud.rollup_window(pd.Series([values["date_time"]]))
+        refresh_cable_logger_daily_data(db=db, installation_uid=cable_logger_data.installation_uid,
+                                        cable_sensor_uids=[cable_logger_data.cable_sensor_uid], start=start, end=end)
+        refresh_cable_logger_annual_data(db=db, installation_uid=cable_logger_data.installation_uid,
+                                         cable_sensor_uids=[cable_logger_data.cable_sensor_uid],
+                                         years=crud.rollup_years(start, end))
     db.commit()
-    db.refresh(new_cable_logger_data)
-    return new_cable_logger_data
-
-
-def get_cable_logger_data_at_installation(installation_uid: int, db: Session):
-    return db.query(models.CableLoggerData.date_time,
-                    models.CableLoggerData.temperature,
-                    models.Logger.logger_serial_number,
-                    models.CableSensor.number_in_chain,
-                    models.CableSensor.depth) \
+    if db_cable_logger_data is not None:
+        db.refresh(db_cable_logger_data)
+    return db_cable_logger_data
+
+
+def add_bulk_cable_logger_data(data: pd.DataFrame, db: Session, commit: bool = True, on_conflict: str = "skip",
+                               dry_run: bool = False):
+    data = data[["logger_uid", "logger_download_uid", "cable_sensor_uid", "installation_uid", "date_time",
+                 "temperature"]].copy()
+    data["date_time"] = pd.to_datetime(data["date_time"], utc=True).dt.floor("s")
+    summary = crud.bulk_insert_dataframe(db=db, model=models.CableLoggerData, data=data,
+                                         key_columns=["cable_sensor_uid", "date_time"], value_columns=["temperature"],
+                                         on_conflict=on_conflict, dry_run=dry_run)
+    if not dry_run and summary["inserted"] + summary["overwritten"] > 0:
+        start, end = crud.rollup_window(data["date_time"])
+        installation_uids = data["installation_uid"].unique()
+        installation_uid = int(installation_uids[0]) if len(installation_uids) == 1 else None
+        refresh_cable_logger_daily_data(db=db, installation_uid=installation_uid,
+                                        cable_sensor_uids=data["cable_sensor_uid"].unique().tolist(), start=start,
+                                        end=end)
+        refresh_cable_logger_annual_data(db=db, installation_uid=installation_uid,
+                                         cable_sensor_uids=data["cable_sensor_uid"].unique().tolist(),
+                                         years=crud.rollup_years(start, end))
+    if commit:
+        db.commit()
+    return summary
+
+
+def refresh_cable_logger_daily_data(db: Session, installation_uid: int | None = None,
+                                    cable_sensor_uids: list[int] | None = None, start: dt.datetime | None = None,
+                                    end: dt.datetime | None = None):
+    sensors = [(int(cable_sensor_uid),) for cable_sensor_uid in cable_sensor_uids] \
+        if cable_sensor_uids is not None else None
+    return crud.refresh_daily_rollups(db=db, rollup=models.CableLoggerDataDaily, model=models.CableLoggerData,
+                                      sensor_columns=["cable_sensor_uid"], installation_uid=installation_uid,
+                                      sensors=sensors, start=start, end=end)
+
+
+def refresh_cable_logger_annual_data(db: Session, installation_uid: int | None = None,
+                                     cable_sensor_uids: list[int] | None = None, years: list[int] | None = None):
+    """Recomputes the annual statistics of the matching sensors and years from the daily rollups and returns the
+    number of annual rows written. Does not commit."""
+    daily = models.CableLoggerDataDaily
+    annual = models.CableLoggerDataAnnual
+    daily_year = cast(func.extract("year", func.timezone("UTC", daily.date)), sqltypes.Integer)
+
+    def filters(table):
+        clauses = []
+        if installation_uid is not None:
+            clauses.append(table.installation_uid == installation_uid)
+        if cable_sensor_uids is not None:
+            clauses.append(table.cable_sensor_uid.in_([int(sensor_uid) for sensor_uid in cable_sensor_uids]))
+        return clauses
+
+    annual_filters = filters(annual)
+    daily_filters = filters(daily)
+    if years is not None:
+        annual_filters.append(annual.year.in_(years))
+        daily_filters.append(crud.in_years(daily.date, years))
+    db.execute(delete(annual).where(*annual_filters))
+    yearly = select(daily.installation_uid, daily.cable_sensor_uid, daily_year, func.count(), func.sum(daily.count),
+                    func.sum(daily.temperature_sum), func.min(daily.temperature_min),
+                    func.max(daily.temperature_max)) \
+        .where(*daily_filters) \
+        .group_by(daily.installation_uid, daily.cable_sensor_uid, daily_year)
+    return crud.upsert_rollup_rows(db=db, rollup=annual, columns=["installation_uid", "cable_sensor_uid", "year",
+                                                                  "days", "count", "temperature_sum",
+                                                                  "temperature_min", "temperature_max"],
+                                   rows=yearly)
+
+
+def add_cable_logger_file_data(chunks, logger_uid: int, logger_download_uid: int, installation_uid: int,
+                               cable_uid: int, db: Session, progress=None, on_conflict: str = "skip",
+                               dry_run: bool = False):
+    summary = crud.new_bulk_summary(dry_run=dry_run)
+    sensor_uids = {}
+    for chunk in chunks:
+        # Each channel is resolved to a cable sensor once, using the first time it appears in the file
+        for channel in chunk["channel_number"].unique():
+            if channel not in sensor_uids:
+                first_reading = chunk.loc[chunk["channel_number"] == channel, "date_time"].min()
+                db_cable_sensor = get_cable_sensor_by_cable_uid_sensor_number_and_date_visited(
+                    cable_uid=cable_uid, sensor_number=int(channel), date_visited=first_reading.to_pydatetime(), db=db)
+                if db_cable_sensor is None:
+                    raise ValueError(f"Sensor {channel} does not exist in cable UID {cable_uid} on {first_reading}")
+                sensor_uids[channel] = db_cable_sensor.cable_sensor_uid
+        chunk["cable_sensor_uid"] = chunk["channel_number"].map(sensor_uids)
+        chunk["logger_uid"] = logger_uid
+        chunk["logger_download_uid"] = logger_download_uid
+        chunk["installation_uid"] = installation_uid
+        crud.merge_bulk_summaries(summary, add_bulk_cable_logger_data(data=chunk, db=db, commit=False,
+                                                                      on_conflict=on_conflict, dry_run=dry_run))
+        if progress is not None:
+            progress(summary)
+    db.commit()
+    return summary
+
+
+def get_cable_logger_data_at_installation(installation_uid: int, db: Session, start: dt.datetime | None = None,
+                                          end: dt.datetime | None = None, sensor_numbers: list[int] | None = None,
+                                          after: tuple[dt.datetime, int] | None = None, limit: int | None = None,
+                                          stream: bool = False):
+    query = db.query(models.CableLoggerData.date_time,
+                     models.CableLoggerData.temperature,
+                     models.CableLoggerData.cable_sensor_uid,
+                     models.Logger.logger_serial_number,
+                     models.CableSensor.number_in_chain,
+                     models.CableSensor.depth) \
         .join(models.CableSensor) \
         .join(models.Logger) \
-        .filter(models.CableLoggerData.installation_uid == installation_uid).all()
-
-
-def get_cable_manual_read_data_at_installation(installation_uid: int, db: Session):
-    return db.query(models.CableManualRead.resistance,
-                    models.CableManualRead.ol,
-                    models.CableManualRead.drift_up,
-                    models.CableManualRead.drift_down,
-                    models.CableSensor.number_in_chain,
-                    models.CableSensor.depth,
-                    models.CableSensor.sensor_type,
-                    models.InstallationVisit.visit_date) \
+        .filter(models.CableLoggerData.installation_uid == installation_uid)
+    if start is not None:
+        query = query.filter(models.CableLoggerData.date_time >= start)
+    if end is not None:
+        query = query.filter(models.CableLoggerData.date_time < end)
+    if sensor_numbers:
+        query = query.filter(models.CableSensor.number_in_chain.in_(sensor_numbers))
+    if after is not None:
+        # Keyset pagination: resume strictly after the last (date_time, cable_sensor_uid) of the previous page
+        query = query.filter(tuple_(models.CableLoggerData.date_time, models.CableLoggerData.cable_sensor_uid)
+                             > tuple_(*after))
+    query = query.order_by(models.CableLoggerData.date_time, models.CableLoggerData.cable_sensor_uid)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.yield_per(crud.stream_batch_size) if stream else query.all()
+
+
+def get_cable_timeseries_means_at_installations(installation_uids: list[int], frequency: str, db: Session,
+                                                start: dt.datetime | None = None, end: dt.datetime | None = None):
+    """(installation_uid, date, sensor_number, temperature, depth) means of every sensor at the installations"""
+    rollup_means = []
+    rollup = models.CableLoggerDataDaily
+    rollup_installation_uids = crud.get_complete_daily_rollup_installation_uids(db=db, rollup=rollup,
+                                                                                installation_uids=installation_uids)
+    if crud.is_utc_midnight(start) and crud.is_utc_midnight(end) and rollup_installation_uids:
+        # Whole-day ranges are answered from the daily rollups of the installations whose rollups are complete;
+        # partial days and the other installations have to go back to the raw data
+        bucket = crud.time_bucket(rollup.date, frequency).label("date")
+        query = db.query(rollup.installation_uid,
+                         bucket,
+                         models.CableSensor.number_in_chain,
+                         func.sum(rollup.temperature_sum) / func.sum(rollup.count),
+                         func.avg(models.CableSensor.depth)) \
+            .join(models.CableSensor) \
+            .filter(rollup.installation_uid.in_(rollup_installation_uids))
+        if start is not None:
+            query = query.filter(rollup.date >= start)
+        if end is not None:
+            query = query.filter(rollup.date < end)
+        rollup_means = query.group_by(rollup.installation_uid, bucket, models.CableSensor.number_in_chain).all()
+        installation_uids = [uid for uid in installation_uids if uid not in rollup_installation_uids]
+        if not installation_uids:
+            return rollup_means
+    bucket = crud.time_bucket(models.CableLoggerData.date_time, frequency).label("date")
+    query = db.query(models.CableLoggerData.installation_uid,
+                     bucket,
+                     models.CableSensor.number_in_chain,
+                     func.avg(models.CableLoggerData.temperature),
+                     func.avg(models.CableSensor.depth)) \
+        .join(models.CableSensor) \
+        .filter(models.CableLoggerData.installation_uid.in_(installation_uids))
+    if start is not None:
+        query = query.filter(models.CableLoggerData.date_time >= start)
+    if end is not None:
+        query = query.filter(models.CableLoggerData.date_time < end)
+    return rollup_means + query.group_by(models.CableLoggerData.installation_uid, bucket,
+                                         models.CableSensor.number_in_chain).all()
+
+
+def get_cable_timeseries_mean_at_installation(installation_uid: int, frequency: str, db: Session,
+                                              start: dt.datetime | None = None, end: dt.datetime | None = None):
+    return [tuple(row)[1:] for row in get_cable_timeseries_means_at_installations(
+        installation_uids=[installation_uid], frequency=frequency, db=db, start=start, end=end)]
+
+
+def get_cable_annual_statistics_at_installation(installation_uid: int, db: Session, years: list[int] | None = None):
+    """Trumpet curve of the installation: annual minimum, maximum and mean temperature per sensor number, with the
+    fraction of the year's days that have data"""
+    if not crud.get_complete_daily_rollup_installation_uids(db=db, rollup=models.CableLoggerDataDaily,
+                                                            installation_uids=[installation_uid]):
+        # Until the installation's rollups are complete the statistics come from the raw data
+        year = cast(func.extract("year", func.timezone("UTC", models.CableLoggerData.date_time)), sqltypes.Integer)
+        days = func.count(distinct(tuple_(models.CableLoggerData.cable_sensor_uid,
+                                          crud.time_bucket(models.CableLoggerData.date_time, "D"))))
+        query = db.query(year.label("year"),
+                         models.CableSensor.number_in_chain.label("sensor_number"),
+                         func.avg(models.CableSensor.depth).label("depth"),
+                         func.min(models.CableLoggerData.temperature).label("temperature_min"),
+                         func.max(models.CableLoggerData.temperature).label("temperature_max"),
+                         func.avg(models.CableLoggerData.temperature).label("temperature_mean"),
+                         cast(func.least(days / func.extract("doy", func.make_date(year, 12, 31)), 1),
+                              sqltypes.Float).label("coverage"),
+                         func.count().label("count")) \
+            .join(models.CableSensor) \
+            .filter(models.CableLoggerData.installation_uid == installation_uid)
+        if years:
+            query = query.filter(crud.in_years(models.CableLoggerData.date_time, years))
+        return query.group_by(year, models.CableSensor.number_in_chain) \
+            .order_by(year, models.CableSensor.number_in_chain).all()
+    annual = models.CableLoggerDataAnnual
+    days_in_year = func.extract("doy", func.make_date(annual.year, 12, 31))
+    query = db.query(annual.year,
+                     models.CableSensor.number_in_chain.label("sensor_number"),
+                     func.avg(models.CableSensor.depth).label("depth"),
+                     func.min(annual.temperature_min).label("temperature_min"),
+                     func.max(annual.temperature_max).label("temperature_max"),
+                     (func.sum(annual.temperature_sum) / func.sum(annual.count)).label("temperature_mean"),
+                     cast(func.least(func.sum(annual.days) / days_in_year, 1), sqltypes.Float).label("coverage"),
+                     func.sum(annual.count).label("count")) \
+        .join(models.CableSensor) \
+        .filter(annual.installation_uid == installation_uid)
+    if years:
+        query = query.filter(annual.year.in_(years))
+    return query.group_by(annual.year, models.CableSensor.number_in_chain) \
+        .order_by(annual.year, models.CableSensor.number_in_chain).all()
+
+
+def get_cable_manual_read_data_at_installation(installation_uid: int, db: Session, stream: bool = False):
+    query = db.query(models.CableManualRead.resistance,
+                     models.CableManualRead.ol,
+                     models.CableManualRead.drift_up,
+                     models.CableManualRead.drift_down,
+                     models.CableSensor.number_in_chain,
+                     models.CableSensor.depth,
+                     models.CableSensor.sensor_type,
+                     models.InstallationVisit.visit_date) \
         .join(models.CableSensor) \
         .join(models.InstallationVisit) \
-        .filter(models.CableManualRead.installation_uid == installation_uid).all()
+        .filter(models.CableManualRead.installation_uid == installation_uid) \
+        .order_by(models.InstallationVisit.visit_date, models.CableSensor.number_in_chain)
+    return query.yield_per(crud.stream_batch_size) if stream else query.all()
 
 
 def get_cable_data_by_sensor_uid_and_measurement_date(sensor_uid: int, date_time: dt.datetime, db: Session):
@@ -217,6 +452,22 @@ def add_cable_sensor_mapping(cable_sensor_mapping: schemas.CableSensorMappingBas
     return new_cable_sensor_mapping
 
 
+def get_cable_sensor_mappings_of_all_cables(db: Session):
+    """(installation_uid, cable_uid, connector_type, number_in_chain, mapping_1, mapping_2) of every cable, with one
+    row of None mappings for cables that have none. The mappings of a cable come oldest first."""
+    return db.query(models.Cable.installation_uid,
+                    models.Cable.cable_uid,
+                    models.Cable.connector_type,
+                    models.CableSensor.number_in_chain,
+                    models.CableSensorMapping.mapping_1,
+                    models.CableSensorMapping.mapping_2) \
+        .outerjoin(models.CableSensorMapping, models.Cable.cable_uid == models.CableSensorMapping.cable_uid) \
+        .outerjoin(models.CableSensor,
+                   models.CableSensorMapping.cable_sensor_uid == models.CableSensor.cable_sensor_uid) \
+        .order_by(models.Cable.installation_uid, models.Cable.cable_uid,
+                  models.CableSensorMapping.cable_sensor_mapping_uid).all()
+
+
 def get_cable_sensor_mappings_of_cable(cable_uid: int, db: Session):
     return db.query(models.CableSensorMapping.cable_sensor_uid,
                     models.CableSensorMapping.mapping_1,
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+import datetime as dt
+import pandas as pd
+
+from app import crud
+from app import schemas
+from app import models
+
+
+def get_four_channel_sensor_by_uid(db: Session, four_channel_sensor_uid: int):
+    return db.query(models.FourChannelSensor) \
+        .filter(models.FourChannelSensor.four_channel_sensor_uid == four_channel_sensor_uid).first()
+
+
+def get_four_channel_sensor_by_installation_channel_and_date_installed(db: Session, installation_uid: int,
+                                                                      channel_number: int,
+                                                                      date_installed: dt.datetime):
+    return db.query(models.FourChannelSensor) \
+        .filter((models.FourChannelSensor.installation_uid == installation_uid)
+                & (models.FourChannelSensor.channel_number == channel_number)
+                & (models.FourChannelSensor.date_installed == date_installed)).first()
+
+
+def get_all_four_channel_sensors_at_installation(db: Session, installation_uid: int):
+    return db.query(models.FourChannelSensor) \
+        .filter(models.FourChannelSensor.installation_uid == installation_uid) \
+        .order_by(models.FourChannelSensor.channel_number, models.FourChannelSensor.date_installed).all()
+
+
+def add_four_channel_sensor(db: Session, four_channel_sensor: schemas.FourChannelSensorBase):
+    new_four_channel_sensor = models.FourChannelSensor(
+        installation_uid=four_channel_sensor.installation_uid,
+        date_installed=four_channel_sensor.date_installed.replace(microsecond=0),
+        depth=four_channel_sensor.depth,
+        channel_number=four_channel_sensor.channel_number)
+    db.add(new_four_channel_sensor)
+    db.commit()
+    db.refresh(new_four_channel_sensor)
+    return new_four_channel_sensor
+
+
+def resolve_four_channel_sensor_uids(data: pd.DataFrame, db: Session):
+    # Each reading belongs to the most recent sensor installed on its channel at or before the reading
+    if data.empty:
+        return data.assign(four_channel_sensor_uid=pd.Series(dtype=int))
+    sensors = pd.DataFrame(
+        db.query(models.FourChannelSensor.four_channel_sensor_uid,
+                 models.FourChannelSensor.installation_uid,
+                 models.FourChannelSensor.channel_number,
+                 models.FourChannelSensor.date_installed)
+        .filter(models.FourChannelSensor.installation_uid.in_(data["installation_uid"].unique().tolist())).all(),
+        columns=["four_channel_sensor_uid", "installation_uid", "channel_number", "date_installed"])
+    if sensors.empty:
+        raise ValueError(f"No four channel sensors exist at installation UIDs "
+                         f"{data['installation_uid'].unique().tolist()}")
+    sensors["date_installed"] = pd.to_datetime(sensors["date_installed"], utc=True)
+    data = pd.merge_asof(data.sort_values("date_time"), sensors.sort_values("date_installed"),
+                         left_on="date_time", right_on="date_installed", by=["installation_uid", "channel_number"],
+                         direction="backward")
+    unresolved = data.loc[data["four_channel_sensor_uid"].isna()]
+    if not unresolved.empty:
+        first = unresolved.iloc[0]
+        raise ValueError(f"No sensor installed on channel {first['channel_number']} at installation UID "
+                         f"{first['installation_uid']} on {first['date_time']} ({len(unresolved.index)} rows)")
+    return data.astype({"four_channel_sensor_uid": int})
+
+
+def add_bulk_four_channel_data(data: pd.DataFrame, db: Session, commit: bool = True, on_conflict: str = "skip"):
+    data = data[["logger_uid", "logger_download_uid", "installation_uid", "channel_number", "date_time",
+                 "temperature"]].copy()
+    data["date_time"] = pd.to_datetime(data["date_time"], utc=True).dt.floor("s")
+    data = resolve_four_channel_sensor_uids(data=data.astype({"installation_uid": int, "channel_number": int}), db=db)
+    data = data[["logger_uid", "logger_download_uid", "installation_uid", "four_channel_sensor_uid", "date_time",
+                 "temperature"]]
+    summary = crud.bulk_insert_dataframe(db=db, model=models.FourChannelData, data=data,
+                                         key_columns=["four_channel_sensor_uid", "date_time"],
+                                         value_columns=["temperature"], on_conflict=on_conflict)
+    if commit:
+        db.commit()
+    return summary
+
+
+def get_four_channel_data_at_installation(installation_uid: int, db: Session, start: dt.datetime | None = None,
+                                          end: dt.datetime | None = None):
+    query = db.query(models.FourChannelData.date_time,
+                     models.FourChannelData.temperature,
+                     models.Logger.logger_serial_number.label("logger_sn"),
+                     models.FourChannelSensor.channel_number.label("sensor_number"),
+                     models.FourChannelSensor.depth.label("sensor_depth")) \
+        .join(models.FourChannelSensor) \
+        .join(models.Logger) \
+        .filter(models.FourChannelData.installation_uid == installation_uid)
+    if start is not None:
+        query = query.filter(models.FourChannelData.date_time >= start)
+    if end is not None:
+        query = query.filter(models.FourChannelData.date_time < end)
+    return query.order_by(models.FourChannelData.date_time, models.FourChannelSensor.channel_number).all()
+
+
+def get_four_channel_timeseries_mean_at_installation(installation_uid: int, frequency: str, db: Session,
+                                                     start: dt.datetime | None = None,
+                                                     end: dt.datetime | None = None):
+    bucket = crud.time_bucket(models.FourChannelData.date_time, frequency).label("date")
+    query = db.query(bucket,
+                     models.FourChannelSensor.channel_number,
+                     func.avg(models.FourChannelData.temperature),
+                     func.avg(models.FourChannelSensor.depth)) \
+        .join(models.FourChannelSensor) \
+        .filter(models.FourChannelData.installation_uid == installation_uid)
+    if start is not None:
+        query = query.filter(models.FourChannelData.date_time >= start)
+    if end is not None:
+        query = query.filter(models.FourChannelData.date_time < end)
+    return query.group_by(bucket, models.FourChannelSensor.channel_number).all()
@@ -7,7 +7,8 @@ Created: 2023-06-20
 """
 import pandas as pd
 from sqlalchemy.orm import Session, aliased
-from sqlalchemy import extract
+from sqlalchemy import extract, func, inspect, select, text
+from sqlalchemy.schema import AddConstraint
 import datetime as dt
 
 from app import crud
@@ -16,6 +17,57 @@ from app import models
 
 
 
+def create_missing_tables(db: Session, tables: list):
+    """Creates any of the model tables that do not exist yet in the database and returns the models created; existing
+    tables are left untouched"""
+    created = []
+    for table in tables:
+        if not inspect(db.get_bind()).has_table(table.__tablename__):
+            table.__table__.create(bind=db.get_bind())
+            created.append(table)
+    return created
+
+
+def add_missing_schema_objects(db: Session, schema_objects: list[tuple]):
+    """Adds the (model, name) nullable columns, indexes and unique constraints declared on the models that are missing
+    from the database. Unique constraints are skipped while the table still holds duplicate keys; the names of the
+    skipped ones are returned."""
+    skipped = []
+    engine = db.get_bind()
+    for model, name in schema_objects:
+        table = model.__table__
+        inspector = inspect(engine)
+        if not inspector.has_table(table.name):
+            # Tables that don't exist yet are created whole by create_missing_tables
+            continue
+        if name in table.columns:
+            if name not in [column["name"] for column in inspector.get_columns(table.name)]:
+                with engine.begin() as connection:
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} "
+                                            f"{table.columns[name].type.compile(dialect=engine.dialect)}"))
+            continue
+        indexes = inspector.get_indexes(table.name)
+        unique_constraints = inspector.get_unique_constraints(table.name)
+        if name in [index["name"] for index in indexes + unique_constraints]:
+            continue
+        index = next((index for index in table.indexes if index.name == name), None)
+        if index is not None:
+            index.create(bind=engine)
+            continue
+        constraint = next(constraint for constraint in table.constraints if constraint.name == name)
+        key_columns = list(constraint.columns)
+        # A unique index or constraint on the same columns under another name serves ON CONFLICT just as well
+        if [column.name for column in key_columns] in [index["column_names"] for index in unique_constraints
+                                                       + [index for index in indexes if index["unique"]]]:
+            continue
+        with engine.begin() as connection:
+            if connection.execute(select(*key_columns).group_by(*key_columns).having(func.count() > 1)).first():
+                skipped.append(name)
+                continue
+            connection.execute(AddConstraint(constraint))
+    return skipped
+
+
 def get_site_by_uid(db: Session, site_uid: int):
     return db.query(models.Site).filter(models.Site.site_uid == site_uid).first()
 
@@ -48,6 +100,10 @@ def add_installation(db: Session, installation: schemas.InstallationBase):
                                            notes=installation.notes,
                                            status=installation.status)
     db.add(new_installation)
+    db.flush()
+    # A new installation has no data yet, so its daily rollups are complete from the start
+    for rollup in [models.CableLoggerDataDaily, models.AirGroundTemperatureDataDaily]:
+        crud.mark_daily_rollups_complete(db=db, rollup=rollup, installation_uid=new_installation.installation_uid)
     db.commit()
     db.refresh(new_installation)
     return new_installation
@@ -247,6 +303,14 @@ def get_logger_download_by_uid(logger_download_uid: int, db: Session):
         .filter(models.LoggerDownload.logger_download_uid == logger_download_uid).first()
 
 
+def get_logger_downloads_by_uids(logger_download_uids: list[int], db: Session):
+    return db.query(models.LoggerDownload.logger_download_uid,
+                    models.LoggerDownload.logger_uid,
+                    models.LoggerDeployment.installation_uid) \
+        .join(models.LoggerDeployment) \
+        .filter(models.LoggerDownload.logger_download_uid.in_(logger_download_uids)).all()
+
+
 def get_logger_download_by_deployment_uid(deployment_uid: int, db: Session):
     return db.query(models.LoggerDownload).filter(models.LoggerDownload.logger_deployment_uid == deployment_uid).first()
 
@@ -262,23 +326,45 @@ def add_logger_download(logger_download: schemas.LoggerDownloadBase, db: Session
     return new_logger_download
 
 
-def get_logger_history_at_installation(installation_uid: int, db: Session):
+def get_logger_history_at_installation(installation_uid: int, db: Session, stream: bool = False):
     deployment_loggers = aliased(models.Logger)
     deployment_records = aliased(models.LoggerDeployment)
     extraction_loggers = aliased(models.Logger)
     extraction_records = aliased(models.LoggerDeployment)
-
-    return db.query(models.InstallationVisit.installation_visit_uid,
-                    models.InstallationVisit.visit_date,
-                    models.InstallationVisit.field_party,
-                    models.InstallationVisit.record_of_activities,
-                    models.InstallationVisit.notes,
-                    deployment_records.logger_uid.label("logger_deployed_uid"),
-                    deployment_loggers.logger_serial_number.label("logger_deployed"),
-                    deployment_loggers.logger_type.label("logger_deployed_type"),
-                    extraction_records.logger_uid.label("logger_extracted_uid"),
-                    extraction_loggers.logger_serial_number.label("logger_extracted"),
-                    extraction_loggers.logger_type.label("logger_extracted_type")) \
+    # One summary row per visit so the probe measurements don't multiply the visit rows
+    al_probes = db.query(models.ALProbeMeasurement.installation_visit_uid,
+                         func.count().label("al_probe_count"),
+                         func.avg(models.ALProbeMeasurement.measurement).label("al_probe_mean_depth"),
+                         func.max(models.ALProbeMeasurement.measurement).label("al_probe_max_depth"),
+                         func.count().filter(models.ALProbeMeasurement.probe_maxed).label("al_probes_maxed")) \
+        .group_by(models.ALProbeMeasurement.installation_visit_uid).subquery()
+    # Likewise one row per deployment for its downloads: the quality of the latest one and how many there were
+    downloads = db.query(models.LoggerDownload.logger_deployment_uid,
+                         models.LoggerDownload.download_quality,
+                         func.count().over(partition_by=models.LoggerDownload.logger_deployment_uid)
+                         .label("download_count")) \
+        .distinct(models.LoggerDownload.logger_deployment_uid) \
+        .order_by(models.LoggerDownload.logger_deployment_uid, models.LoggerDownload.download_date.desc(),
+                  models.LoggerDownload.logger_download_uid.desc()).subquery()
+
+    query = db.query(models.InstallationVisit.installation_visit_uid,
+                     models.InstallationVisit.visit_date,
+                     models.InstallationVisit.field_party,
+                     models.InstallationVisit.record_of_activities,
+                     models.InstallationVisit.notes,
+                     deployment_records.logger_uid.label("logger_deployed_uid"),
+                     deployment_loggers.logger_serial_number.label("logger_deployed"),
+                     deployment_loggers.logger_type.label("logger_deployed_type"),
+                     extraction_records.logger_uid.label("logger_extracted_uid"),
+                     extraction_loggers.logger_serial_number.label("logger_extracted"),
+                     extraction_loggers.logger_type.label("logger_extracted_type"),
+                     models.StickUp.measurement.label("stick_up"),
+                     downloads.c.download_quality,
+                     downloads.c.download_count,
+                     al_probes.c.al_probe_count,
+                     al_probes.c.al_probe_mean_depth,
+                     al_probes.c.al_probe_max_depth,
+                     al_probes.c.al_probes_maxed) \
         .outerjoin(deployment_records,
                    models.InstallationVisit.installation_visit_uid == deployment_records.deployment_visit_uid) \
         .outerjoin(deployment_loggers,
@@ -289,7 +375,13 @@ def get_logger_history_at_installation(installation_uid: int, db: Session):
         .outerjoin(extraction_loggers,
                    (models.InstallationVisit.installation_visit_uid == extraction_records.extraction_visit_uid)
                    & (extraction_records.logger_uid == extraction_loggers.logger_uid)) \
-        .filter(models.InstallationVisit.installation_uid == installation_uid).all()
+        .outerjoin(models.StickUp,
+                   models.InstallationVisit.installation_visit_uid == models.StickUp.installation_visit_uid) \
+        .outerjoin(downloads, extraction_records.logger_deployment_uid == downloads.c.logger_deployment_uid) \
+        .outerjoin(al_probes, models.InstallationVisit.installation_visit_uid == al_probes.c.installation_visit_uid) \
+        .filter(models.InstallationVisit.installation_uid == installation_uid) \
+        .order_by(models.InstallationVisit.visit_date)
+    return query.yield_per(crud.stream_batch_size) if stream else query.all()
 
 
 def get_al_probe_history_at_installation(installation_uid: int, db: Session):
@@ -309,6 +401,18 @@ def get_all_installations_of_type(installation_type: str, db: Session):
     return db.query(models.Installation).filter(models.Installation.installation_type == installation_type).all()
 
 
+def get_installation_uids(installation_types: list[str], db: Session, site_uid: int | None = None,
+                          region: str | None = None):
+    query = db.query(models.Installation.installation_uid) \
+        .filter(models.Installation.installation_type.in_(installation_types))
+    if site_uid is not None:
+        query = query.filter(models.Installation.site_uid == site_uid)
+    if region is not None:
+        query = query.join(models.Site, models.Installation.site_uid == models.Site.site_uid) \
+            .filter(models.Site.region == region)
+    return [row.installation_uid for row in query.order_by(models.Installation.installation_uid).all()]
+
+
 def get_most_recent_installation_visit_at_installation(installation_uid: int, db: Session):
     installation_visits = db.query(models.InstallationVisit) \
         .filter(models.InstallationVisit.installation_uid == installation_uid).all()
@@ -318,30 +422,43 @@ def get_most_recent_installation_visit_at_installation(installation_uid: int, db
     return None
 
 
-def get_all_installation_visits_in_year(year: int, db: Session):
+def get_most_recent_installation_visits_of_type(installation_type: str, db: Session):
+    """(installation_uid, notes) of the latest visit to every installation of the type"""
+    return db.query(models.InstallationVisit.installation_uid,
+                    models.InstallationVisit.notes) \
+        .join(models.Installation, models.InstallationVisit.installation_uid == models.Installation.installation_uid) \
+        .filter(models.Installation.installation_type == installation_type) \
+        .distinct(models.InstallationVisit.installation_uid) \
+        .order_by(models.InstallationVisit.installation_uid, models.InstallationVisit.visit_date.desc().nulls_last()) \
+        .all()
+
+
+def get_installation_visit_dump(db: Session, year: int | None = None, regions: list[str] | None = None,
+                                stream: bool = False):
+    """Every visit in a year, or else the most recent visit to each installation in the given regions"""
     deployment_loggers = aliased(models.Logger)
     deployment_records = aliased(models.LoggerDeployment)
     extraction_loggers = aliased(models.Logger)
     extraction_records = aliased(models.LoggerDeployment)
 
-    return db.query(models.InstallationVisit.field_party,
-                    models.InstallationVisit.visit_date,
-                    models.InstallationVisit.record_of_activities,
-                    models.InstallationVisit.notes,
-                    models.Installation.installation_name,
-                    models.Installation.installation_code,
-                    models.Installation.installation_type,
-                    models.Installation.latitude,
-                    models.Installation.longitude,
-                    deployment_records.logger_uid.label("logger_deployed_uid"),
-                    deployment_loggers.logger_serial_number.label("logger_deployed"),
-                    deployment_loggers.logger_type.label("logger_type_deployed"),
-                    deployment_loggers.battery_year.label("logger_deployed_battery_year"),
-                    extraction_records.logger_uid.label("logger_extracted_uid"),
-                    extraction_loggers.logger_serial_number.label("logger_extracted"),
-                    extraction_loggers.logger_type.label("logger_type_extracted"),
-                    models.Cable.connector_type,
-                    models.StickUp.measurement.label("stick_up")) \
+    query = db.query(models.InstallationVisit.field_party,
+                     models.InstallationVisit.visit_date,
+                     models.InstallationVisit.record_of_activities,
+                     models.InstallationVisit.notes,
+                     models.Installation.installation_name,
+                     models.Installation.installation_code,
+                     models.Installation.installation_type,
+                     models.Installation.latitude,
+                     models.Installation.longitude,
+                     deployment_records.logger_uid.label("logger_deployed_uid"),
+                     deployment_loggers.logger_serial_number.label("logger_deployed"),
+                     deployment_loggers.logger_type.label("logger_type_deployed"),
+                     deployment_loggers.battery_year.label("logger_deployed_battery_year"),
+                     extraction_records.logger_uid.label("logger_extracted_uid"),
+                     extraction_loggers.logger_serial_number.label("logger_extracted"),
+                     extraction_loggers.logger_type.label("logger_type_extracted"),
+                     models.Cable.connector_type,
+                     models.StickUp.measurement.label("stick_up")) \
         .outerjoin(models.Installation,
                    models.InstallationVisit.installation_uid == models.Installation.installation_uid) \
         .outerjoin(deployment_records,
@@ -356,67 +473,31 @@ def get_all_installation_visits_in_year(year: int, db: Session):
                    & (extraction_records.logger_uid == extraction_loggers.logger_uid)) \
         .outerjoin(models.Cable, models.InstallationVisit.installation_uid == models.Cable.installation_uid) \
         .outerjoin(models.StickUp,
-                   models.InstallationVisit.installation_visit_uid == models.StickUp.installation_visit_uid) \
-        .filter(extract('year', models.InstallationVisit.visit_date) == year).all()
+                   models.InstallationVisit.installation_visit_uid == models.StickUp.installation_visit_uid)
+    if year is not None:
+        query = query.filter(extract('year', models.InstallationVisit.visit_date) == year) \
+            .order_by(models.InstallationVisit.visit_date)
+    else:
+        query = query.join(models.Site, models.Installation.site_uid == models.Site.site_uid) \
+            .filter(models.Site.region.in_(regions)) \
+            .distinct(models.Installation.installation_code) \
+            .order_by(models.Installation.installation_code, models.InstallationVisit.visit_date.desc())
+    return query.yield_per(crud.stream_batch_size) if stream else query.all()
 
 
-def get_dump_for_region(region: str, db: Session):
-    deployment_loggers = aliased(models.Logger)
-    deployment_records = aliased(models.LoggerDeployment)
-    extraction_loggers = aliased(models.Logger)
-    extraction_records = aliased(models.LoggerDeployment)
+def get_all_installation_visits_in_year(year: int, db: Session):
+    return get_installation_visit_dump(year=year, db=db)
 
-    data = db.query(models.InstallationVisit.field_party,
-                    models.InstallationVisit.visit_date,
-                    models.InstallationVisit.record_of_activities,
-                    models.InstallationVisit.notes,
-                    models.Installation.installation_name,
-                    models.Installation.installation_code,
-                    models.Installation.installation_type,
-                    models.Installation.latitude,
-                    models.Installation.longitude,
-                    deployment_records.logger_uid.label("logger_deployed_uid"),
-                    deployment_loggers.logger_serial_number.label("logger_deployed"),
-                    deployment_loggers.logger_type.label("logger_type_deployed"),
-                    deployment_loggers.battery_year.label("logger_deployed_battery_year"),
-                    extraction_records.logger_uid.label("logger_extracted_uid"),
-                    extraction_loggers.logger_serial_number.label("logger_extracted"),
-                    extraction_loggers.logger_type.label("logger_type_extracted"),
-                    models.Cable.connector_type,
-                    models.StickUp.measurement.label("stick_up"),
-                    models.Site.region) \
-        .outerjoin(models.Installation,
-                   models.InstallationVisit.installation_uid == models.Installation.installation_uid) \
-        .outerjoin(deployment_records,
-                   models.InstallationVisit.installation_visit_uid == deployment_records.deployment_visit_uid) \
-        .outerjoin(deployment_loggers,
-                   (models.InstallationVisit.installation_visit_uid == deployment_records.deployment_visit_uid)
-                   & (deployment_records.logger_uid == deployment_loggers.logger_uid)) \
-        .outerjoin(extraction_records,
-                   models.InstallationVisit.installation_visit_uid == extraction_records.extraction_visit_uid) \
-        .outerjoin(extraction_loggers,
-                   (models.InstallationVisit.installation_visit_uid == extraction_records.extraction_visit_uid)
-                   & (extraction_records.logger_uid == extraction_loggers.logger_uid)) \
-        .outerjoin(models.Cable, models.InstallationVisit.installation_uid == models.Cable.installation_uid) \
-        .outerjoin(models.StickUp,
-                   models.InstallationVisit.installation_visit_uid == models.StickUp.installation_visit_uid) \
-        .outerjoin(models.Site,
-                   (models.InstallationVisit.installation_uid == models.Installation.installation_uid)
-                   & (models.Installation.site_uid == models.Site.site_uid)) \
-        .filter(models.Site.region == region).all()
 
-    data_df = pd.DataFrame(data,
+def get_dump_for_region(region: str, db: Session):
+    data_df = pd.DataFrame(get_installation_visit_dump(regions=[region], db=db),
                            columns=["recorded_by", "visit_date", "record_of_activities", "notes", "installation_name",
                                     "installation_code", "installation_type", "latitude", "longitude",
                                     "logger_deployed_uid", "logger_deployed", "logger_type_deployed",
                                     "logger_deployed_battery_year", "logger_extracted_uid", "logger_extracted",
-                                    "logger_type_extracted", "connector_type", "stick_up", "region"])
-    output_df = pd.DataFrame(columns=data_df.columns)
-    for code in data_df["installation_code"].unique():
-        subset = data_df.loc[data_df["installation_code"] == code]
-
-        output_df.loc[len(output_df.index)] = subset.loc[subset["visit_date"] == subset["visit_date"].max()].iloc[0]
-    return output_df
+                                    "logger_type_extracted", "connector_type", "stick_up"])
+    data_df["region"] = region
+    return data_df
 
 
 def get_readable_logger_deployments(logger_deployment_uid_list: list[int], db: Session):
@@ -473,6 +554,29 @@ def get_logger_currently_deployed(installation_uid: int, db: Session):
         return None
 
 
+def get_loggers_currently_deployed_of_type(installation_type: str, db: Session):
+    """(installation_uid, logger_serial_number, logger_type) of the most recently deployed logger that has not been
+    extracted, at every installation of the type"""
+    deployment_visits = aliased(models.InstallationVisit)
+    extraction_visits = aliased(models.InstallationVisit)
+    rank = func.row_number().over(partition_by=models.LoggerDeployment.installation_uid,
+                                  order_by=[deployment_visits.visit_date.desc().nulls_last(),
+                                            models.LoggerDeployment.logger_deployment_uid.desc()]).label("rank")
+    deployments = db.query(models.LoggerDeployment.installation_uid, models.LoggerDeployment.logger_uid, rank) \
+        .join(models.Installation, models.LoggerDeployment.installation_uid == models.Installation.installation_uid) \
+        .outerjoin(deployment_visits,
+                   models.LoggerDeployment.deployment_visit_uid == deployment_visits.installation_visit_uid) \
+        .outerjoin(extraction_visits,
+                   models.LoggerDeployment.extraction_visit_uid == extraction_visits.installation_visit_uid) \
+        .filter((models.Installation.installation_type == installation_type)
+                & extraction_visits.visit_date.is_(None)).subquery()
+    return db.query(deployments.c.installation_uid,
+                    models.Logger.logger_serial_number,
+                    models.Logger.logger_type) \
+        .join(models.Logger, deployments.c.logger_uid == models.Logger.logger_uid) \
+        .filter(deployments.c.rank == 1).all()
+
+
 def get_all_visits_to_installation(installation_uid: int, db: Session):
     return db.query(models.InstallationVisit) \
         .filter(models.InstallationVisit.installation_uid == installation_uid).all()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+from sqlalchemy.orm import Session
+import datetime as dt
+
+from app import schemas
+from app import models
+
+
+def add_ingestion_job(db: Session, ingestion_job: schemas.IngestionJobBase, worker_id: str | None = None):
+    new_ingestion_job = models.IngestionJob(job_type=ingestion_job.job_type,
+                                            description=ingestion_job.description,
+                                            submitted_at=dt.datetime.now(dt.timezone.utc).replace(microsecond=0),
+                                            worker_id=worker_id)
+    db.add(new_ingestion_job)
+    db.commit()
+    db.refresh(new_ingestion_job)
+    return new_ingestion_job
+
+
+def get_ingestion_job_by_uid(db: Session, ingestion_job_uid: int):
+    return db.query(models.IngestionJob).filter(models.IngestionJob.ingestion_job_uid == ingestion_job_uid).first()
+
+
+def get_ingestion_jobs(db: Session, status: str | None = None, limit: int = 100):
+    query = db.query(models.IngestionJob)
+    if status is not None:
+        query = query.filter(models.IngestionJob.status == status)
+    return query.order_by(models.IngestionJob.ingestion_job_uid.desc()).limit(limit).all()
+
+
+def start_ingestion_job(db: Session, ingestion_job_uid: int):
+    db_ingestion_job = get_ingestion_job_by_uid(db=db, ingestion_job_uid=ingestion_job_uid)
+    db_ingestion_job.status = "running"
+    db_ingestion_job.started_at = dt.datetime.now(dt.timezone.utc)
+    db.commit()
+    db.refresh(db_ingestion_job)
+    return db_ingestion_job
+
+
+def update_ingestion_job_progress(db: Session, ingestion_job_uid: int, summary: dict, percent_complete: float):
+    db_ingestion_job = get_ingestion_job_by_uid(db=db, ingestion_job_uid=ingestion_job_uid)
+    db_ingestion_job.rows_received = summary["received"]
+    db_ingestion_job.rows_inserted = summary["inserted"]
+    db_ingestion_job.rows_skipped = summary["skipped"]
+    db_ingestion_job.rows_conflicting = summary["conflicting"]
+    db_ingestion_job.rows_overwritten = summary["overwritten"]
+    db_ingestion_job.percent_complete = percent_complete
+    db.commit()
+    db.refresh(db_ingestion_job)
+    return db_ingestion_job
+
+
+def finish_ingestion_job(db: Session, ingestion_job_uid: int, status: str, message: str | None = None):
+    db_ingestion_job = get_ingestion_job_by_uid(db=db, ingestion_job_uid=ingestion_job_uid)
+    db_ingestion_job.status = status
+    db_ingestion_job.finished_at = dt.datetime.now(dt.timezone.utc)
+    if status == "succeeded":
+        db_ingestion_job.percent_complete = 100
+    db_ingestion_job.message = message
+    db.commit()
+    db.refresh(db_ingestion_job)
+    return db_ingestion_job
+
+
+def request_ingestion_job_cancel(db: Session, ingestion_job_uid: int):
+    db_ingestion_job = get_ingestion_job_by_uid(db=db, ingestion_job_uid=ingestion_job_uid)
+    db_ingestion_job.cancel_requested = True
+    db.commit()
+    db.refresh(db_ingestion_job)
+    return db_ingestion_job
+
+
+def get_active_ingestion_jobs(db: Session, job_type: str):
+    return db.query(models.IngestionJob) \
+        .filter((models.IngestionJob.job_type == job_type) & models.IngestionJob.status.in_(["queued", "running"])) \
+        .all()
+
+
+def renew_ingestion_job_leases(db: Session, worker_id: str):
+    db.query(models.IngestionJob) \
+        .filter((models.IngestionJob.worker_id == worker_id) & models.IngestionJob.status.in_(["queued", "running"])) \
+        .update({models.IngestionJob.heartbeat_at: dt.datetime.now(dt.timezone.utc)}, synchronize_session=False)
+    db.commit()
+
+
+def fail_interrupted_ingestion_jobs(db: Session, lease: dt.timedelta):
+    """Fails the queued and running jobs whose worker has not renewed their lease in time, i.e. whose API process
+    stopped; jobs of the other live processes are left alone"""
+    interrupted = db.query(models.IngestionJob) \
+        .filter(models.IngestionJob.status.in_(["queued", "running"])
+                & (models.IngestionJob.heartbeat_at.is_(None)
+                   | (models.IngestionJob.heartbeat_at < dt.datetime.now(dt.timezone.utc) - lease))).all()
+    for db_ingestion_job in interrupted:
+        db_ingestion_job.status = "failed"
+        db_ingestion_job.finished_at = dt.datetime.now(dt.timezone.utc)
+        db_ingestion_job.message = "Interrupted by an API restart. Resubmit to skip the rows already loaded."
+    db.commit()
+    return interrupted
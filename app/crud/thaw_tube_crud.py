@@ -7,7 +7,9 @@ Created: 2023-06-28
 """
 
 from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func, select, tuple_
 import datetime as dt
+import pandas as pd
 
 from app import schemas
 from app import models
@@ -134,12 +136,131 @@ def get_thaw_tube_readings_at_installation(db: Session, installation_uid: int):
         .filter(models.InstallationVisit.installation_uid == installation_uid).all()
 
 
-def get_thaw_tube_bead_history(db: Session, thaw_tube_uid: int):
-    return db.query(models.ThawTubeBeadMeasurement.year,
+def get_thaw_tube_bead_histories(db: Session, thaw_tube_uids: list[int]):
+    return db.query(models.ThawTubeBeadMeasurement.thaw_tube_uid,
+                    models.ThawTubeBeadMeasurement.year,
                     models.ThawTubeBeadMeasurement.colour,
                     models.ThawTubeBeadMeasurement.depth,
                     models.ThawTubeBeadMeasurement.depth_max,
                     models.ThawTubeBeadMeasurement.depth_min,
-                    models.ThawTubeReading.installation_visit_uid) \
+                    models.InstallationVisit.visit_date) \
+        .select_from(models.ThawTubeBeadMeasurement) \
         .join(models.ThawTubeReading) \
-        .filter(models.ThawTubeBeadMeasurement.thaw_tube_uid == thaw_tube_uid).all()
+        .join(models.InstallationVisit,
+              models.ThawTubeReading.installation_visit_uid == models.InstallationVisit.installation_visit_uid) \
+        .filter(models.ThawTubeBeadMeasurement.thaw_tube_uid.in_(thaw_tube_uids)) \
+        .order_by(models.ThawTubeBeadMeasurement.thaw_tube_uid, models.InstallationVisit.visit_date,
+                  models.ThawTubeBeadMeasurement.year).all()
+
+
+def get_thaw_tube_bead_history(db: Session, thaw_tube_uid: int):
+    return [bead[1:] for bead in get_thaw_tube_bead_histories(db=db, thaw_tube_uids=[thaw_tube_uid])]
+
+
+def get_thaw_tube_readings_of_thaw_tubes(db: Session, thaw_tube_uids: list[int] | None = None,
+                                         year: int | None = None):
+    query = db.query(models.ThawTubeReading.thaw_tube_uid,
+                     models.InstallationVisit.visit_date,
+                     models.InstallationVisit.field_party,
+                     models.InstallationVisit.record_of_activities,
+                     models.InstallationVisit.notes,
+                     models.ThawTubeReading.thaw_tube_reading_uid,
+                     models.ThawTubeReading.tube_height,
+                     models.ThawTubeReading.ice_depth,
+                     models.ThawTubeReading.scribe_min,
+                     models.ThawTubeReading.scribe_curr,
+                     models.ThawTubeReading.scribe_max) \
+        .join(models.ThawTubeReading)
+    if thaw_tube_uids is not None:
+        query = query.filter(models.ThawTubeReading.thaw_tube_uid.in_(thaw_tube_uids))
+    if year is not None:
+        start = dt.datetime(year, 1, 1, tzinfo=dt.timezone.utc)
+        query = query.filter((models.InstallationVisit.visit_date >= start)
+                             & (models.InstallationVisit.visit_date < start.replace(year=year + 1)))
+    return query.order_by(models.InstallationVisit.visit_date, models.ThawTubeReading.thaw_tube_reading_uid).all()
+
+
+def get_thaw_tube_bead_depths_of_thaw_tubes(db: Session, thaw_tube_uids: list[int] | None = None,
+                                            year: int | None = None):
+    """(thaw_tube_reading_uid, year, depth) of the bead measurements, optionally only the previous year's beads read
+    in the year"""
+    query = db.query(models.ThawTubeBeadMeasurement.thaw_tube_reading_uid,
+                     models.ThawTubeBeadMeasurement.year,
+                     models.ThawTubeBeadMeasurement.depth)
+    if thaw_tube_uids is not None:
+        query = query.filter(models.ThawTubeBeadMeasurement.thaw_tube_uid.in_(thaw_tube_uids))
+    if year is not None:
+        start = dt.datetime(year, 1, 1, tzinfo=dt.timezone.utc)
+        query = query.join(models.ThawTubeReading) \
+            .join(models.InstallationVisit) \
+            .filter((models.ThawTubeBeadMeasurement.year == year - 1)
+                    & (models.InstallationVisit.visit_date >= start)
+                    & (models.InstallationVisit.visit_date < start.replace(year=year + 1)))
+    return query.order_by(models.ThawTubeBeadMeasurement.thaw_tube_bead_measurement_uid).all()
+
+
+def get_thaw_tube_references_of_thaw_tubes(db: Session, thaw_tube_uids: list[int] | None = None,
+                                           year: int | None = None):
+    """(thaw_tube_uid, date, reference_measurement) of the references in date order, optionally only those that
+    readings in the year can be relative to: the references of the year and the latest one of each tube before it"""
+    query = db.query(models.ThawTubeReference.thaw_tube_uid,
+                     models.ThawTubeReference.date,
+                     models.ThawTubeReference.reference_measurement)
+    if thaw_tube_uids is not None:
+        query = query.filter(models.ThawTubeReference.thaw_tube_uid.in_(thaw_tube_uids))
+    if year is not None:
+        start = dt.datetime(year, 1, 1, tzinfo=dt.timezone.utc)
+        latest_before = select(models.ThawTubeReference.thaw_tube_uid, func.max(models.ThawTubeReference.date)) \
+            .where(models.ThawTubeReference.date < start) \
+            .group_by(models.ThawTubeReference.thaw_tube_uid)
+        query = query.filter(models.ThawTubeReference.date < start.replace(year=year + 1)) \
+            .filter((models.ThawTubeReference.date >= start)
+                    | tuple_(models.ThawTubeReference.thaw_tube_uid, models.ThawTubeReference.date).in_(latest_before))
+    return query.order_by(models.ThawTubeReference.date).all()
+
+
+def get_thaw_tube_history(db: Session, thaw_tube_uids: list[int] | None = None, year: int | None = None):
+    """Readings of the thaw tubes (all of them by default), optionally only those of a year, in date order, with the
+    depth of the previous year's bead and the thaw penetration (relative to the latest reference measured before the
+    reading), maximum active layer and surface change"""
+    readings = pd.DataFrame(get_thaw_tube_readings_of_thaw_tubes(db=db, thaw_tube_uids=thaw_tube_uids, year=year),
+                            columns=["thaw_tube_uid", "date_time", "recorded_by", "activity", "notes", "tt_read_uid",
+                                     "tube_height", "ice_depth", "scribe_min", "scribe_curr", "scribe_max"])
+    beads = pd.DataFrame(get_thaw_tube_bead_depths_of_thaw_tubes(db=db, thaw_tube_uids=thaw_tube_uids, year=year),
+                         columns=["tt_read_uid", "bead_year", "previous_year_bead_depth"])
+    references = pd.DataFrame(get_thaw_tube_references_of_thaw_tubes(db=db, thaw_tube_uids=thaw_tube_uids, year=year),
+                              columns=["thaw_tube_uid", "reference_date", "reference_measurement"])
+    # Typed keys so the joins also work when there are no readings or references
+    readings = readings.astype({"thaw_tube_uid": int, "tt_read_uid": int})
+    references = references.astype({"thaw_tube_uid": int})
+    readings["date_time"] = pd.to_datetime(readings["date_time"], utc=True)
+    references["reference_date"] = pd.to_datetime(references["reference_date"], utc=True)
+    readings["bead_year"] = readings["date_time"].dt.year - 1
+    history = readings.merge(beads.drop_duplicates(["tt_read_uid", "bead_year"]), on=["tt_read_uid", "bead_year"],
+                             how="left")
+    history = pd.merge_asof(history, references, left_on="date_time", right_on="reference_date", by="thaw_tube_uid",
+                            allow_exact_matches=False, direction="backward")
+    history["thaw_penetration"] = history["previous_year_bead_depth"] - history["reference_measurement"]
+    history["max_active_layer"] = history["previous_year_bead_depth"] - (
+            history["tube_height"] - (history["scribe_min"] - history["scribe_curr"]))
+    history["surface_change"] = history["thaw_penetration"] - history["max_active_layer"]
+    return history.drop(columns=["tt_read_uid", "bead_year", "reference_date", "reference_measurement"])
+
+
+def get_thaw_tube_network_report(db: Session, year: int, regions: list[str] | None = None):
+    """Thaw tube history of every thaw tube in the regions for readings taken in the year, with the installation and
+    region of each tube"""
+    query = db.query(models.ThawTube.thaw_tube_uid,
+                     models.Installation.installation_code,
+                     models.Installation.installation_name,
+                     models.Site.region) \
+        .join(models.Installation, models.ThawTube.installation_uid == models.Installation.installation_uid) \
+        .join(models.Site, models.Installation.site_uid == models.Site.site_uid)
+    if regions:
+        query = query.filter(models.Site.region.in_(regions))
+    thaw_tubes = pd.DataFrame(query.all(), columns=["thaw_tube_uid", "installation_code", "installation_name",
+                                                    "region"])
+    history = get_thaw_tube_history(db=db, thaw_tube_uids=thaw_tubes["thaw_tube_uid"].tolist() if regions else None,
+                                    year=year)
+    return thaw_tubes.merge(history, on="thaw_tube_uid") \
+        .sort_values(["region", "installation_code", "date_time"]).drop(columns=["thaw_tube_uid"])
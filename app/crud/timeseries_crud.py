@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, func, literal, literal_column, or_, select, tuple_
+from sqlalchemy.dialects import postgresql
+import datetime as dt
+import pandas as pd
+
+from app import models
+
+timeseries_frequencies = ["D", "W", "M", "Q", "Y"]
+# Truncation unit and label offset that reproduce the bin labels of pd.Grouper(freq=..., origin="epoch") in UTC,
+# i.e. days are labelled by their start and weeks, months, quarters and years by their last day
+frequency_buckets = {"H": ("hour", None), "D": ("day", None), "W": ("week", "6 days"),
+                     "M": ("month", "1 month - 1 day"), "Q": ("quarter", "3 months - 1 day"),
+                     "Y": ("year", "1 year - 1 day")}
+
+
+def time_bucket(column, frequency: str):
+    unit, offset = frequency_buckets[frequency]
+    # Truncation happens on the UTC wall clock so the buckets don't depend on the session time zone
+    bucket = func.date_trunc(unit, func.timezone("UTC", column))
+    if offset is not None:
+        bucket = bucket + literal_column(f"interval '{offset}'")
+    return func.timezone("UTC", bucket)
+
+
+def is_utc_midnight(date_time: dt.datetime | None):
+    return date_time is None or date_time.astimezone(dt.timezone.utc).time() == dt.time(0)
+
+
+def rollup_window(date_times: pd.Series):
+    """Whole UTC days covering the given timestamps, as a half-open [start, end) range"""
+    date_times = pd.to_datetime(date_times, utc=True)
+    start = date_times.min().floor("D")
+    end = date_times.max().floor("D") + pd.Timedelta(days=1)
+    return start.to_pydatetime(), end.to_pydatetime()
+
+
+def rollup_years(start: dt.datetime | None, end: dt.datetime | None):
+    """UTC calendar years overlapping the half-open [start, end) range, or None if the range is unbounded"""
+    if start is None or end is None:
+        return None
+    start = start.astimezone(dt.timezone.utc)
+    end = end.astimezone(dt.timezone.utc) - dt.timedelta(microseconds=1)
+    return list(range(start.year, end.year + 1))
+
+
+def in_years(date_column, years: list[int]):
+    """Filter on the UTC calendar years as date ranges, so an index on the date column can be used"""
+    return or_(*[and_(date_column >= dt.datetime(year, 1, 1, tzinfo=dt.timezone.utc),
+                      date_column < dt.datetime(year + 1, 1, 1, tzinfo=dt.timezone.utc)) for year in years])
+
+
+def mark_daily_rollups_complete(db: Session, rollup, installation_uid: int | None = None):
+    """Records that the daily rollups of the installation (all installations by default) cover all of its raw data.
+    Does not commit."""
+    installations = select(literal(rollup.__tablename__), models.Installation.installation_uid, func.now())
+    if installation_uid is not None:
+        installations = installations.where(models.Installation.installation_uid == installation_uid)
+    db.execute(postgresql.insert(models.DailyRollupStatus)
+               .from_select(["rollup", "installation_uid", "completed_at"], installations)
+               .on_conflict_do_nothing(index_elements=["rollup", "installation_uid"]))
+
+
+def clear_daily_rollup_status(db: Session, rollup):
+    """Marks the daily rollups of every installation incomplete, e.g. after the rollup table was recreated"""
+    db.query(models.DailyRollupStatus).filter(models.DailyRollupStatus.rollup == rollup.__tablename__).delete()
+    db.commit()
+
+
+def get_complete_daily_rollup_installation_uids(db: Session, rollup, installation_uids: list[int]):
+    """The installations among those given whose daily rollups cover all of their raw data"""
+    return [row.installation_uid for row in db.query(models.DailyRollupStatus.installation_uid)
+            .filter((models.DailyRollupStatus.rollup == rollup.__tablename__)
+                    & models.DailyRollupStatus.installation_uid.in_(installation_uids)).all()]
+
+
+def refresh_daily_rollups(db: Session, rollup, model, sensor_columns: list[str], installation_uid: int | None = None,
+                          sensors: list[tuple] | None = None, start: dt.datetime | None = None,
+                          end: dt.datetime | None = None):
+    """Recomputes the daily rollup rows of the matching sensors over whole days [start, end) from the raw temperature
+    data and returns the number of rollup rows written. Rebuilding every sensor over all time marks the rollups of the
+    installation (or of all installations) complete. Does not commit."""
+    def filters(table, date_column):
+        clauses = []
+        if installation_uid is not None:
+            clauses.append(table.installation_uid == installation_uid)
+        if sensors is not None:
+            clauses.append(tuple_(*[getattr(table, column) for column in sensor_columns]).in_(sensors))
+        if start is not None:
+            clauses.append(date_column >= start)
+        if end is not None:
+            clauses.append(date_column < end)
+        return clauses
+
+    db.execute(delete(rollup).where(*filters(rollup, rollup.date)))
+    day = time_bucket(model.date_time, "D")
+    group_columns = [model.installation_uid, *[getattr(model, column) for column in sensor_columns], day]
+    daily = select(*group_columns, func.count(), func.sum(model.temperature), func.min(model.temperature),
+                   func.max(model.temperature)) \
+        .where(*filters(model, model.date_time)) \
+        .group_by(*group_columns)
+    rows_written = upsert_rollup_rows(db=db, rollup=rollup, columns=["installation_uid", *sensor_columns, "date",
+                                                                     "count", "temperature_sum", "temperature_min",
+                                                                     "temperature_max"],
+                                      rows=daily)
+    if sensors is None and start is None and end is None:
+        mark_daily_rollups_complete(db=db, rollup=rollup, installation_uid=installation_uid)
+    return rows_written
+
+
+def upsert_rollup_rows(db: Session, rollup, columns: list[str], rows):
+    """Inserts the rows selected by the query into the rollup table and returns the number of rows written. Rows
+    another transaction wrote in the meantime are overwritten, so concurrent refreshes of the same days don't fail on
+    the primary key."""
+    key_columns = [column.name for column in rollup.__table__.primary_key]
+    statement = postgresql.insert(rollup).from_select(columns, rows)
+    return db.execute(statement.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={column: statement.excluded[column] for column in columns if column not in key_columns})).rowcount
+
+
+def pivot_sensor_matrix(rows):
+    """Turns (date, sensor_number, temperature, depth) rows into date and sensor vectors and a date x sensor
+    temperature matrix, with None where a sensor has no data on a date"""
+    data = pd.DataFrame(rows, columns=["date", "sensor_number", "temperature", "depth"])
+    temperatures = data.pivot(index="date", columns="sensor_number", values="temperature").sort_index(axis=0) \
+        .sort_index(axis=1)
+    depths = data.groupby("sensor_number")["depth"].mean().reindex(temperatures.columns)
+    return {"dates": temperatures.index.tolist(),
+            "sensor_numbers": temperatures.columns.tolist(),
+            "depths": depths.astype(object).where(depths.notna(), None).tolist(),
+            "temperatures": temperatures.astype(object).where(temperatures.notna(), None).values.tolist()}
+
+
+def pivot_sensor_means(rows):
+    """Turns (date, sensor_number, temperature, depth) rows into one record per date with sensor_n_temp/depth keys,
+    leaving out sensors that have no data on that date"""
+    data = pd.DataFrame(rows, columns=["date", "sensor_number", "temperature", "depth"])
+    data = data.pivot(index="date", columns="sensor_number", values=["temperature", "depth"]).sort_index()
+    records = []
+    for date, row in zip(data.index, data.to_dict("records")):
+        record = {"date": date}
+        for (value, sensor), measurement in row.items():
+            if pd.isna(measurement):
+                continue
+            record[f"sensor_{sensor}_{'temp' if value == 'temperature' else 'depth'}"] = measurement
+        records.append(record)
+    return records
@@ -7,11 +7,28 @@ Created: 2023-06-20
 """
 
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 import datetime as dt
+import pandas as pd
 
+from app import crud
 from app import schemas
 from app import models
 
+hourly_data_columns = ["internal_temp_avg", "air_temp_avg", "wind_speed_avg", "wind_speed_std", "snow_depth"]
+daily_data_columns = ["internal_temp_min", "internal_temp_max", "air_temp_avg", "air_temp_max", "time_air_temp_max",
+                      "air_temp_min", "time_air_temp_min", "wind_speed_avg", "wind_speed_max", "time_wind_speed_max",
+                      "snow_depth"]
+daily_time_columns = ["time_air_temp_max", "time_air_temp_min", "time_wind_speed_max"]
+# Aggregate functions available when resampling the numeric columns of either table
+weather_station_statistics = {"mean": func.avg, "min": func.min, "max": func.max, "sum": func.sum}
+
+
+def get_weather_station_table(table: str):
+    """Model and data columns of the hourly or daily weather station table"""
+    return {"hourly": (models.WeatherStationHourlyData, hourly_data_columns),
+            "daily": (models.WeatherStationDailyData, daily_data_columns)}[table]
+
 
 def get_weather_station_by_installation_uid(db: Session, installation_uid: int):
     return db.query(models.WeatherStation).filter(models.WeatherStation.installation_uid == installation_uid).first()
@@ -36,6 +53,25 @@ def get_weather_station_download_by_visit_uid(db: Session, installation_visit_ui
         .filter(models.WeatherStationDownload.installation_visit_uid == installation_visit_uid).first()
 
 
+def get_weather_station_download_by_uid(db: Session, weather_station_download_uid: int):
+    return db.query(models.WeatherStationDownload) \
+        .filter(models.WeatherStationDownload.weather_station_download_uid == weather_station_download_uid).first()
+
+
+def update_weather_station_download_table_status(db: Session, weather_station_download_uid: int,
+                                                 hourly_tbl_good: bool | None = None,
+                                                 daily_tbl_good: bool | None = None, commit: bool = True):
+    weather_station_download = get_weather_station_download_by_uid(
+        db=db, weather_station_download_uid=weather_station_download_uid)
+    if hourly_tbl_good is not None:
+        weather_station_download.hourly_tbl_good = hourly_tbl_good
+    if daily_tbl_good is not None:
+        weather_station_download.daily_tbl_good = daily_tbl_good
+    if commit:
+        db.commit()
+    return weather_station_download
+
+
 def add_weather_station_download(db: Session, weather_station_download: schemas.WeatherStationDownloadBase):
     new_weather_station_download = models.WeatherStationDownload(
         installation_visit_uid=weather_station_download.installation_visit_uid,
@@ -54,20 +90,12 @@ def add_weather_station_download(db: Session, weather_station_download: schemas.
     return new_weather_station_download
 
 
-def add_hourly_weather_station_data(db: Session, hourly_data: schemas.WeatherStationHourlyDataBase):
-    new_data = models.WeatherStationHourlyData(
-        weather_station_uid=hourly_data.weather_station_uid,
-        weather_station_download_uid=hourly_data.weather_station_download_uid,
-        date_time=hourly_data.date_time.replace(microsecond=0),
-        internal_temp_avg=hourly_data.internal_temp_avg,
-        air_temp_avg=hourly_data.air_temp_avg,
-        wind_speed_avg=hourly_data.wind_speed_avg,
-        wind_speed_std=hourly_data.wind_speed_std,
-        snow_depth=hourly_data.snow_depth)
-    db.add(new_data)
-    db.commit()
-    db.refresh(new_data)
-    return new_data
+def add_hourly_weather_station_data(db: Session, hourly_data: schemas.WeatherStationHourlyDataBase,
+                                    on_conflict: str = "fail"):
+    values = hourly_data.dict()
+    values["date_time"] = hourly_data.date_time.replace(microsecond=0)
+    return crud.upsert_row(db=db, model=models.WeatherStationHourlyData, values=values,
+                           key_columns=["weather_station_uid", "date_time"], on_conflict=on_conflict)
 
 
 def get_weather_station_hourly_data_by_station_uid_and_time(db: Session, weather_station_uid: int,
@@ -77,26 +105,25 @@ def get_weather_station_hourly_data_by_station_uid_and_time(db: Session, weather
                 & (models.WeatherStationHourlyData.weather_station_uid == weather_station_uid)).first()
 
 
-def add_daily_weather_station_data(db: Session, daily_data: schemas.WeatherStationDailyDataBase):
-    new_data = models.WeatherStationDailyData(
-        weather_station_uid=daily_data.weather_station_uid,
-        weather_station_download_uid=daily_data.weather_station_download_uid,
-        date_time=daily_data.date_time.replace(microsecond=0),
-        internal_temp_min=daily_data.internal_temp_min,
-        internal_temp_max=daily_data.internal_temp_max,
-        air_temp_avg=daily_data.air_temp_avg,
-        air_temp_max=daily_data.air_temp_max,
-        time_air_temp_max=daily_data.time_air_temp_max,
-        air_temp_min=daily_data.air_temp_min,
-        time_air_temp_min=daily_data.time_air_temp_min,
-        wind_speed_avg=daily_data.wind_speed_avg,
-        wind_speed_max=daily_data.wind_speed_max,
-        time_wind_speed_max=daily_data.time_wind_speed_max,
-        snow_depth=daily_data.snow_depth)
-    db.add(new_data)
-    db.commit()
-    db.refresh(new_data)
-    return new_data
+def add_bulk_hourly_weather_station_data(data: pd.DataFrame, db: Session, commit: bool = True,
+                                         on_conflict: str = "skip", dry_run: bool = False):
+    data = data[["weather_station_uid", "weather_station_download_uid", "date_time", *hourly_data_columns]].copy()
+    data["date_time"] = pd.to_datetime(data["date_time"], utc=True).dt.floor("s")
+    summary = crud.bulk_insert_dataframe(db=db, model=models.WeatherStationHourlyData, data=data,
+                                         key_columns=["weather_station_uid", "date_time"],
+                                         value_columns=hourly_data_columns, on_conflict=on_conflict,
+                                         dry_run=dry_run)
+    if commit:
+        db.commit()
+    return summary
+
+
+def add_daily_weather_station_data(db: Session, daily_data: schemas.WeatherStationDailyDataBase,
+                                   on_conflict: str = "fail"):
+    values = daily_data.dict()
+    values["date_time"] = daily_data.date_time.replace(microsecond=0)
+    return crud.upsert_row(db=db, model=models.WeatherStationDailyData, values=values,
+                           key_columns=["weather_station_uid", "date_time"], on_conflict=on_conflict)
 
 
 def get_weather_station_daily_data_by_station_uid_and_time(db: Session, weather_station_uid: int,
@@ -106,6 +133,67 @@ def get_weather_station_daily_data_by_station_uid_and_time(db: Session, weather_
                 & (models.WeatherStationDailyData.weather_station_uid == weather_station_uid)).first()
 
 
+def add_bulk_daily_weather_station_data(data: pd.DataFrame, db: Session, commit: bool = True,
+                                        on_conflict: str = "skip", dry_run: bool = False):
+    data = data[["weather_station_uid", "weather_station_download_uid", "date_time", *daily_data_columns]].copy()
+    for column in ["date_time", *daily_time_columns]:
+        data[column] = pd.to_datetime(data[column], utc=True).dt.floor("s")
+    summary = crud.bulk_insert_dataframe(db=db, model=models.WeatherStationDailyData, data=data,
+                                         key_columns=["weather_station_uid", "date_time"],
+                                         value_columns=daily_data_columns, on_conflict=on_conflict,
+                                         dry_run=dry_run)
+    if commit:
+        db.commit()
+    return summary
+
+
+def add_weather_station_file_data(chunks, table: str, weather_station_uid: int, weather_station_download_uid: int,
+                                  db: Session, on_conflict: str = "skip", dry_run: bool = False):
+    # The table is only reported as good if every data column was found and every record had a readable timestamp
+    columns, add_bulk_data = {"hourly": (hourly_data_columns, add_bulk_hourly_weather_station_data),
+                              "daily": (daily_data_columns, add_bulk_daily_weather_station_data)}[table]
+    summary = crud.new_bulk_summary(dry_run=dry_run)
+    table_good = True
+    for chunk in chunks:
+        table_good = table_good and set(columns).issubset(chunk.columns) and bool(chunk["date_time"].notna().all())
+        chunk = chunk.dropna(subset=["date_time"]).reindex(columns=["date_time", *columns])
+        chunk["weather_station_uid"] = weather_station_uid
+        chunk["weather_station_download_uid"] = weather_station_download_uid
+        crud.merge_bulk_summaries(summary, add_bulk_data(data=chunk, db=db, commit=False, on_conflict=on_conflict,
+                                                         dry_run=dry_run))
+    return summary, table_good and summary["received"] > 0
+
+
+def get_weather_station_data_in_range(db: Session, table: str, weather_station_uid: int, columns: list[str],
+                                      start: dt.datetime | None = None, end: dt.datetime | None = None):
+    model, _ = get_weather_station_table(table)
+    query = db.query(model.date_time, *[getattr(model, column) for column in columns]) \
+        .filter(model.weather_station_uid == weather_station_uid)
+    if start is not None:
+        query = query.filter(model.date_time >= start)
+    if end is not None:
+        query = query.filter(model.date_time < end)
+    return query.order_by(model.date_time).all()
+
+
+def get_weather_station_timeseries_aggregate(db: Session, table: str, weather_station_uid: int, frequency: str,
+                                             columns: list[str], statistics: list[str],
+                                             start: dt.datetime | None = None, end: dt.datetime | None = None):
+    """Resamples the columns to the frequency in the database, returning one row per bucket with the record count and
+    a {column}_{statistic} value for every column and statistic"""
+    model, _ = get_weather_station_table(table)
+    bucket = crud.time_bucket(model.date_time, frequency).label("date")
+    query = db.query(bucket, func.count().label("count"),
+                     *[weather_station_statistics[statistic](getattr(model, column)).label(f"{column}_{statistic}")
+                       for column in columns for statistic in statistics]) \
+        .filter(model.weather_station_uid == weather_station_uid)
+    if start is not None:
+        query = query.filter(model.date_time >= start)
+    if end is not None:
+        query = query.filter(model.date_time < end)
+    return query.group_by(bucket).order_by(bucket).all()
+
+
 def update_ws_sensor_status(db: Session, uid: int, air_temp: str, anemo: str, snow: str):
     weather_station = db.query(models.WeatherStation).filter(models.WeatherStation.weather_station_uid == uid).first()
     weather_station.at_status = air_temp
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+import numpy as np
+import pandas as pd
+
+downsampling_methods = ["lttb", "minmax"]
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets, always including the first and last point.
+    max_points must be at least 3."""
+    n = len(x)
+    if max_points >= n:
+        return np.arange(n)
+    # Interior points are split into max_points - 2 buckets of (almost) equal size
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    selected = np.empty(max_points, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        # The third vertex is the mean of the next bucket, or the last point for the final bucket
+        if i < max_points - 3:
+            next_x = x[edges[i + 1]:edges[i + 2]].mean()
+            next_y = y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y: np.ndarray, max_points: int):
+    """Indices of the minimum and maximum of each of max_points // 2 equal-count buckets, in series order"""
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+    buckets = max(max_points // 2, 1)
+    bucket = np.arange(n) * buckets // n
+    order = np.lexsort((y, bucket))
+    bounds = np.searchsorted(bucket[order], np.arange(buckets))
+    minima = order[bounds]
+    maxima = order[np.append(bounds[1:], n) - 1]
+    return np.unique(np.concatenate([minima, maxima]))
+
+
+def downsample(data: pd.DataFrame, x_column: str, y_column: str, max_points: int, method: str = "lttb",
+               by: str | None = None):
+    """Reduces each series (one per value of the by column) to at most max_points rows for plotting"""
+    data = data.loc[data[y_column].notna()].sort_values([by, x_column] if by is not None else x_column)
+    groups = data.groupby(by, sort=False) if by is not None else [(None, data)]
+    kept = []
+    for _, series in groups:
+        y = series[y_column].to_numpy(dtype=float)
+        if method == "lttb":
+            x = pd.to_datetime(series[x_column], utc=True).to_numpy(dtype="datetime64[ns]").astype(np.int64) \
+                .astype(float)
+            indices = lttb_indices(x, y, max_points)
+        else:
+            indices = minmax_indices(y, max_points)
+        kept.append(series.iloc[indices])
+    if not kept:
+        return data
+    return pd.concat(kept).sort_values([x_column, by] if by is not None else x_column)
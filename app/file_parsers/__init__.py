@@ -0,0 +1,2 @@
+from .logger_file_parsers import *
+from .campbell_parsers import *
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+import pandas as pd
+import io
+
+from .logger_file_parsers import split_header, detect_timestamp_format, parse_timestamps, localize_timestamps
+
+campbell_table_types = ["hourly", "daily"]
+# Field names used for each measurement by the CR300 station programs, matched case-insensitively
+campbell_measurements = {"internal_temp": ["PTemp_C", "PTemp", "Panel_Temp", "PanelT"],
+                         "air_temp": ["AirTC", "AirT_C", "Air_Temp", "AirTemp", "T107_C"],
+                         "wind_speed": ["WS_ms", "WindSpd_ms", "WindSpd", "Wind_Speed"],
+                         "snow_depth": ["DBTCDT", "SnowDepth", "Snow_Depth"]}
+campbell_statistics = {"avg": "{}_avg", "std": "{}_std", "max": "{}_max", "min": "{}_min", "tmx": "time_{}_max",
+                       "tmn": "time_{}_min", "": "{}"}
+
+
+def map_campbell_field(field: str):
+    for measurement, aliases in campbell_measurements.items():
+        for alias in aliases:
+            if field.lower() == alias.lower():
+                statistic = ""
+            elif field.lower().startswith(alias.lower() + "_"):
+                statistic = field[len(alias) + 1:].lower()
+            else:
+                continue
+            if statistic not in campbell_statistics:
+                return None
+            if measurement == "snow_depth" and statistic in ["", "avg"]:
+                return "snow_depth"
+            return campbell_statistics[statistic].format(measurement)
+    return None
+
+
+def read_toa5_header(stream):
+    environment = split_header(stream.readline(), ",")
+    if not environment or environment[0] != "TOA5":
+        raise ValueError("File is not a Campbell TOA5 table file")
+    fields = split_header(stream.readline(), ",")
+    # The units and processing lines carry nothing that isn't already encoded in the field names
+    stream.readline()
+    stream.readline()
+    if "TIMESTAMP" not in fields:
+        raise ValueError("Campbell table file has no TIMESTAMP column")
+    return fields
+
+
+def read_campbell_file(file, chunk_size: int = 50000, utc_offset: float = 0.0):
+    """Yields the records of a Campbell TOA5 table file as chunks named after the weather station data columns"""
+    stream = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        fields = read_toa5_header(stream)
+        names = {fields.index("TIMESTAMP"): "date_time"}
+        for i, field in enumerate(fields):
+            column = map_campbell_field(field)
+            if column is not None and column not in names.values():
+                names[i] = column
+        timestamp_format = None
+        for chunk in pd.read_csv(stream, header=None, usecols=list(names), na_values=["NAN", "INF", "-INF"],
+                                 skipinitialspace=True, chunksize=chunk_size):
+            chunk = chunk.rename(columns=names)
+            timestamp_format = timestamp_format or detect_timestamp_format(chunk["date_time"])
+            for column in chunk.columns:
+                if column == "date_time" or column.startswith("time_"):
+                    chunk[column] = localize_timestamps(parse_timestamps(chunk[column], timestamp_format), utc_offset)
+                else:
+                    chunk[column] = pd.to_numeric(chunk[column], errors="coerce")
+            yield chunk
+    finally:
+        if not file.closed:
+            stream.detach()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+import datetime as dt
+import pandas as pd
+import csv
+import re
+import io
+
+logger_file_formats = ["RBR", "HOBO"]
+timestamp_formats = ["%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%m/%d/%y %I:%M:%S %p",
+                     "%m/%d/%Y %I:%M:%S %p", "%m/%d/%y %H:%M:%S", "%m/%d/%Y %H:%M:%S", "%d/%m/%Y %H:%M:%S"]
+
+
+def read_header_line(stream, is_header):
+    line = stream.readline()
+    while line:
+        if is_header(line):
+            return line
+        line = stream.readline()
+    raise ValueError("Could not find the column header line in the logger file")
+
+
+def split_header(line: str, sep: str):
+    return [field.strip() for field in next(csv.reader([line], delimiter=sep))]
+
+
+def read_rbr_file(stream, chunk_size: int, utc_offset: float):
+    header = read_header_line(stream, lambda line: line.strip().strip('"').lower().startswith(("time", "date & time")))
+    sep = "\t" if "\t" in header else ","
+    fields = split_header(header, sep)
+    # Every column after the timestamp is a temperature channel, numbered in the order they were exported
+    names = ["date_time", *range(1, len(fields))]
+    timestamp_format = None
+    for chunk in pd.read_csv(stream, sep=sep, header=None, names=names, usecols=range(len(names)),
+                             skipinitialspace=True, chunksize=chunk_size):
+        timestamp_format = timestamp_format or detect_timestamp_format(chunk["date_time"])
+        chunk["date_time"] = localize_timestamps(parse_timestamps(chunk["date_time"], timestamp_format), utc_offset)
+        yield chunk
+
+
+def read_hobo_file(stream, chunk_size: int, utc_offset: float):
+    header = read_header_line(stream, lambda line: "date time" in line.lower())
+    fields = split_header(header, ",")
+    date_index = next(i for i, field in enumerate(fields) if field.lower().startswith("date time"))
+    gmt_offset = re.search(r"GMT\s*([+-])(\d{1,2}):(\d{2})", fields[date_index])
+    if gmt_offset is not None:
+        sign = -1 if gmt_offset.group(1) == "-" else 1
+        utc_offset = sign * (int(gmt_offset.group(2)) + int(gmt_offset.group(3)) / 60)
+    temperature_indices = [i for i, field in enumerate(fields) if field.lower().startswith("temp")]
+    fahrenheit = [i for i in temperature_indices if "°F" in fields[i] or "F (" in fields[i]]
+    names = {date_index: "date_time", **{i: n + 1 for n, i in enumerate(temperature_indices)}}
+    timestamp_format = None
+    for chunk in pd.read_csv(stream, header=None, usecols=list(names), skipinitialspace=True, chunksize=chunk_size):
+        chunk = chunk.rename(columns=names)
+        for i in fahrenheit:
+            chunk[names[i]] = (pd.to_numeric(chunk[names[i]], errors="coerce") - 32) * 5 / 9
+        timestamp_format = timestamp_format or detect_timestamp_format(chunk["date_time"])
+        chunk["date_time"] = localize_timestamps(parse_timestamps(chunk["date_time"], timestamp_format), utc_offset)
+        yield chunk
+
+
+def detect_timestamp_format(values: pd.Series):
+    sample = values.dropna().astype(str).head(100)
+    for timestamp_format in timestamp_formats:
+        if pd.to_datetime(sample, format=timestamp_format, errors="coerce").notna().all():
+            return timestamp_format
+    return None
+
+
+def parse_timestamps(values: pd.Series, timestamp_format: str | None):
+    if timestamp_format is None:
+        return pd.to_datetime(values, errors="coerce")
+    return pd.to_datetime(values, format=timestamp_format, errors="coerce")
+
+
+def localize_timestamps(timestamps: pd.Series, utc_offset: float):
+    if timestamps.dt.tz is None:
+        timestamps = timestamps.dt.tz_localize(dt.timezone(dt.timedelta(hours=utc_offset)))
+    return timestamps.dt.tz_convert("UTC")
+
+
+def read_logger_file(file, file_format: str, chunk_size: int = 50000, utc_offset: float = 0.0):
+    """Yields the temperatures in an RBR or HOBO export as long (date_time, channel_number, temperature) chunks"""
+    readers = {"RBR": read_rbr_file, "HOBO": read_hobo_file}
+    stream = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        for chunk in readers[file_format](stream=stream, chunk_size=chunk_size, utc_offset=utc_offset):
+            chunk = chunk.melt(id_vars="date_time", var_name="channel_number", value_name="temperature")
+            chunk["temperature"] = pd.to_numeric(chunk["temperature"], errors="coerce")
+            chunk = chunk.dropna(subset=["date_time", "temperature"])
+            if not chunk.empty:
+                yield chunk.astype({"channel_number": int})
+    finally:
+        if not file.closed:
+            stream.detach()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import SQLAlchemyError
+import datetime as dt
+import pandas as pd
+import threading
+import socket
+import time
+import uuid
+import os
+
+from app import crud
+from app.database import SessionLocal
+
+ingestion_chunk_size = 50000
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingestion_job")
+# Jobs are owned by the process that queued them, which renews their lease while it is alive. Jobs whose lease has
+# run out belong to a process that stopped and are failed by any other process.
+worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+lease_renewal_seconds = 30
+ingestion_job_lease = dt.timedelta(minutes=2)
+
+
+class IngestionJobCancelled(Exception):
+    pass
+
+
+def submit_ingestion_job(ingestion_job_uid: int, handler, cleanup=None):
+    executor.submit(run_ingestion_job, ingestion_job_uid, handler, cleanup)
+
+
+def renew_ingestion_job_leases():
+    while True:
+        db = SessionLocal()
+        try:
+            crud.renew_ingestion_job_leases(db=db, worker_id=worker_id)
+            crud.fail_interrupted_ingestion_jobs(db=db, lease=ingestion_job_lease)
+        except SQLAlchemyError:
+            db.rollback()
+        finally:
+            db.close()
+        time.sleep(lease_renewal_seconds)
+
+
+def start_lease_renewal():
+    threading.Thread(target=renew_ingestion_job_leases, name="ingestion_job_leases", daemon=True).start()
+
+
+def run_ingestion_job(ingestion_job_uid: int, handler, cleanup=None):
+    # Data is written on its own session and committed chunk by chunk, so a resubmitted job skips what already loaded
+    # cleanup runs however the job ends, including when it is cancelled before the handler starts
+    db = SessionLocal()
+    status_db = SessionLocal()
+    try:
+        if crud.get_ingestion_job_by_uid(db=status_db, ingestion_job_uid=ingestion_job_uid).cancel_requested:
+            crud.finish_ingestion_job(db=status_db, ingestion_job_uid=ingestion_job_uid, status="cancelled")
+            return
+        crud.start_ingestion_job(db=status_db, ingestion_job_uid=ingestion_job_uid)
+
+        def report(summary: dict, percent_complete: float):
+            db.commit()
+            db_ingestion_job = crud.update_ingestion_job_progress(db=status_db, ingestion_job_uid=ingestion_job_uid,
+                                                                  summary=summary,
+                                                                  percent_complete=min(percent_complete, 100))
+            if db_ingestion_job.cancel_requested:
+                raise IngestionJobCancelled()
+
+        handler(db=db, report=report)
+        db.commit()
+        crud.finish_ingestion_job(db=status_db, ingestion_job_uid=ingestion_job_uid, status="succeeded")
+    except IngestionJobCancelled:
+        db.rollback()
+        crud.finish_ingestion_job(db=status_db, ingestion_job_uid=ingestion_job_uid, status="cancelled",
+                                  message="Cancelled by request. Rows reported as inserted were kept.")
+    except Exception as e:
+        db.rollback()
+        crud.finish_ingestion_job(db=status_db, ingestion_job_uid=ingestion_job_uid, status="failed", message=str(e))
+    finally:
+        db.close()
+        status_db.close()
+        if cleanup is not None:
+            cleanup()
+
+
+def dataframe_ingestion_handler(data: pd.DataFrame, add_bulk_data, on_conflict: str = "skip"):
+    def handler(db, report):
+        summary = crud.new_bulk_summary()
+        for start in range(0, len(data.index), ingestion_chunk_size):
+            crud.merge_bulk_summaries(summary, add_bulk_data(data=data.iloc[start:start + ingestion_chunk_size],
+                                                             db=db, commit=False, on_conflict=on_conflict))
+            report(summary, 100 * summary["received"] / len(data.index))
+        return summary
+    return handler
+
+
+def rollup_backfill_handler(installation_uids: list[int], refreshes: list):
+    # One installation per transaction, so the means of the installations already done come from the rollups
+    def handler(db, report):
+        summary = crud.new_bulk_summary()
+        for done, installation_uid in enumerate(installation_uids, start=1):
+            for refresh in refreshes:
+                summary["inserted"] += refresh(db=db, installation_uid=installation_uid)
+            report(summary, 100 * done / len(installation_uids))
+        return summary
+    return handler
@@ -3,4 +3,5 @@ from .weather_station_models import *
 from .thaw_tube_models import *
 from .cable_models import *
 from .air_gs_models import *
-from .four_channel_models import *
\ No newline at end of file
+from .four_channel_models import *
+from .job_models import *
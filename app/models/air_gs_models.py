@@ -6,7 +6,7 @@ Author: rparker
 Created: 2023-07-10
 """
 
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.sql import sqltypes
 
 from app.database import Base
@@ -14,6 +14,9 @@ from app.database import Base
 
 class AirGroundTemperatureData(Base):
     __tablename__ = "air_ground_temperature_data"
+    __table_args__ = (UniqueConstraint("logger_uid", "channel_number", "date_time",
+                                       name="air_ground_temperature_data_logger_channel_date_time_key"),
+                      Index("air_ground_temperature_data_installation_date_time_idx", "installation_uid", "date_time"))
     ag_temperature_data_uid = Column(sqltypes.Integer, primary_key=True)
     logger_uid = Column(sqltypes.Integer, ForeignKey("logger.logger_uid"), nullable=False)
     logger_download_uid = Column(sqltypes.Integer, ForeignKey("logger_download.logger_download_uid"), nullable=False)
@@ -32,8 +35,36 @@ class AirGroundTemperatureData(Base):
         return
 
 
+class AirGroundTemperatureDataDaily(Base):
+    """Per-channel daily rollup of air_ground_temperature_data, days starting at midnight UTC"""
+    __tablename__ = "air_ground_temperature_data_daily"
+    installation_uid = Column(sqltypes.Integer, ForeignKey("installation.installation_uid"), primary_key=True)
+    logger_uid = Column(sqltypes.Integer, ForeignKey("logger.logger_uid"), primary_key=True)
+    channel_number = Column(sqltypes.Integer, primary_key=True)
+    date = Column(sqltypes.DateTime(timezone=True), primary_key=True)
+    count = Column(sqltypes.Integer, nullable=False)
+    temperature_sum = Column(sqltypes.Float, nullable=False)
+    temperature_min = Column(sqltypes.Float, nullable=False)
+    temperature_max = Column(sqltypes.Float, nullable=False)
+
+    def __init__(self, installation_uid, logger_uid, channel_number, date, count, temperature_sum, temperature_min,
+                 temperature_max):
+        self.installation_uid = installation_uid
+        self.logger_uid = logger_uid
+        self.channel_number = channel_number
+        self.date = date
+        self.count = count
+        self.temperature_sum = temperature_sum
+        self.temperature_min = temperature_min
+        self.temperature_max = temperature_max
+        return
+
+
 class TemperaturePressureData(Base):
     __tablename__ = "temperature_pressure_data"
+    __table_args__ = (UniqueConstraint("logger_uid", "date_time",
+                                       name="temperature_pressure_data_logger_date_time_key"),
+                      Index("temperature_pressure_data_installation_date_time_idx", "installation_uid", "date_time"))
     temperature_pressure_data_uid = Column(sqltypes.Integer, primary_key=True)
     logger_uid = Column(sqltypes.Integer, ForeignKey("logger.logger_uid"), nullable=False)
     logger_download_uid = Column(sqltypes.Integer, ForeignKey("logger_download.logger_download_uid"), nullable=False)
@@ -6,7 +6,7 @@ Author: rparker
 Created: 2023-07-07
 """
 
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.sql import sqltypes
 
 from app.database import Base
@@ -50,6 +50,9 @@ class CableSensor(Base):
 
 class CableLoggerData(Base):
     __tablename__ = "cable_logger_data"
+    __table_args__ = (UniqueConstraint("cable_sensor_uid", "date_time", name="cable_logger_data_sensor_date_time_key"),
+                      Index("cable_logger_data_installation_date_time_sensor_idx", "installation_uid", "date_time",
+                            "cable_sensor_uid"))
     cable_logger_data_uid = Column(sqltypes.Integer, primary_key=True)
     logger_uid = Column(sqltypes.Integer, ForeignKey("logger.logger_uid"), nullable=False)
     logger_download_uid = Column(sqltypes.Integer, ForeignKey("logger_download.logger_download_uid"), nullable=False)
@@ -68,6 +71,54 @@ class CableLoggerData(Base):
         return
 
 
+class CableLoggerDataDaily(Base):
+    """Per-sensor daily rollup of cable_logger_data, days starting at midnight UTC"""
+    __tablename__ = "cable_logger_data_daily"
+    installation_uid = Column(sqltypes.Integer, ForeignKey("installation.installation_uid"), primary_key=True)
+    cable_sensor_uid = Column(sqltypes.Integer, ForeignKey("cable_sensor.cable_sensor_uid"), primary_key=True)
+    date = Column(sqltypes.DateTime(timezone=True), primary_key=True)
+    count = Column(sqltypes.Integer, nullable=False)
+    temperature_sum = Column(sqltypes.Float, nullable=False)
+    temperature_min = Column(sqltypes.Float, nullable=False)
+    temperature_max = Column(sqltypes.Float, nullable=False)
+
+    def __init__(self, installation_uid, cable_sensor_uid, date, count, temperature_sum, temperature_min,
+                 temperature_max):
+        self.installation_uid = installation_uid
+        self.cable_sensor_uid = cable_sensor_uid
+        self.date = date
+        self.count = count
+        self.temperature_sum = temperature_sum
+        self.temperature_min = temperature_min
+        self.temperature_max = temperature_max
+        return
+
+
+class CableLoggerDataAnnual(Base):
+    """Per-sensor calendar year (UTC) statistics of cable_logger_data, derived from cable_logger_data_daily"""
+    __tablename__ = "cable_logger_data_annual"
+    installation_uid = Column(sqltypes.Integer, ForeignKey("installation.installation_uid"), primary_key=True)
+    cable_sensor_uid = Column(sqltypes.Integer, ForeignKey("cable_sensor.cable_sensor_uid"), primary_key=True)
+    year = Column(sqltypes.SmallInteger, primary_key=True)
+    days = Column(sqltypes.SmallInteger, nullable=False)
+    count = Column(sqltypes.Integer, nullable=False)
+    temperature_sum = Column(sqltypes.Float, nullable=False)
+    temperature_min = Column(sqltypes.Float, nullable=False)
+    temperature_max = Column(sqltypes.Float, nullable=False)
+
+    def __init__(self, installation_uid, cable_sensor_uid, year, days, count, temperature_sum, temperature_min,
+                 temperature_max):
+        self.installation_uid = installation_uid
+        self.cable_sensor_uid = cable_sensor_uid
+        self.year = year
+        self.days = days
+        self.count = count
+        self.temperature_sum = temperature_sum
+        self.temperature_min = temperature_min
+        self.temperature_max = temperature_max
+        return
+
+
 class CableManualRead(Base):
     __tablename__ = "cable_manual_read"
     cable_manual_read_uid = Column(sqltypes.Integer, primary_key=True)
@@ -76,16 +127,18 @@ class CableManualRead(Base):
     installation_visit_uid = Column(sqltypes.Integer, ForeignKey("installation_visit.installation_visit_uid"),
                                     nullable=False)
     temperature = Column(sqltypes.Float)
+    resistance = Column(sqltypes.Integer)
     ol = Column(sqltypes.Boolean)
     drift_up = Column(sqltypes.Boolean)
     drift_down = Column(sqltypes.Boolean)
 
     def __init__(self, cable_sensor_uid, installation_uid, installation_visit_uid, temperature, ol, drift_up,
-                 drift_down):
+                 drift_down, resistance=None):
         self.cable_sensor_uid = cable_sensor_uid
         self.installation_uid = installation_uid
         self.installation_visit_uid = installation_visit_uid
         self.temperature = temperature
+        self.resistance = resistance
         self.ol = ol
         self.drift_up = drift_up
         self.drift_down = drift_down
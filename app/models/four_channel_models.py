@@ -6,7 +6,7 @@ Author: rparker
 Created: 2023-07-10
 """
 
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, ForeignKey, UniqueConstraint
 from sqlalchemy.sql import sqltypes
 
 from app.database import Base
@@ -30,6 +30,8 @@ class FourChannelSensor(Base):
 
 class FourChannelData(Base):
     __tablename__ = "four_channel_data"
+    __table_args__ = (UniqueConstraint("four_channel_sensor_uid", "date_time",
+                                       name="four_channel_data_sensor_date_time_key"),)
     four_channel_data_uid = Column(sqltypes.Integer, primary_key=True)
     logger_uid = Column(sqltypes.Integer, ForeignKey("logger.logger_uid"), nullable=False)
     logger_download_uid = Column(sqltypes.Integer, ForeignKey("logger_download.logger_download_uid"), nullable=False)
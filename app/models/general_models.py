@@ -65,6 +65,20 @@ class Installation(Base):
         return
 
 
+class DailyRollupStatus(Base):
+    """Installations whose daily rollups (named by their table) have been built from all of their raw data"""
+    __tablename__ = "daily_rollup_status"
+    rollup = Column(sqltypes.String, primary_key=True)
+    installation_uid = Column(sqltypes.Integer, ForeignKey("installation.installation_uid"), primary_key=True)
+    completed_at = Column(sqltypes.DateTime(timezone=True), nullable=False)
+
+    def __init__(self, rollup, installation_uid, completed_at):
+        self.rollup = rollup
+        self.installation_uid = installation_uid
+        self.completed_at = completed_at
+        return
+
+
 class InstallationVisit(Base):
     __tablename__ = "installation_visit"
     installation_visit_uid = Column(sqltypes.Integer, primary_key=True)
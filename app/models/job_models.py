@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+from sqlalchemy import Column
+from sqlalchemy.sql import sqltypes
+
+from app.database import Base
+
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_job"
+    ingestion_job_uid = Column(sqltypes.Integer, primary_key=True)
+    job_type = Column(sqltypes.String, nullable=False)
+    description = Column(sqltypes.String)
+    status = Column(sqltypes.String, nullable=False)
+    submitted_at = Column(sqltypes.DateTime(timezone=True), nullable=False)
+    started_at = Column(sqltypes.DateTime(timezone=True))
+    finished_at = Column(sqltypes.DateTime(timezone=True))
+    percent_complete = Column(sqltypes.Float, nullable=False)
+    rows_received = Column(sqltypes.Integer, nullable=False)
+    rows_inserted = Column(sqltypes.Integer, nullable=False)
+    rows_skipped = Column(sqltypes.Integer, nullable=False)
+    rows_conflicting = Column(sqltypes.Integer, nullable=False)
+    rows_overwritten = Column(sqltypes.Integer, nullable=False)
+    cancel_requested = Column(sqltypes.Boolean, nullable=False)
+    message = Column(sqltypes.String)
+    worker_id = Column(sqltypes.String)
+    heartbeat_at = Column(sqltypes.DateTime(timezone=True))
+
+    def __init__(self, job_type, description, submitted_at, worker_id=None):
+        self.job_type = job_type
+        self.description = description
+        self.status = "queued"
+        self.submitted_at = submitted_at
+        self.worker_id = worker_id
+        self.heartbeat_at = submitted_at
+        self.percent_complete = 0
+        self.rows_received = 0
+        self.rows_inserted = 0
+        self.rows_skipped = 0
+        self.rows_conflicting = 0
+        self.rows_overwritten = 0
+        self.cancel_requested = False
+        return
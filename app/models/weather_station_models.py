@@ -6,7 +6,7 @@ Author: rparker
 Created: 2023-07-07
 """
 
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, ForeignKey, UniqueConstraint
 from sqlalchemy.sql import sqltypes
 
 from app.database import Base
@@ -67,6 +67,8 @@ class WeatherStationDownload(Base):
 
 class WeatherStationDailyData(Base):
     __tablename__ = "weather_station_daily_data"
+    __table_args__ = (UniqueConstraint("weather_station_uid", "date_time",
+                                       name="weather_station_daily_data_station_date_time_key"),)
     weather_station_daily_data_uid = Column(sqltypes.Integer, primary_key=True)
     weather_station_uid = Column(sqltypes.Integer, ForeignKey("weather_station.weather_station_uid"), nullable=False)
     weather_station_download_uid = Column(sqltypes.Integer,
@@ -107,6 +109,8 @@ class WeatherStationDailyData(Base):
 
 class WeatherStationHourlyData(Base):
     __tablename__ = "weather_station_hourly_data"
+    __table_args__ = (UniqueConstraint("weather_station_uid", "date_time",
+                                       name="weather_station_hourly_data_station_date_time_key"),)
     weather_station_hourly_data_uid = Column(sqltypes.Integer, primary_key=True)
     weather_station_uid = Column(sqltypes.Integer, ForeignKey("weather_station.weather_station_uid"), nullable=False)
     weather_station_download_uid = Column(sqltypes.Integer,
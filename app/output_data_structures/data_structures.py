@@ -28,7 +28,7 @@ class CableLoggerDataOutput:
 
 class CableManualReadOutput:
     date_time: dt.datetime
-    resistance: int
+    resistance: int | None
     ol: bool
     drift_up: bool
     drift_down: bool
@@ -10,6 +10,7 @@ Created: 2023-11-03
 import datetime as dt
 
 from app.schemas.base_model import BaseModelConfig
+from app.schemas.job_schemas import IngestionJob
 
 
 class CableLoggerDataOutput(BaseModelConfig):
@@ -22,7 +23,7 @@ class CableLoggerDataOutput(BaseModelConfig):
 
 class CableManualReadOutput(BaseModelConfig):
     date_time: dt.datetime
-    resistance: int
+    resistance: int | None
     ol: bool
     drift_up: bool
     drift_down: bool
@@ -38,10 +39,18 @@ class AGLoggerDataOutput(BaseModelConfig):
     sensor_number: int
 
 
+class FourChannelDataOutput(BaseModelConfig):
+    date_time: dt.datetime
+    temperature: float
+    logger_sn: str
+    sensor_number: int
+    sensor_depth: float
+
+
 class MultiSensorTimeSeriesAverageData(BaseModelConfig):
     date: dt.datetime
-    sensor_1_temp: float
-    sensor_1_depth: float
+    sensor_1_temp: float | None
+    sensor_1_depth: float | None
     sensor_2_temp: float | None
     sensor_2_depth: float | None
     sensor_3_temp: float | None
@@ -71,12 +80,50 @@ class MultiSensorTimeSeriesAverageData(BaseModelConfig):
     sensor_15_temp: float | None
     sensor_15_depth: float | None
 
+    class Config:
+        # Cables with more than 15 sensors keep their sensor_n_temp/depth keys instead of having them dropped
+        extra = "allow"
+
+
+class SensorTimeSeriesMatrix(BaseModelConfig):
+    dates: list[dt.datetime]
+    sensor_numbers: list[int]
+    depths: list[float | None]
+    temperatures: list[list[float | None]]
+
 
 class SingleSensorTimeSeriesAverageData(BaseModelConfig):
     date: dt.datetime
     temperature: float
 
 
+class TrumpetCurveData(BaseModelConfig):
+    year: int
+    sensor_number: int
+    depth: float
+    temperature_min: float
+    temperature_max: float
+    temperature_mean: float
+    coverage: float
+    count: int
+
+
+class TemperaturePressureDataOutput(BaseModelConfig):
+    date_time: dt.datetime
+    temperature: float
+    pressure: float
+    logger_sn: str
+
+
+class TemperaturePressureAverageData(BaseModelConfig):
+    date: dt.datetime
+    temperature: float
+    pressure: float
+    pressure_min: float
+    pressure_max: float
+    count: int
+
+
 class InstallationLoggerHistory(BaseModelConfig):
     date_time: dt.datetime
     recorded_by: str
@@ -87,6 +134,12 @@ class InstallationLoggerHistory(BaseModelConfig):
     logger_out_type: str | None
     notes: str | None
     stick_up: float | None
+    download_quality: str | None
+    download_count: int | None
+    al_probe_count: int | None
+    al_probe_mean_depth: float | None
+    al_probe_max_depth: float | None
+    al_probes_maxed: int | None
 
 
 class ThawTubeHistory(BaseModelConfig):
@@ -105,6 +158,12 @@ class ThawTubeHistory(BaseModelConfig):
     surface_change: float | None
 
 
+class ThawTubeReport(ThawTubeHistory):
+    installation_code: str
+    installation_name: str
+    region: str
+
+
 class ThawTubeBeadHistory(BaseModelConfig):
     bead_year: int
     bead_colour: str
@@ -165,3 +224,58 @@ class ReadableLoggerDeployments(BaseModelConfig):
     deployment_date: dt.datetime | None
     extraction_date: dt.datetime | None
     deployment_notes: str | None
+
+
+class BulkUploadSummary(BaseModelConfig):
+    received: int
+    inserted: int
+    skipped: int
+    conflicting: int
+    overwritten: int = 0
+    dry_run: bool = False
+    conflict_sample: list[dict] | None = None
+
+
+class DailyRollupRefreshSummary(BaseModelConfig):
+    installation_uid: int | None
+    start: dt.datetime | None
+    end: dt.datetime | None
+    rows_written: int
+    annual_rows_written: int | None = None
+
+
+class WeatherStationFileUploadSummary(BaseModelConfig):
+    hourly: BulkUploadSummary | None = None
+    daily: BulkUploadSummary | None = None
+    hourly_tbl_good: bool | None = None
+    daily_tbl_good: bool | None = None
+
+
+class WeatherStationDataOutput(BaseModelConfig):
+    date_time: dt.datetime
+    internal_temp_avg: float | None
+    internal_temp_min: float | None
+    internal_temp_max: float | None
+    air_temp_avg: float | None
+    air_temp_max: float | None
+    time_air_temp_max: dt.datetime | None
+    air_temp_min: float | None
+    time_air_temp_min: dt.datetime | None
+    wind_speed_avg: float | None
+    wind_speed_std: float | None
+    wind_speed_max: float | None
+    time_wind_speed_max: dt.datetime | None
+    snow_depth: float | None
+
+
+class WeatherStationAggregateData(BaseModelConfig):
+    date: dt.datetime
+    count: int
+
+    class Config:
+        # One {column}_{statistic} key per requested column and statistic
+        extra = "allow"
+
+
+class IngestionJobStatus(IngestionJob):
+    rows_per_second: float | None
@@ -4,3 +4,4 @@ from .weather_station_schemas import *
 from .cable_schemas import *
 from .air_gs_schemas import *
 from .four_channel_schemas import *
+from .job_schemas import *
@@ -36,6 +36,15 @@ class TemperaturePressureDataBase(BaseModelConfig):
 class TemperaturePressureData(TemperaturePressureDataBase):
     temperature_pressure_data_uid: int
 
+
+class TemperaturePressureDataBatch(BaseModelConfig):
+    logger_uid: int
+    logger_download_uid: int
+    installation_uid: int
+    date_times: list[dt.datetime]
+    temperatures: list[float]
+    pressures: list[float]
+
 """
 class GroundSurfaceTemperatureDataBase(BaseModelConfig):
     logger_uid: int
@@ -33,3 +33,12 @@ class FourChannelDataBase(BaseModelConfig):
 
 class FourChannelData(FourChannelDataBase):
     four_channel_data_uid: int
+
+
+class FourChannelDataInput(BaseModelConfig):
+    logger_uid: int
+    logger_download_uid: int
+    installation_uid: int
+    channel_number: int
+    date_time: dt.datetime
+    temperature: float
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+*DESCRIPTION*
+
+Author: rparker
+Created: 2026-10-18
+"""
+
+import datetime as dt
+
+from .base_model import BaseModelConfig
+
+
+class IngestionJobBase(BaseModelConfig):
+    job_type: str
+    description: str | None
+
+
+class IngestionJob(IngestionJobBase):
+    ingestion_job_uid: int
+    status: str
+    submitted_at: dt.datetime
+    started_at: dt.datetime | None
+    finished_at: dt.datetime | None
+    percent_complete: float
+    rows_received: int
+    rows_inserted: int
+    rows_skipped: int
+    rows_conflicting: int
+    rows_overwritten: int
+    cancel_requested: bool
+    message: str | None